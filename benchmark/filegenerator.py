@@ -0,0 +1,82 @@
+
+# -*- coding: utf-8 -*-
+
+""" 效能測試用的檔案產生器，預設在 tmpfs (/dev/shm) 上建立測試檔案以排除磁碟 I/O 的影響 """
+
+import os
+import shutil
+import tempfile
+
+
+
+_TMPFS_CANDIDATE = ('/dev/shm', '/run/shm',)
+
+
+def make_work_directory(prefix='fwbench-'):
+	""" 建立測試用工作目錄，優先使用 tmpfs
+
+	參數:
+		prefix='fwbench-' - 目錄名稱前綴
+	回傳值:
+		工作目錄絕對路徑
+	"""
+	for base_dir in _TMPFS_CANDIDATE:
+		if os.path.isdir(base_dir) and os.access(base_dir, os.W_OK):
+			return tempfile.mkdtemp(prefix=prefix, dir=base_dir)
+	return tempfile.mkdtemp(prefix=prefix)
+# ### def make_work_directory
+
+
+def remove_work_directory(work_dir):
+	shutil.rmtree(work_dir, True)
+# ### def remove_work_directory
+
+
+def get_entry_filename(entry_index, serial):
+	""" 取得屬於指定監看項目的測試檔名 (對應 get_entry_file_regex() 的規則)
+
+	參數:
+		entry_index - 監看項目序號
+		serial - 檔案序號
+	回傳值:
+		檔案名稱字串
+	"""
+	return "bench%04d_%08d.dat" % (entry_index, serial,)
+# ### def get_entry_filename
+
+
+def get_entry_file_regex(entry_index):
+	return "^bench%04d_[0-9]+\\.dat$" % (entry_index,)
+# ### def get_entry_file_regex
+
+
+def generate_files(target_directory, entry_count, file_count, file_size=4096, folderpath=''):
+	""" 建立測試檔案，檔案依序分配給各個監看項目，每個檔案內容都不相同
+
+	參數:
+		target_directory - 監看目標資料夾
+		entry_count - 監看項目數量
+		file_count - 檔案數量
+		file_size=4096 - 檔案大小 (bytes)
+		folderpath='' - 放置檔案的資料夾 (相對於 target_directory 路徑)
+	回傳值:
+		(filename, folderpath) 形式的 tuple 串列
+	"""
+	folder_abspath = os.path.join(target_directory, folderpath)
+	if not os.path.isdir(folder_abspath):
+		os.makedirs(folder_abspath)
+	filler = 'x' * max(file_size - 32, 0)
+	result = []
+	for serial in xrange(file_count):
+		filename = get_entry_filename(serial % entry_count, serial)
+		fp = open(os.path.join(folder_abspath, filename), 'wb')
+		fp.write("%032d" % (serial,))
+		fp.write(filler)
+		fp.close()
+		result.append((filename, folderpath,))
+	return result
+# ### def generate_files
+
+
+
+# vim: ts=4 sw=4 ai nowrap
@@ -0,0 +1,131 @@
+
+# -*- coding: utf-8 -*-
+
+""" 效能測試用的事件延遲紀錄 (由模擬監視器記錄送出時間，由測試用操作器記錄處理時間) """
+
+import time
+import threading
+
+
+
+_lock = threading.Condition()
+_emit_tstamp = {}
+_latencies = []
+_expect_count = 0
+_first_emit_tstamp = None
+_last_done_tstamp = None
+
+
+def reset(expect_count):
+	""" 清除紀錄並設定預期完成的事件數
+
+	參數:
+		expect_count - 預期完成的事件數
+	回傳值:
+		(無)
+	"""
+	global _emit_tstamp, _latencies, _expect_count, _first_emit_tstamp, _last_done_tstamp
+	with _lock:
+		_emit_tstamp = {}
+		_latencies = []
+		_expect_count = expect_count
+		_first_emit_tstamp = None
+		_last_done_tstamp = None
+# ### def reset
+
+
+def mark_emit(filename):
+	""" 記錄事件送出時間
+
+	參數:
+		filename - 檔案名稱 (每個事件需使用不同的檔案名稱)
+	回傳值:
+		(無)
+	"""
+	global _first_emit_tstamp
+	current_tstamp = time.time()
+	with _lock:
+		_emit_tstamp[filename] = current_tstamp
+		if _first_emit_tstamp is None:
+			_first_emit_tstamp = current_tstamp
+# ### def mark_emit
+
+
+def mark_done(filename):
+	""" 記錄事件到達操作器的時間
+
+	參數:
+		filename - 原始檔案名稱
+	回傳值:
+		(無)
+	"""
+	global _last_done_tstamp
+	current_tstamp = time.time()
+	with _lock:
+		emit_tstamp = _emit_tstamp.pop(filename, None)
+		if emit_tstamp is None:
+			return
+		_latencies.append(current_tstamp - emit_tstamp)
+		_last_done_tstamp = current_tstamp
+		if len(_latencies) >= _expect_count:
+			_lock.notify_all()
+# ### def mark_done
+
+
+def wait_done(timeout):
+	""" 等待所有預期的事件完成
+
+	參數:
+		timeout - 最長等待時間 (秒)
+	回傳值:
+		True - 所有事件已完成
+		False - 逾時
+	"""
+	deadline = time.time() + timeout
+	with _lock:
+		while len(_latencies) < _expect_count:
+			remain_second = deadline - time.time()
+			if remain_second <= 0:
+				return False
+			_lock.wait(min(remain_second, 1.0))
+	return True
+# ### def wait_done
+
+
+def _percentile(sorted_values, ratio):
+	if len(sorted_values) < 1:
+		return None
+	idx = min(int(len(sorted_values) * ratio), len(sorted_values) - 1)
+	return sorted_values[idx]
+# ### def _percentile
+
+
+def summarize():
+	""" 計算吞吐量與延遲分佈
+
+	參數:
+		(無)
+	回傳值:
+		含有 completed, missing, throughput (事件/秒), p50, p99, max (秒) 的字典
+	"""
+	with _lock:
+		latencies = sorted(_latencies)
+		missing = len(_emit_tstamp)
+		first_emit_tstamp = _first_emit_tstamp
+		last_done_tstamp = _last_done_tstamp
+	throughput = None
+	if (first_emit_tstamp is not None) and (last_done_tstamp is not None) and (last_done_tstamp > first_emit_tstamp):
+		throughput = len(latencies) / (last_done_tstamp - first_emit_tstamp)
+	return {
+		'completed': len(latencies),
+		'missing': missing,
+		'throughput': throughput,
+		'p50': _percentile(latencies, 0.50),
+		'p99': _percentile(latencies, 0.99),
+		'max': (latencies[-1] if (len(latencies) > 0) else None),
+	}
+# ### def summarize
+
+
+
+# vim: ts=4 sw=4 ai nowrap
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+""" 監看引擎端對端效能測試
+
+以模擬監視器送出事件，經過監看引擎 (比對監看項目、重複檢查、唯一檔名更名、派送) 後由測試用操作器記錄到達時間，
+回報吞吐量 (事件/秒) 與派送延遲 p50/p99。
+
+使用方式: python benchmark/run_benchmark.py [-n EVENT_COUNT] [--entries 1,16,128] [--dupcheck off,on] ...
+"""
+
+import os
+import sys
+import time
+import optparse
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from filewatcher import watcher
+
+import filegenerator
+import latencyrecorder
+import synthetic_monitor
+import noop_operator
+import sleep_operator
+
+
+
+_BURSTINESS = {
+	'steady': (1, 0.0,),
+	'burst': (200, 0.05,),
+}
+
+
+def _split_option_list(v):
+	return [x.strip() for x in v.split(',') if x.strip()]
+# ### def _split_option_list
+
+
+def _to_switch_list(v):
+	return [(x.lower() in ('on', 'yes', 'true', '1',)) for x in _split_option_list(v)]
+# ### def _to_switch_list
+
+
+def _write_config(work_dir, target_directory, entry_count, do_dupcheck, use_uniqname, options):
+	""" 產生監看引擎設定檔
+
+	參數:
+		work_dir - 工作目錄
+		target_directory - 監看目標資料夾
+		entry_count - 監看項目數量
+		do_dupcheck - 是否啟用重複檢查
+		use_uniqname - 是否以唯一檔名處理檔案
+		options - 命令列選項
+	回傳值:
+		設定檔路徑
+	"""
+	if options.sleep_second > 0:
+		operation_line = "      - bench_sleep: %r\n" % (options.sleep_second,)
+	else:
+		operation_line = "      - bench_noop: yes\n"
+	l = []
+	l.append("target_directory: %s\n" % (target_directory,))
+	l.append("recursive_watch: yes\n")
+	l.append("meta:\n  db_path: %s\n" % (os.path.join(work_dir, 'meta.sqlite'),))
+	l.append("engine:\n")
+	l.append("  dispatch_workers: %d\n" % (options.dispatch_workers,))
+	l.append("  coalesce_window: %r\n" % (options.coalesce_window,))
+	l.append("  parallel_operation_workers: %d\n" % (options.operation_workers,))
+	l.append("synthetic-monitor: {}\n")
+	l.append("watching_entries:\n")
+	for entry_index in xrange(entry_count):
+		l.append("  - file_regex: %s\n" % (filegenerator.get_entry_file_regex(entry_index),))
+		l.append("    duplicate_check: %s\n" % ('Yes' if do_dupcheck else 'No',))
+		l.append("    process_as_uniqname: %s\n" % ('Yes' if use_uniqname else 'No',))
+		l.append("    operation:\n")
+		l.append(operation_line)
+	config_path = os.path.join(work_dir, 'bench.yaml')
+	fp = open(config_path, 'w')
+	fp.write(''.join(l))
+	fp.close()
+	return config_path
+# ### def _write_config
+
+
+def run_case(entry_count, do_dupcheck, use_uniqname, burstiness, options):
+	""" 執行一個測試案例
+
+	參數:
+		entry_count - 監看項目數量
+		do_dupcheck - 是否啟用重複檢查
+		use_uniqname - 是否以唯一檔名處理檔案
+		burstiness - 事件送出型態 (_BURSTINESS 的鍵)
+		options - 命令列選項
+	回傳值:
+		latencyrecorder.summarize() 的結果
+	"""
+	work_dir = filegenerator.make_work_directory()
+	try:
+		target_directory = os.path.join(work_dir, 'target')
+		os.mkdir(target_directory)
+		files = filegenerator.generate_files(target_directory, entry_count, options.event_count, options.file_size)
+		config_path = _write_config(work_dir, target_directory, entry_count, do_dupcheck, use_uniqname, options)
+
+		burst_size, burst_interval, = _BURSTINESS[burstiness]
+		synthetic_monitor.set_event_stream([(filename, folderpath, watcher.FEVENT_NEW,) for filename, folderpath, in files], burst_size, burst_interval)
+		latencyrecorder.reset(len(files))
+
+		stdout_orig = sys.stdout
+		sys.stdout = open(os.devnull, 'w')	# 監看引擎會為每個事件輸出除錯訊息
+		try:
+			w_engine = watcher.get_watcherengine(config_path, (synthetic_monitor, noop_operator, sleep_operator,))
+			w_engine.activate()
+			latencyrecorder.wait_done(options.timeout)
+			w_engine.deactivate()
+			if w_engine.metadb is not None:
+				w_engine.metadb.close()
+		finally:
+			sys.stdout.close()
+			sys.stdout = stdout_orig
+		return latencyrecorder.summarize()
+	finally:
+		filegenerator.remove_work_directory(work_dir)
+# ### def run_case
+
+
+def _format_second(v):
+	if v is None:
+		return '-'
+	return "%.3fms" % (v * 1000.0,)
+# ### def _format_second
+
+
+def main():
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option('-n', '--events', dest='event_count', type='int', default=2000, help="number of events per case")
+	parser.add_option('--entries', dest='entries', default='1,16,128', help="comma separated watch entry counts")
+	parser.add_option('--dupcheck', dest='dupcheck', default='off,on', help="comma separated on/off")
+	parser.add_option('--uniqname', dest='uniqname', default='off,on', help="comma separated on/off")
+	parser.add_option('--burstiness', dest='burstiness', default='steady,burst', help="comma separated of: %s" % (', '.join(sorted(_BURSTINESS.keys())),))
+	parser.add_option('--file-size', dest='file_size', type='int', default=4096, help="size of generated files in bytes")
+	parser.add_option('--sleep', dest='sleep_second', type='float', default=0.0, help="use sleeping stub operator with given seconds instead of no-op")
+	parser.add_option('--dispatch-workers', dest='dispatch_workers', type='int', default=0)
+	parser.add_option('--coalesce-window', dest='coalesce_window', type='float', default=0.0)
+	parser.add_option('--operation-workers', dest='operation_workers', type='int', default=0)
+	parser.add_option('--timeout', dest='timeout', type='float', default=300.0, help="maximum seconds to wait for each case")
+	options, _args, = parser.parse_args()
+
+	for burstiness in _split_option_list(options.burstiness):
+		if burstiness not in _BURSTINESS:
+			parser.error("unknown burstiness: %r" % (burstiness,))
+
+	print "%8s %8s %8s %8s %10s %10s %12s %12s %12s" % ('entries', 'dupcheck', 'uniqname', 'burst', 'completed', 'missing', 'events/sec', 'p50', 'p99',)
+	for entry_count, do_dupcheck, use_uniqname, burstiness, in itertools.product(
+			[int(x) for x in _split_option_list(options.entries)],
+			_to_switch_list(options.dupcheck),
+			_to_switch_list(options.uniqname),
+			_split_option_list(options.burstiness)):
+		r = run_case(entry_count, do_dupcheck, use_uniqname, burstiness, options)
+		throughput = ('-' if (r['throughput'] is None) else ("%.1f" % (r['throughput'],)))
+		print "%8d %8s %8s %8s %10d %10d %12s %12s %12s" % (entry_count, ('on' if do_dupcheck else 'off'), ('on' if use_uniqname else 'off'), burstiness, r['completed'], r['missing'], throughput, _format_second(r['p50']), _format_second(r['p99']),)
+		sys.stdout.flush()
+# ### def main
+
+
+
+if __name__ == "__main__":
+	main()
+# <<< if __name__ == "__main__":
+
+
+
+# vim: ts=4 sw=4 ai nowrap
@@ -0,0 +1,88 @@
+
+# -*- coding: utf-8 -*-
+
+""" 效能測試用的操作模組，以暫停指定時間模擬耗時的操作 """
+
+import time
+
+from filewatcher import componentprop
+
+import latencyrecorder
+
+
+
+_cached_module_prop_instance = componentprop.OperatorProp('bench-sleep', 'bench_sleep', schedule_priority=None, run_priority=2)
+def get_module_prop():
+	""" 取得操作器各項特性/屬性
+
+	參數:
+		(無)
+	回傳值:
+		傳回 componentprop.OperatorProp 物件
+	"""
+	return _cached_module_prop_instance
+# ### def get_module_prop
+
+
+def operator_configure(config, metastorage):
+	""" 設定操作器組態
+
+	參數:
+		config - 帶有參數的字典
+		metastorage - 中介資訊資料庫物件
+	回傳值:
+		(無)
+	"""
+	pass
+# ### def operator_configure
+
+
+def read_operation_argv(argv):
+	""" 取得操作設定
+
+	參數:
+		argv - 設定檔中的設定: 暫停時間 (秒)
+
+	回傳值:
+		暫停時間 (秒)，設定值無法解讀時傳回 None
+	"""
+	try:
+		return max(float(argv), 0.0)
+	except (TypeError, ValueError):
+		return None
+# ### read_operation_argv
+
+
+def perform_operation(current_filepath, orig_filename, argv, oprexec_ref, logqueue=None):
+	""" 暫停指定時間後記錄事件完成時間
+
+	參數:
+		current_filepath - 目標檔案絕對路徑 (如果是第一個操作，可能檔案名稱會是更改過的)
+		orig_filename - 原始檔案名稱 (不含路徑)
+		argv - 設定檔給定的操作參數 (暫停時間)
+		oprexec_ref - 作業參考物件 (含: 檔案名稱與路徑名稱比對結果、檔案內容數位簽章... etc)
+		logqueue - 紀錄訊息串列物件
+	回傳值:
+		經過操作後的檔案絕對路徑
+	"""
+	if argv > 0:
+		time.sleep(argv)
+	latencyrecorder.mark_done(orig_filename)
+	return current_filepath
+# ### def perform_operation
+
+
+def operator_stop():
+	""" 停止作業，準備結束
+
+	參數:
+		(無)
+	回傳值:
+		(無)
+	"""
+	pass
+# ### def operator_stop
+
+
+
+# vim: ts=4 sw=4 ai nowrap
@@ -0,0 +1,112 @@
+
+# -*- coding: utf-8 -*-
+
+""" 效能測試用的模擬監視模組，依設定的事件串流送出事件而不監看檔案系統 """
+
+import time
+import syslog
+import threading
+
+from filewatcher import componentprop
+
+import latencyrecorder
+
+
+
+_event_stream = []
+_burst_size = 1
+_burst_interval = 0.0
+
+_emitter = None
+
+
+_cached_module_prop_instance = componentprop.MonitorProp('synthetic-monitor')
+def get_module_prop():
+	""" 取得監視器各項特性/屬性
+
+	參數:
+		(無)
+	回傳值:
+		傳回 componentprop.MonitorProp 物件
+	"""
+	return _cached_module_prop_instance
+# ### def get_module_prop
+
+
+def set_event_stream(event_stream, burst_size=1, burst_interval=0.0):
+	""" 設定要送出的事件串流
+
+	參數:
+		event_stream - (filename, folderpath, event_type) 形式的 tuple 串列，每個事件需使用不同的檔案名稱
+		burst_size=1 - 每次連續送出的事件數
+		burst_interval=0.0 - 每次連續送出後暫停的時間 (秒)，0 表示不暫停
+	回傳值:
+		(無)
+	"""
+	global _event_stream, _burst_size, _burst_interval
+	_event_stream = event_stream
+	_burst_size = max(int(burst_size), 1)
+	_burst_interval = max(float(burst_interval), 0.0)
+# ### def set_event_stream
+
+
+def monitor_configure(config, metastorage):
+	""" 設定監視器組態
+
+	參數:
+		config - 帶有參數的字典
+		metastorage - 中介資訊資料庫物件
+	回傳值:
+		(無)
+	"""
+	pass
+# ### def monitor_configure
+
+
+def _emit_events(watcher_instance, event_stream, burst_size, burst_interval):
+	emitted_in_burst = 0
+	for filename, folderpath, event_type, in event_stream:
+		latencyrecorder.mark_emit(filename)
+		watcher_instance.discover_file_change(filename, folderpath, event_type)
+		emitted_in_burst = emitted_in_burst + 1
+		if (emitted_in_burst >= burst_size) and (burst_interval > 0):
+			time.sleep(burst_interval)
+			emitted_in_burst = 0
+	syslog.syslog(syslog.LOG_INFO, "synthetic monitor emitted %d events" % (len(event_stream),))
+# ### def _emit_events
+
+
+def monitor_start(watcher_instance, target_directory, recursive_watch=False):
+	""" 開始送出事件
+
+	參數:
+		watcher_instance - watcher.WatcherEngine 物件實體
+		target_directory - 監測目標資料夾
+		recursive_watch - 是否要遞迴監測子資料夾
+	回傳值:
+		(無)
+	"""
+	global _emitter
+	_emitter = threading.Thread(target=_emit_events, args=(watcher_instance, _event_stream, _burst_size, _burst_interval,))
+	_emitter.daemon = True
+	_emitter.start()
+# ### def monitor_start
+
+
+def monitor_stop():
+	""" 等待事件送出完畢
+
+	參數:
+		(無)
+	回傳值:
+		(無)
+	"""
+	global _emitter
+	if _emitter is not None:
+		_emitter.join()
+		_emitter = None
+# ### def monitor_stop
+
+
+
+# vim: ts=4 sw=4 ai nowrap
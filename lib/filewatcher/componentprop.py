@@ -39,7 +39,7 @@ class MonitorProp(ModuleProp):
 class OperatorProp(ModuleProp):
 	""" 操作器工作模組屬性 """
 
-	def __init__(self, module_name, operation_name, schedule_priority=None, run_priority=None, handle_dismiss=False):
+	def __init__(self, module_name, operation_name, schedule_priority=None, run_priority=None, handle_dismiss=False, consume_file=False):
 		""" 建構子
 
 		參數:
@@ -48,6 +48,7 @@ class OperatorProp(ModuleProp):
 			schedule_priority - 操作塊排程優先順序，數字小的先執行 (若操作不影響排程或是不受排程影響，則設定為 None)
 			run_priority - 執行優先順序，數字小的先執行
 			handle_dismiss - 處理檔案刪除移出事件
+			consume_file - 操作後原檔案是否不再存在 (例如移動檔案)，含有這類操作的作業塊不能與其他作業塊同時執行
 		"""
 		super(OperatorProp, self).__init__(module_name, isOperator=True)
 
@@ -55,6 +56,7 @@ class OperatorProp(ModuleProp):
 		self.schedule_priority = schedule_priority
 		self.run_priority = run_priority
 		self.handle_dismiss = handle_dismiss
+		self.consume_file = consume_file
 	# ### def __init__
 # ### class OperatorProp
 
@@ -0,0 +1,341 @@
+
+# -*- coding: utf-8 -*-
+
+""" 監視模組與監看引擎之間的事件合併與派送佇列 """
+
+import time
+import heapq
+import syslog
+import threading
+import Queue
+
+
+
+_DROP_LOG_EVERY = 1000	# 每丟棄多少事件記錄一次紀錄訊息
+
+# 與 watcher 模組的 FEVENT_* 定義相同 (watcher 模組引用本模組，這裡不能反向引用)
+_FEVENT_NEW = 1
+_FEVENT_DELETED = 4
+
+
+def _dispatch_worker(worker_id, q, handler, dispatcher):
+	running = True
+	while running:
+		ev = q.get(True)
+		try:
+			if ev is not None:
+				handler(*ev)
+				dispatcher._count_processed()
+			else:
+				syslog.syslog(syslog.LOG_DEBUG, "dispatch-worker exiting (ID=%d)" % (worker_id,))
+				running = False
+		finally:
+			q.task_done()
+# ### def _dispatch_worker
+
+
+class EventDispatcher(object):
+	""" 有容量上限的事件佇列，由多個派送 worker 取出事件交給監看引擎處理
+
+	同一個路徑 (資料夾與檔名) 的事件一律送進同一個 worker 的佇列，以保持事件的先後順序。
+	"""
+
+	def __init__(self, handler, worker_count, queue_size, block_on_overflow=False):
+		""" 建構子
+
+		參數:
+			handler - 處理事件的函式，函數原型: (filename, folderpath, event_type)
+			worker_count - 派送 worker 數量
+			queue_size - 佇列容量 (所有 worker 佇列的總和)
+			block_on_overflow - 佇列已滿時是否等待 (True) 或是丟棄事件 (False)
+		"""
+		super(EventDispatcher, self).__init__()
+
+		self.handler = handler
+		self.worker_count = max(int(worker_count), 1)
+		self.queue_size = max(int(queue_size), self.worker_count)
+		self.block_on_overflow = block_on_overflow
+
+		per_queue_size = max(self.queue_size / self.worker_count, 1)
+		self.event_queues = [Queue.Queue(per_queue_size) for _idx in range(self.worker_count)]
+		self.workers = None
+
+		self._counter_lock = threading.Lock()
+		self.enqueued_count = 0
+		self.processed_count = 0
+		self.overflow_count = 0
+		self.dropped_count = 0
+	# ### def __init__
+
+	def start(self):
+		""" 啟動派送 worker
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		workers_q = []
+		for idx, q, in enumerate(self.event_queues):
+			wk = threading.Thread(target=_dispatch_worker, args=(idx, q, self.handler, self,))
+			wk.daemon = True
+			wk.start()
+			workers_q.append(wk)
+		self.workers = workers_q
+		syslog.syslog(syslog.LOG_INFO, "started event dispatcher (workers=%d, queue-size=%d, block-on-overflow=%r)" % (self.worker_count, self.queue_size, self.block_on_overflow,))
+	# ### def start
+
+	def _count_processed(self):
+		with self._counter_lock:
+			self.processed_count = self.processed_count + 1
+	# ### def _count_processed
+
+	def dispatch(self, filename, folderpath, event_type):
+		""" 將事件放入佇列
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+			event_type - 事件型別
+		回傳值:
+			True - 已放入佇列
+			False - 佇列已滿，事件被丟棄
+		"""
+		q = self.event_queues[hash((folderpath, filename,)) % self.worker_count]
+		ev = (filename, folderpath, event_type,)
+		try:
+			q.put(ev, False)
+		except Queue.Full:
+			with self._counter_lock:
+				self.overflow_count = self.overflow_count + 1
+			if not self.block_on_overflow:
+				with self._counter_lock:
+					self.dropped_count = self.dropped_count + 1
+					dropped_count = self.dropped_count
+				if 1 == (dropped_count % _DROP_LOG_EVERY):
+					syslog.syslog(syslog.LOG_WARNING, "dispatch queue full, dropped event: [%s/%s] (dropped=%d)" % (folderpath, filename, dropped_count,))
+				return False
+			q.put(ev, True)
+		with self._counter_lock:
+			self.enqueued_count = self.enqueued_count + 1
+		return True
+	# ### def dispatch
+
+	def stop(self):
+		""" 處理完佇列中的事件後停下派送 worker
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		if self.workers is None:
+			return
+		for q in self.event_queues:
+			q.put(None, True)
+		for wk in self.workers:
+			wk.join()
+		self.workers = None
+		syslog.syslog(syslog.LOG_INFO, "stopped event dispatcher")
+	# ### def stop
+
+	def get_stats(self):
+		""" 取得佇列深度與計數器
+
+		參數: (無)
+		回傳值:
+			含有各項計數的字典
+		"""
+		queue_depths = [q.qsize() for q in self.event_queues]
+		with self._counter_lock:
+			return {
+				'queue_depth': sum(queue_depths),
+				'queue_depth_per_worker': queue_depths,
+				'queue_size': self.queue_size,
+				'worker_count': self.worker_count,
+				'enqueued': self.enqueued_count,
+				'processed': self.processed_count,
+				'overflow': self.overflow_count,
+				'dropped': self.dropped_count,
+			}
+	# ### def get_stats
+# ### class EventDispatcher
+
+
+def _merge_coalesced_event_type(pending_event_type, event_type):
+	""" 合併同一路徑先後發生的兩個事件
+
+	參數:
+		pending_event_type - 尚未送出的事件型別
+		event_type - 新收到的事件型別
+	回傳值:
+		合併後的事件型別，兩個事件互相抵銷時傳回 None
+	"""
+	if _FEVENT_DELETED == event_type:
+		if _FEVENT_DELETED != pending_event_type:
+			return None	# 刪除事件取消尚未送出的新增或修改事件，監看引擎沒看過這個檔案，兩個事件都不送出
+		return _FEVENT_DELETED
+	if _FEVENT_NEW == pending_event_type:
+		return _FEVENT_NEW	# 新檔案在送出前又被修改，仍視為新檔案
+	return event_type
+# ### def _merge_coalesced_event_type
+
+
+class EventCoalescer(object):
+	""" 將同一路徑 (資料夾與檔名) 在靜默時間內連續發生的事件合併為一個最終事件再送出 """
+
+	def __init__(self, deliver, quiet_window, max_delay=None):
+		""" 建構子
+
+		參數:
+			deliver - 送出合併後事件的函式，函數原型: (filename, folderpath, event_type)
+			quiet_window - 靜默時間 (秒)，路徑在這段時間內沒有新事件才送出
+			max_delay - 事件最長延遲時間 (秒)，持續有新事件的路徑最晚在這個時間後送出，None 表示為靜默時間的 10 倍
+		"""
+		super(EventCoalescer, self).__init__()
+
+		self.deliver = deliver
+		self.quiet_window = float(quiet_window)
+		self.max_delay = (self.quiet_window * 10) if (max_delay is None) else max(float(max_delay), self.quiet_window)
+
+		self._cond = threading.Condition()
+		self._pending = {}	# (folderpath, filename) -> [event_type, first_tstamp, deadline]
+		self._deadline_heap = []
+		self._running = False
+		self._worker = None
+
+		self.received_count = 0
+		self.released_count = 0
+		self.coalesced_count = 0	# 被合併而沒有單獨送出的事件數 (received = released + coalesced + pending)
+		self.cancelled_count = 0	# 被刪除事件取消的新增或修改事件數
+	# ### def __init__
+
+	def start(self):
+		""" 啟動送出事件的 worker
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		self._running = True
+		self._worker = threading.Thread(target=self._release_worker)
+		self._worker.daemon = True
+		self._worker.start()
+		syslog.syslog(syslog.LOG_INFO, "started event coalescer (quiet-window=%r, max-delay=%r)" % (self.quiet_window, self.max_delay,))
+	# ### def start
+
+	def push(self, filename, folderpath, event_type):
+		""" 收進事件，若同一路徑已有尚未送出的事件則合併
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+			event_type - 事件型別
+		回傳值:
+			(無)
+		"""
+		k = (folderpath, filename,)
+		current_tstamp = time.time()
+		with self._cond:
+			self.received_count = self.received_count + 1
+			pending = self._pending.get(k)
+			if pending is None:
+				deadline = current_tstamp + self.quiet_window
+				self._pending[k] = [event_type, current_tstamp, deadline]
+			else:
+				merged_event_type = _merge_coalesced_event_type(pending[0], event_type)
+				if merged_event_type is None:	# 尚未送出的事件與刪除事件一起捨棄，堆積中的舊時限在取出時略過
+					del self._pending[k]
+					self.coalesced_count = self.coalesced_count + 2
+					self.cancelled_count = self.cancelled_count + 1
+					return
+				self.coalesced_count = self.coalesced_count + 1
+				pending[0] = merged_event_type
+				deadline = min(current_tstamp + self.quiet_window, pending[1] + self.max_delay)
+				pending[2] = deadline
+			heapq.heappush(self._deadline_heap, (deadline, k,))
+			self._cond.notify()
+	# ### def push
+
+	def _pop_ready_events(self, current_tstamp):
+		""" (需在持有 lock 時呼叫) 取出已到期的事件
+
+		參數:
+			current_tstamp - 目前時戳
+		回傳值:
+			(filename, folderpath, event_type) 形式的 tuple 串列
+		"""
+		ready = []
+		while (len(self._deadline_heap) > 0) and (self._deadline_heap[0][0] <= current_tstamp):
+			deadline, k, = heapq.heappop(self._deadline_heap)
+			pending = self._pending.get(k)
+			if (pending is None) or (pending[2] != deadline):	# 已被合併延後的舊時限
+				continue
+			del self._pending[k]
+			ready.append((k[1], k[0], pending[0],))
+		self.released_count = self.released_count + len(ready)
+		return ready
+	# ### def _pop_ready_events
+
+	def _release_worker(self):
+		running = True
+		while running:
+			with self._cond:
+				if len(self._deadline_heap) > 0:
+					wait_second = self._deadline_heap[0][0] - time.time()
+					if wait_second > 0:
+						self._cond.wait(wait_second)
+				elif self._running:
+					self._cond.wait()
+				if self._running:
+					ready = self._pop_ready_events(time.time())
+				else:
+					ready = self._pop_ready_events(float('inf'))
+					running = False
+			for filename, folderpath, event_type, in ready:
+				self.deliver(filename, folderpath, event_type)
+	# ### def _release_worker
+
+	def stop(self):
+		""" 立即送出所有尚未送出的事件，並停下 worker
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		if self._worker is None:
+			return
+		with self._cond:
+			self._running = False
+			self._cond.notify()
+		self._worker.join()
+		self._worker = None
+		syslog.syslog(syslog.LOG_INFO, "stopped event coalescer (%s)" % (self.format_stats(),))
+	# ### def stop
+
+	def get_stats(self):
+		""" 取得合併事件計數
+
+		參數: (無)
+		回傳值:
+			含有各項計數的字典
+		"""
+		with self._cond:
+			return {
+				'pending': len(self._pending),
+				'received': self.received_count,
+				'released': self.released_count,
+				'coalesced': self.coalesced_count,
+				'cancelled': self.cancelled_count,
+			}
+	# ### def get_stats
+
+	def format_stats(self):
+		""" 將合併事件計數轉為記錄用字串
+
+		參數: (無)
+		回傳值:
+			字串
+		"""
+		st = self.get_stats()
+		return "pending=%d, received=%d, released=%d, coalesced=%d, cancelled=%d" % (st['pending'], st['received'], st['released'], st['coalesced'], st['cancelled'],)
+	# ### def format_stats
+# ### class EventCoalescer
+
+
+
+# vim: ts=4 sw=4 ai nowrap
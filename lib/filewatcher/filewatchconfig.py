@@ -5,17 +5,62 @@
 
 import os
 import re
+import sre_parse
+import sre_constants
 import time
 import datetime
+import collections
+import threading
 import yaml
 
 from filewatcher import metadatum
 
 
+class EngineConfiguration(object):
+	""" 監看引擎運作參數 """
+
+	def __init__(self, dispatch_worker_count=0, dispatch_queue_size=4096, dispatch_block_on_overflow=True, coalesce_window=0, coalesce_max_delay=None, operation_worker_count=0, process_driver='asyncore', stats_report_interval=600, stats_socket_path=None, signature_worker_count=0, signature_inflight_bytes=268435456):
+		""" 建構子
+
+		參數:
+			dispatch_worker_count - 派送 worker 數量，設為 0 表示直接在監視模組的呼叫中處理事件
+			dispatch_queue_size - 事件派送佇列容量
+			dispatch_block_on_overflow - 派送佇列已滿時是否等待 (True) 或丟棄事件 (False)
+			coalesce_window - 合併同一路徑事件的靜默時間 (秒)，設為 0 表示不合併
+			coalesce_max_delay - 合併事件的最長延遲時間 (秒)，None 表示為靜默時間的 10 倍
+			operation_worker_count - 同時執行作業塊用的 worker 數量，設為 0 表示依序執行各作業塊
+			process_driver - 主迴圈實作 ('asyncore' 或 'epoll')
+			stats_report_interval - 記錄各階段處理耗時統計的間隔 (秒)，設為 0 表示不記錄
+			stats_socket_path - 提供即時量測值的 Unix socket 路徑，None 表示不提供
+			signature_worker_count - 計算重複檢查用檔案簽章的 worker 數量，設為 0 表示在處理事件的執行緒中計算
+			signature_inflight_bytes - 已送入簽章 worker 但尚未算完的檔案總大小上限 (bytes)
+		"""
+		super(EngineConfiguration, self).__init__()
+
+		self.dispatch_worker_count = dispatch_worker_count
+		self.dispatch_queue_size = dispatch_queue_size
+		self.dispatch_block_on_overflow = dispatch_block_on_overflow
+
+		self.coalesce_window = coalesce_window
+		self.coalesce_max_delay = coalesce_max_delay
+
+		self.operation_worker_count = operation_worker_count
+
+		self.process_driver = process_driver
+
+		self.stats_report_interval = stats_report_interval
+		self.stats_socket_path = stats_socket_path
+
+		self.signature_worker_count = signature_worker_count
+		self.signature_inflight_bytes = signature_inflight_bytes
+	# ### def __init__
+# ### class EngineConfiguration
+
+
 class WatcherConfiguration(object):
 	""" global configuration """
 
-	def __init__(self, target_directory, recursive_watch, remove_unoperate_file, meta_db_path, meta_reserve_day_duplicatecheck, meta_reserve_day_missingcheck):
+	def __init__(self, target_directory, recursive_watch, remove_unoperate_file, meta_db_path, meta_reserve_day_duplicatecheck, meta_reserve_day_missingcheck, engine_config=None, signature_engine=None, signature_cache_size=0, dupcheck_prefilter=False, commit_policy=None, meta_backend='sqlite', meta_snapshot_interval=300, meta_snapshot_path=None):
 		""" 建構子
 
 		參數:
@@ -25,9 +70,19 @@ class WatcherConfiguration(object):
 			meta_db_path - Meta 資料庫檔案路徑
 			meta_reserve_day_duplicatecheck - 重複檔案檢查資訊留存天數
 			meta_reserve_day_missingcheck - 已刪除檔案檢查資訊留存天數
+			engine_config - 監看引擎運作參數 (EngineConfiguration 物件，None 表示使用預設值)
+			signature_engine - 計算檔案簽章用的 metadatum.SignatureEngine 物件，None 表示使用 md5
+			signature_cache_size - 檔案簽章快取容量 (筆)，0 表示不使用快取
+			dupcheck_prefilter - 重複檢查是否先以檔案大小與取樣簽章篩選 (啟用時只有篩選出相符紀錄或已有現成簽章的檔案才有完整簽章，其餘作業的 digisig 為 None)
+			commit_policy - Meta 資料庫日誌模式與交易提交方式 (metadatum.CommitPolicy 物件)，None 表示每次寫入都提交
+			meta_backend - Meta 資料庫實作 ('sqlite' 或 'memory')
+			meta_snapshot_interval - 記憶體 Meta 資料庫寫入快照的間隔 (秒)
+			meta_snapshot_path - 記憶體 Meta 資料庫快照檔案路徑，None 表示 meta_db_path 加上 .snapshot
 		"""
 		super(WatcherConfiguration, self).__init__()
 
+		self.engine_config = EngineConfiguration() if (engine_config is None) else engine_config
+
 		self.target_directory = target_directory
 		self.recursive_watch = recursive_watch
 		self.remove_unoperate_file = remove_unoperate_file
@@ -35,6 +90,13 @@ class WatcherConfiguration(object):
 		self.meta_db_path = meta_db_path
 		self.meta_reserve_day_duplicatecheck = meta_reserve_day_duplicatecheck
 		self.meta_reserve_day_missingcheck = meta_reserve_day_missingcheck
+		self.signature_engine = signature_engine
+		self.signature_cache_size = signature_cache_size
+		self.dupcheck_prefilter = dupcheck_prefilter
+		self.commit_policy = commit_policy
+		self.meta_backend = meta_backend
+		self.meta_snapshot_interval = meta_snapshot_interval
+		self.meta_snapshot_path = meta_snapshot_path
 
 		self.metadb = None
 		self._setup_meta_db()
@@ -44,7 +106,7 @@ class WatcherConfiguration(object):
 		""" 當指定了 Meta 資料庫檔案路徑時，建立 Meta 資料庫物件 """
 
 		if self.meta_db_path is not None:
-			self.metadb = metadatum.MetaStorage(self.meta_db_path, self.meta_reserve_day_duplicatecheck, self.meta_reserve_day_missingcheck)
+			self.metadb = metadatum.create_meta_storage(self.meta_backend, self.meta_db_path, self.meta_reserve_day_duplicatecheck, self.meta_reserve_day_missingcheck, self.signature_engine, self.signature_cache_size, self.dupcheck_prefilter, self.commit_policy, self.meta_snapshot_interval, self.meta_snapshot_path)
 	# ### def _setup_meta_db
 # ### class WatcherConfiguration
 
@@ -106,6 +168,348 @@ class MonitorEntry(object):
 
 
 
+_INDEX_PREFIX_MAXLEN = 32	# 字首索引鍵的最大長度
+_COMBINED_MATCHER_CHUNK_SIZE = 32	# 每個合併比對器最多包含的規則數
+_COMBINED_MATCHER_MAX_GROUPS = 99	# 每個合併比對器最多包含的群組數 (Python 2 的 re 模組限制為 100 個)
+_FOLDER_CACHE_SIZE = 1024	# 路徑候選規則快取的預設容量
+
+def _walk_regex_tree_has_groupref(node):
+	""" 檢查 sre_parse 解析結果中是否含有群組參照 (backreference)
+
+	參數:
+		node - sre_parse 解析結果節點
+	回傳值:
+		True - 含有群組參照
+		False - 否
+	"""
+	if isinstance(node, sre_parse.SubPattern):
+		node = node.data
+	if isinstance(node, (list, tuple,)):
+		for v in node:
+			if v in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS,):
+				return True
+			if isinstance(v, (list, tuple, sre_parse.SubPattern,)) and _walk_regex_tree_has_groupref(v):
+				return True
+	return False
+# ### def _walk_regex_tree_has_groupref
+
+def _collect_regex_literal_run(items):
+	""" 由 sre_parse 解析結果項目串列的開頭取出連續的字面字元
+
+	參數:
+		items - (op, av) 形式的項目串列
+	回傳值:
+		字面字串
+	"""
+	r = []
+	for op, av, in items:
+		if (sre_constants.LITERAL != op) or (av > 127):
+			break
+		r.append(chr(av))
+	return ''.join(r)
+# ### def _collect_regex_literal_run
+
+def _analyze_regex_literal_affix(regex_obj):
+	""" 分析正規表示式，取出吻合字串必定具有的字面字首與字尾
+
+	參數:
+		regex_obj - 編譯過的正規表示式物件
+	回傳值:
+		(prefix, suffix, suffix_strict,) - 字首字串、字尾字串 (沒有時為空字串) 以及字尾是否以 \\Z 錨定
+	"""
+	if 0 != (regex_obj.flags & re.IGNORECASE):
+		return ('', '', False,)
+	try:
+		items = list(sre_parse.parse(regex_obj.pattern, regex_obj.flags))
+	except Exception:
+		return ('', '', False,)
+
+	# {{{ literal prefix
+	idx = 0
+	while (idx < len(items)) and (sre_constants.AT == items[idx][0]) and (items[idx][1] in (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING,)):
+		idx = idx + 1
+	prefix = _collect_regex_literal_run(items[idx:])
+	# }}} literal prefix
+
+	# {{{ literal suffix
+	suffix = ''
+	suffix_strict = False
+	if (len(items) > 0) and (sre_constants.AT == items[-1][0]) and (items[-1][1] in (sre_constants.AT_END, sre_constants.AT_END_STRING,)):
+		suffix_strict = (sre_constants.AT_END_STRING == items[-1][1])
+		rev_items = items[:-1]
+		rev_items.reverse()
+		suffix = _collect_regex_literal_run(rev_items)[::-1]
+	# }}} literal suffix
+
+	return (prefix, suffix, suffix_strict,)
+# ### def _analyze_regex_literal_affix
+
+def _is_regex_combinable(regex_obj):
+	""" 檢查正規表示式是否能併入合併比對器 (不含旗標、具名群組或群組參照)
+
+	參數:
+		regex_obj - 編譯過的正規表示式物件
+	回傳值:
+		True - 可以合併
+		False - 不可合併
+	"""
+	if (0 != (regex_obj.flags & ~re.UNICODE)) or (len(regex_obj.groupindex) > 0):
+		return False
+	try:
+		return not _walk_regex_tree_has_groupref(sre_parse.parse(regex_obj.pattern, regex_obj.flags))
+	except Exception:
+		return False
+# ### def _is_regex_combinable
+
+
+class WatchEntryList(list):
+	""" 含有 MonitorEntry 物件的串列，並帶有將所有規則編譯而成的派送索引
+
+	索引依檔名規則的字面字首、字尾與副檔名分桶，無法分桶的規則則合併成少數幾個比對器，
+	查詢時只需對落在候選集合內的規則執行比對，仍依照串列順序傳回第一個吻合的規則。
+	各資料夾可吻合的規則與路徑比對結果另以 LRU 快取保存，同一資料夾的後續事件只需比對檔名規則。
+	所有規則都設定了路徑規則時，另以路徑規則的字面字首判斷整個資料夾樹是否可能有吻合的檔案。
+	編譯索引後若修改串列內容，需要重新呼叫 compile_index()。
+	"""
+
+	def __init__(self, *args, **kwds):
+		super(WatchEntryList, self).__init__(*args, **kwds)
+
+		self.folder_cache_size = _FOLDER_CACHE_SIZE
+		self._folder_cache = collections.OrderedDict()
+		self._folder_cache_lock = threading.Lock()
+
+		self._index_compiled = False
+		self._prefix_bucket = None
+		self._prefix_lengths = None
+		self._suffix_bucket = None
+		self._suffix_lengths = None
+		self._extension_bucket = None
+		self._combined_matchers = None
+		self._always_check = None
+		self._suffix_anchor_relaxed = False
+		self._path_prefixes = None
+	# ### def __init__
+
+	def compile_index(self):
+		""" 將目前串列內的所有規則編譯成派送索引
+
+		參數:
+			(無)
+		回傳值:
+			(無)
+		"""
+		prefix_bucket = {}
+		suffix_bucket = {}
+		extension_bucket = {}
+		combinable = []
+		always_check = []
+		suffix_anchor_relaxed = False
+		path_prefixes = []
+
+		for idx, w_case, in enumerate(self):
+			# {{{ literal prefix of path rule
+			if path_prefixes is not None:
+				if w_case.path_regex is None:
+					path_prefixes = None	# 任何資料夾都可能有吻合的檔案
+				else:
+					path_prefixes.append(_analyze_regex_literal_affix(w_case.path_regex)[0])
+			# }}} literal prefix of path rule
+
+			prefix, suffix, suffix_strict, = _analyze_regex_literal_affix(w_case.file_regex)
+			prefix = prefix[:_INDEX_PREFIX_MAXLEN]
+			if (len(prefix) > 0) and (len(prefix) >= len(suffix)):
+				prefix_bucket.setdefault(prefix, []).append(idx)
+			elif len(suffix) > 0:
+				if not suffix_strict:
+					suffix_anchor_relaxed = True
+				dot_pos = suffix.rfind('.')
+				if dot_pos >= 0:
+					extension_bucket.setdefault(suffix[dot_pos:], []).append(idx)
+				else:
+					suffix_bucket.setdefault(suffix, []).append(idx)
+			elif _is_regex_combinable(w_case.file_regex):
+				combinable.append(idx)
+			else:
+				always_check.append(idx)
+
+		# {{{ build combined matchers
+		combined_matchers = []
+		chunk = []
+		chunk_groups = 0
+		for idx in combinable:
+			regex_obj = self[idx].file_regex
+			if (len(chunk) >= _COMBINED_MATCHER_CHUNK_SIZE) or ((chunk_groups + regex_obj.groups) > _COMBINED_MATCHER_MAX_GROUPS):
+				combined_matchers.append(self._build_combined_matcher(chunk))
+				chunk = []
+				chunk_groups = 0
+			chunk.append(idx)
+			chunk_groups = chunk_groups + regex_obj.groups
+		if len(chunk) > 0:
+			combined_matchers.append(self._build_combined_matcher(chunk))
+		# }}} build combined matchers
+
+		self._prefix_bucket = prefix_bucket
+		self._prefix_lengths = sorted(set([len(k) for k in prefix_bucket.iterkeys()]))
+		self._suffix_bucket = suffix_bucket
+		self._suffix_lengths = sorted(set([len(k) for k in suffix_bucket.iterkeys()]))
+		self._extension_bucket = extension_bucket
+		self._combined_matchers = combined_matchers
+		self._always_check = always_check
+		self._suffix_anchor_relaxed = suffix_anchor_relaxed
+		self._path_prefixes = path_prefixes
+		self._index_compiled = True
+
+		self.clear_folder_cache()
+	# ### def compile_index
+
+	def clear_folder_cache(self):
+		""" 清除路徑候選規則快取 (規則變更或重新載入設定時呼叫)
+
+		參數:
+			(無)
+		回傳值:
+			(無)
+		"""
+		with self._folder_cache_lock:
+			self._folder_cache.clear()
+	# ### def clear_folder_cache
+
+	def _lookup_folder_candidate(self, folderpath):
+		""" 取得可吻合指定資料夾的規則 (僅含有設定路徑規則者) 與其路徑比對結果
+
+		參數:
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+		回傳值:
+			以規則索引值為鍵、路徑比對結果物件為值的字典
+		"""
+		with self._folder_cache_lock:
+			folder_match = self._folder_cache.pop(folderpath, None)
+			if folder_match is not None:
+				self._folder_cache[folderpath] = folder_match	# 移到最近使用的位置
+				return folder_match
+
+		folder_match = {}
+		for idx, w_case, in enumerate(self):
+			if w_case.path_regex is not None:
+				mobj_path = w_case.path_regex.match(folderpath)
+				if mobj_path is not None:
+					folder_match[idx] = mobj_path
+
+		with self._folder_cache_lock:
+			while len(self._folder_cache) >= self.folder_cache_size:
+				self._folder_cache.popitem(last=False)
+			self._folder_cache[folderpath] = folder_match
+		return folder_match
+	# ### def _lookup_folder_candidate
+
+	def _build_combined_matcher(self, chunk):
+		""" 將多個規則的檔名正規表示式合併成一個比對器
+
+		參數:
+			chunk - 規則索引值串列
+		回傳值:
+			(regex_obj, chunk,) - 合併後的比對器 (合併失敗時為 None) 與規則索引值串列
+		"""
+		try:
+			regex_obj = re.compile('|'.join(["(?:%s)" % (self[idx].file_regex.pattern,) for idx in chunk]))
+		except Exception:
+			regex_obj = None
+		return (regex_obj, chunk,)
+	# ### def _build_combined_matcher
+
+	def _lookup_candidate(self, filename):
+		""" 取得檔名可能吻合的規則索引值
+
+		參數:
+			filename - 檔案名稱
+		回傳值:
+			依串列順序排列的規則索引值串列
+		"""
+		if self._suffix_anchor_relaxed and filename.endswith('\n'):	# $ 可吻合結尾換行字元之前，字尾索引不適用
+			return range(len(self))
+
+		candidate = []
+		for l in self._prefix_lengths:
+			if l > len(filename):
+				break
+			aux = self._prefix_bucket.get(filename[:l])
+			if aux is not None:
+				candidate.extend(aux)
+		for l in self._suffix_lengths:
+			if l > len(filename):
+				break
+			aux = self._suffix_bucket.get(filename[-l:])
+			if aux is not None:
+				candidate.extend(aux)
+		dot_pos = filename.rfind('.')
+		if dot_pos >= 0:
+			aux = self._extension_bucket.get(filename[dot_pos:])
+			if aux is not None:
+				candidate.extend(aux)
+		for regex_obj, chunk, in self._combined_matchers:
+			if (regex_obj is None) or (regex_obj.match(filename) is not None):
+				candidate.extend(chunk)
+		candidate.extend(self._always_check)
+
+		candidate.sort()
+		return candidate
+	# ### def _lookup_candidate
+
+	def find_entry(self, filename, folderpath):
+		""" 找出第一個吻合檔名與路徑的規則
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+		回傳值:
+			(w_case, mobj_file, mobj_path,) - 規則物件、檔名比對結果物件與路徑比對結果物件，或是 None 當沒有吻合的規則
+		"""
+		if not self._index_compiled:
+			self.compile_index()
+
+		folder_match = self._lookup_folder_candidate(folderpath)
+		for idx in self._lookup_candidate(filename):
+			w_case = self[idx]
+
+			mobj_path = None
+			if w_case.path_regex is not None:
+				mobj_path = folder_match.get(idx)
+				if mobj_path is None:
+					continue
+
+			mobj_file = w_case.file_regex.match(filename)
+			if mobj_file is None:
+				continue
+
+			return (w_case, mobj_file, mobj_path,)
+		return None
+	# ### def find_entry
+
+	def may_match_folder_tree(self, folderpath):
+		""" 檢查資料夾與其下各層子資料夾中的檔案是否可能吻合任何規則 (依路徑規則的字面字首判斷)
+
+		參數:
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+		回傳值:
+			True - 可能有吻合的檔案
+			False - 不可能有吻合的檔案，整個資料夾樹都不需要掃描
+		"""
+		if not self._index_compiled:
+			self.compile_index()
+
+		if (self._path_prefixes is None) or ('' == folderpath):
+			return True
+		subfolder_prefix = folderpath + '/'
+		for prefix in self._path_prefixes:
+			if subfolder_prefix.startswith(prefix) or prefix.startswith(subfolder_prefix):
+				return True
+		return False
+	# ### def may_match_folder_tree
+# ### class WatchEntryList
+
+
+
 class TimeInterval(object):
 	""" 僅含小時與分 (HH:MM) 的時間區間 """
 
@@ -211,6 +615,51 @@ def _to_bool(v, default_value=False):
 # ### def _to_bool
 
 
+def _load_config_impl_engineconfig(configMap):
+	""" 讀取監看引擎運作參數 (engine 段落)
+
+	參數:
+		configMap - 設定值資訊字典
+	回傳值:
+		EngineConfiguration 物件
+	"""
+	engine_config = EngineConfiguration()
+	if ('engine' not in configMap) or (not isinstance(configMap['engine'], dict)):
+		return engine_config
+	engine_cfg = configMap['engine']
+
+	# {{{ dispatch queue
+	engine_config.dispatch_worker_count = max(int(engine_cfg.get('dispatch_workers', 0)), 0)
+	engine_config.dispatch_queue_size = max(int(engine_cfg.get('dispatch_queue_size', 4096)), 1)
+	engine_config.dispatch_block_on_overflow = (str(engine_cfg.get('dispatch_overflow', 'block')).strip().lower() != 'drop')
+	# }}} dispatch queue
+
+	# {{{ event coalescing
+	engine_config.coalesce_window = max(float(engine_cfg.get('coalesce_window', 0)), 0.0)
+	if 'coalesce_max_delay' in engine_cfg:
+		engine_config.coalesce_max_delay = max(float(engine_cfg['coalesce_max_delay']), 0.0)
+	# }}} event coalescing
+
+	# 同時執行不會消耗檔案的作業塊
+	engine_config.operation_worker_count = max(int(engine_cfg.get('parallel_operation_workers', 0)), 0)
+
+	# 主迴圈實作
+	engine_config.process_driver = str(engine_cfg.get('process_driver', 'asyncore')).strip().lower()
+
+	# 各階段處理耗時統計的記錄間隔
+	engine_config.stats_report_interval = max(int(engine_cfg.get('stats_report_interval', 600)), 0)
+
+	# 即時量測值查詢用的 Unix socket
+	if engine_cfg.get('stats_socket') is not None:
+		engine_config.stats_socket_path = os.path.abspath(str(engine_cfg['stats_socket']))
+
+	# 計算檔案簽章用的 worker
+	engine_config.signature_worker_count = max(int(engine_cfg.get('signature_workers', 0)), 0)
+	engine_config.signature_inflight_bytes = max(int(engine_cfg.get('signature_inflight_bytes', 268435456)), 1)
+
+	return engine_config
+# ### def _load_config_impl_engineconfig
+
 def _load_config_impl_globalconfig(configMap):
 	""" 讀取全域設定資訊
 
@@ -234,15 +683,38 @@ def _load_config_impl_globalconfig(configMap):
 	meta_db_path = None
 	meta_reserve_day_duplicatecheck = 3
 	meta_reserve_day_missingcheck = 2
+	signature_engine = None
+	signature_cache_size = 0
+	dupcheck_prefilter = False
+	commit_policy = None
+	meta_backend = 'sqlite'
+	meta_snapshot_interval = 300
+	meta_snapshot_path = None
 	if ('meta' in configMap) and isinstance(configMap['meta'], dict):
 		meta_cfg = configMap['meta']
 		meta_db_path = meta_cfg['db_path']
 
 		meta_reserve_day_duplicatecheck = max(int(meta_cfg.get('duplicate_check_reserve_day', 3)), 1)
 		meta_reserve_day_missingcheck = max(int(meta_cfg.get('missing_detect_reserve_day', 2)), 1)
+
+		signature_engine = metadatum.SignatureEngine(meta_cfg.get('signature_algorithm', 'md5'),
+				int(meta_cfg.get('signature_read_buffer', 1048576)),
+				_to_bool(meta_cfg.get('signature_mmap', False), default_value=False))
+		signature_cache_size = max(int(meta_cfg.get('signature_cache_size', 0)), 0)
+		dupcheck_prefilter = _to_bool(meta_cfg.get('duplicate_check_prefilter', False), default_value=False)
+
+		commit_policy = metadatum.CommitPolicy(meta_cfg.get('journal_mode'), meta_cfg.get('synchronous'),
+				int(meta_cfg.get('commit_batch_size', 1)),
+				float(meta_cfg.get('commit_interval', 1.0)))
+
+		meta_backend = str(meta_cfg.get('backend', 'sqlite')).strip().lower()
+		meta_snapshot_interval = max(int(meta_cfg.get('snapshot_interval', 300)), 10)
+		meta_snapshot_path = meta_cfg.get('snapshot_path')
 	# }}} load meta storage options
 
-	global_config = WatcherConfiguration(target_directory, recursive_watch, remove_unoperate_file, meta_db_path, meta_reserve_day_duplicatecheck, meta_reserve_day_missingcheck)
+	engine_config = _load_config_impl_engineconfig(configMap)
+
+	global_config = WatcherConfiguration(target_directory, recursive_watch, remove_unoperate_file, meta_db_path, meta_reserve_day_duplicatecheck, meta_reserve_day_missingcheck, engine_config, signature_engine, signature_cache_size, dupcheck_prefilter, commit_policy, meta_backend, meta_snapshot_interval, meta_snapshot_path)
 
 	return global_config
 # ### _load_config_impl_globalconfig
@@ -327,7 +799,7 @@ def _load_config_impl_watchentries(watch_entries_cfg, operation_deliver, operati
 		operation_schedule_seq - 排定作業塊先後順序用的作業名稱串列
 		operation_run_newupdate_seq - 排定作業執行先後順序用的作業名稱串列
 	回傳值:
-		含有 OperationEntry 物件的串列
+		含有 MonitorEntry 物件的串列
 	"""
 	watch_entries = []
 
@@ -395,7 +867,7 @@ def load_config(config_filename, config_reader, operation_deliver, operation_sch
 		operation_run_newupdate_seq - 排定作業執行先後順序用的作業名稱串列 (針對檔案新增或修改事件)
 		operation_run_dismiss_seq - 排定作業執行先後順序用的作業名稱串列 (針對檔案刪除或移出事件)
 	傳回值:
-		(global_config, watch_entries,) - 存放 WatcherConfiguration 物件 (global_config) 及 MonitorEntry 物件 list (watch_entries) 的 tuple
+		(global_config, watch_entries,) - 存放 WatcherConfiguration 物件 (global_config) 及已編譯派送索引的 MonitorEntry 物件串列 (WatchEntryList 物件 watch_entries) 的 tuple
 	"""
 	with open(config_filename, 'r') as fp:
 		configMap = yaml.load(fp)
@@ -409,14 +881,18 @@ def load_config(config_filename, config_reader, operation_deliver, operation_sch
 	_load_config_impl_moduleconfig(configMap, config_reader, global_config)
 
 	# Watch Entries
-	watch_entries = _load_config_impl_watchentries(configMap.get('watching_entries', ()),
-				operation_deliver, operation_schedule_seq, operation_run_newupdate_seq, operation_run_dismiss_seq)
+	watch_entries = WatchEntryList()
+	watch_entries.extend(_load_config_impl_watchentries(configMap.get('watching_entries', ()),
+				operation_deliver, operation_schedule_seq, operation_run_newupdate_seq, operation_run_dismiss_seq))
 
 	# Import Watch Entries
 	_load_config_impl_import_external_watchentries(watch_entries,
 				configMap.get('import_watching_entries_from', ()), os.path.dirname(config_filename),
 				operation_deliver, operation_schedule_seq, operation_run_newupdate_seq, operation_run_dismiss_seq)
 
+	# Dispatch Index
+	watch_entries.compile_index()
+
 	return (global_config, watch_entries,)
 # ### def load_config
 
@@ -3,10 +3,26 @@
 
 """ 儲存運作過程中資料 """
 
+import os
+import re
+import mmap
 import sqlite3
 import hashlib
 import base64
 import time
+import calendar
+import syslog
+import threading
+import functools
+import collections
+import cPickle
+
+from filewatcher import workerpool
+
+try:
+	import pyblake2
+except ImportError:
+	pyblake2 = None
 
 
 
@@ -21,25 +37,816 @@ FPCHK_MODIFING = 3
 FPCHK_MODIFIED = 4
 
 
-class MetaStorage(object):
-	""" 儲存 Meta 資料的資料庫物件 """
+_DEFAULT_SIG_ALGORITHM = 'md5'	# 舊版資料庫紀錄使用的簽章演算法
+_DEFAULT_SIG_READ_BUFFER = 1048576
+_HASHLIB_CONSTRUCTOR_NAMES = ('md5', 'sha1', 'sha224', 'sha256', 'sha384', 'sha512', 'blake2b', 'blake2s',)
+
+_SAMPLE_BLOCK_SIZE = 65536	# 取樣簽章在檔案開頭、中間、結尾各讀取的資料量
+_SAMPLE_SIG_PREFIX = '*sample:'	# 只以大小與取樣簽章記錄 (尚未計算完整簽章) 的紀錄所使用的簽章前綴
+
+_OFFERED_SIG_CAPACITY = 1024	# 由監視器預先算好而尚未被取用的簽章最多保留筆數
+
+_SNAPSHOT_FORMAT_VERSION = 1	# MemoryMetaStorage 快照檔格式版本
+
+_DUPCHECK_COLUMNS = 'file_name, file_sig, first_contact_time, last_contact_time, lifetime_retain, sig_algorithm, file_size, sample_sig, file_path, file_mtime'
+_PRESENCE_COLUMNS = 'folder_id, file_name, file_size, file_mtime, report_status, first_contact_time, last_contact_time'
+
+_JOURNAL_MODES = ('delete', 'truncate', 'persist', 'memory', 'wal', 'off',)
+_SYNCHRONOUS_LEVELS = ('off', 'normal', 'full', 'extra',)
+
 
-	def __init__(self, file_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day):
+def _get_digest_constructor(algorithm):
+	""" 取得簽章演算法的 digest 建構函式
+
+	參數:
+		algorithm - 演算法名稱 (例: md5, sha1, sha256, blake2b, blake2s)
+	回傳值:
+		不需參數的建構函式，演算法無法使用時傳回 None
+	"""
+	if (algorithm in _HASHLIB_CONSTRUCTOR_NAMES) and hasattr(hashlib, algorithm):
+		return getattr(hashlib, algorithm)
+	for openssl_name in {'blake2b': ('blake2b512',), 'blake2s': ('blake2s256',)}.get(algorithm, (algorithm,)):
+		try:
+			hashlib.new(openssl_name)
+			return lambda n=openssl_name: hashlib.new(n)
+		except ValueError:
+			pass
+	if (pyblake2 is not None) and hasattr(pyblake2, algorithm):
+		return getattr(pyblake2, algorithm)
+	return None
+# ### def _get_digest_constructor
+
+
+class SignatureEngine(object):
+	""" 計算檔案內容數位簽章 """
+
+	def __init__(self, algorithm=_DEFAULT_SIG_ALGORITHM, read_buffer_size=_DEFAULT_SIG_READ_BUFFER, use_mmap=False):
 		""" 建構子
+
+		參數:
+			algorithm - 簽章演算法名稱，無法使用時改用 md5
+			read_buffer_size - 每次讀取 (或 mmap 時每次送入 digest) 的資料量 (bytes)
+			use_mmap - 是否以 mmap 讀取檔案內容
+		"""
+		super(SignatureEngine, self).__init__()
+
+		algorithm = str(algorithm).strip().lower()
+		if _get_digest_constructor(algorithm) is None:
+			syslog.syslog(syslog.LOG_WARNING, "signature algorithm %r is not available, use %r instead." % (algorithm, _DEFAULT_SIG_ALGORITHM,))
+			algorithm = _DEFAULT_SIG_ALGORITHM
+		self.algorithm = algorithm
+		self.read_buffer_size = max(int(read_buffer_size), 4096)
+		self.use_mmap = use_mmap
+	# ### def __init__
+
+	def _feed_digesters(self, f, digesters):
+		f.seek(0)
+		file_size = os.fstat(f.fileno()).st_size
+		if self.use_mmap and (file_size > 0):
+			m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			try:
+				for offset in xrange(0, len(m), self.read_buffer_size):
+					data = buffer(m, offset, self.read_buffer_size)
+					for digester in digesters:
+						digester.update(data)
+			finally:
+				m.close()
+			return
+		reach_eof = False
+		while reach_eof == False:
+			data = f.read(self.read_buffer_size)
+			if not data:
+				reach_eof = True
+			else:
+				for digester in digesters:
+					digester.update(data)
+	# ### def _feed_digesters
+
+	def compute_signatures_from_file(self, f, algorithms=None):
+		""" 由已開啟的檔案讀取一次內容，計算一個或多個演算法的數位簽章
+
+		參數:
+			f - 以二進位模式開啟的檔案物件
+			algorithms=None - 演算法名稱串列，None 表示只使用本物件設定的演算法
+		回傳值:
+			以演算法名稱為鍵、數位簽章字串為值的字典
+		"""
+		if algorithms is None:
+			algorithms = (self.algorithm,)
+		digesters = []
+		for algorithm in algorithms:
+			constructor = _get_digest_constructor(algorithm)
+			if constructor is not None:
+				digesters.append((algorithm, constructor(),))
+		self._feed_digesters(f, [d for _a, d, in digesters])
+		return dict([(algorithm, base64.b64encode(d.digest()).strip('='),) for algorithm, d, in digesters])
+	# ### def compute_signatures_from_file
+
+	def compute_signatures(self, filepath, algorithms=None):
+		""" 讀取檔案一次，計算一個或多個演算法的數位簽章
+
+		參數:
+			filepath - 檔案路徑
+			algorithms=None - 演算法名稱串列，None 表示只使用本物件設定的演算法
+		回傳值:
+			以演算法名稱為鍵、數位簽章字串為值的字典
+		"""
+		with open(filepath, 'rb') as f:
+			return self.compute_signatures_from_file(f, algorithms)
+	# ### def compute_signatures
+
+	def compute(self, filepath):
+		""" 計算檔案的數位簽章
+
+		參數:
+			filepath - 檔案路徑
+		回傳值:
+			數位簽章字串
+		"""
+		return self.compute_signatures(filepath)[self.algorithm]
+	# ### def compute
+# ### class SignatureEngine
+
+
+class IncrementalSignature(object):
+	""" 分段送入資料計算一個或多個演算法的數位簽章 (用於資料陸續到達的情況) """
+
+	def __init__(self, algorithms):
+		""" 建構子
+
+		參數:
+			algorithms - 演算法名稱串列 (不支援的演算法會被略過)
+		"""
+		super(IncrementalSignature, self).__init__()
+
+		self.digesters = []
+		for algorithm in algorithms:
+			constructor = _get_digest_constructor(algorithm)
+			if constructor is not None:
+				self.digesters.append((algorithm, constructor(),))
+	# ### def __init__
+
+	def update(self, data):
+		for _algorithm, digester, in self.digesters:
+			digester.update(data)
+	# ### def update
+
+	def get_signatures(self):
+		""" 取得目前為止送入資料的簽章
+
+		回傳值:
+			以演算法名稱為鍵、數位簽章字串為值的字典
+		"""
+		return dict([(algorithm, base64.b64encode(digester.digest()).strip('='),) for algorithm, digester, in self.digesters])
+	# ### def get_signatures
+# ### class IncrementalSignature
+
+
+def compute_sample_signature(f, file_size, block_size=_SAMPLE_BLOCK_SIZE):
+	""" 讀取檔案開頭、中間與結尾各一段資料計算取樣簽章 (md5，與設定的簽章演算法無關)
+	檔案不大於三段資料量時讀取整個檔案
+
+	參數:
+		f - 以二進位模式開啟的檔案物件
+		file_size - 檔案大小
+		block_size - 每段資料量 (bytes)
+	回傳值:
+		取樣簽章字串
+	"""
+	digester = hashlib.md5()
+	if file_size <= (block_size * 3):
+		f.seek(0)
+		digester.update(f.read())
+	else:
+		for offset in (0, (file_size - block_size) / 2, file_size - block_size,):
+			f.seek(offset)
+			digester.update(f.read(block_size))
+	f.seek(0)
+	return base64.b64encode(digester.digest()).strip('=')
+# ### def compute_sample_signature
+
+
+def _get_stat_key(st):
+	""" 由 os.stat() 結果取得簽章快取鍵
+
+	參數:
+		st - os.stat() 結果
+	回傳值:
+		(st_dev, st_ino, st_size, st_mtime_ns) 形式的 tuple
+		(沒有 st_mtime_ns 時由浮點數的 st_mtime 換算，精確度約為微秒)
+	"""
+	mtime_ns = getattr(st, 'st_mtime_ns', None)
+	if mtime_ns is None:
+		mtime_ns = int(round(st.st_mtime * 1000000)) * 1000
+	return (st.st_dev, st.st_ino, st.st_size, mtime_ns,)
+# ### def _get_stat_key
+
+
+class SignatureCache(object):
+	""" 以 (st_dev, st_ino, st_size, st_mtime_ns, 演算法) 為鍵的檔案簽章快取
+
+	記憶體中依最近使用順序保留最多 capacity 筆，新增項目同時寫入資料庫，啟動時載入最近使用的項目。
+	呼叫端需自行處理同步與 commit (由 MetaStorage 的 lock 保護)。
+	"""
+
+	def __init__(self, db, capacity):
+		""" 建構子
+
+		參數:
+			db - sqlite3 資料庫連線
+			capacity - 快取容量 (筆)
+		"""
+		super(SignatureCache, self).__init__()
+
+		self.db = db
+		self.capacity = max(int(capacity), 1)
+
+		self._entries = collections.OrderedDict()
+		self._touched = {}	# 最近被使用但尚未寫回資料庫的項目: key -> 使用時戳
+
+		self.hit_count = 0
+		self.miss_count = 0
+
+		self._prepare_table()
+		self._load_recent_entries()
+	# ### def __init__
+
+	def _prepare_table(self):
+		c = self.db.cursor()
+		c.execute("""CREATE TABLE IF NOT EXISTS SignatureCache(st_dev INTEGER NOT NULL, st_ino INTEGER NOT NULL, st_size INTEGER NOT NULL, st_mtime_ns INTEGER NOT NULL, sig_algorithm TEXT NOT NULL, file_sig TEXT NOT NULL, last_access_time INTEGER NOT NULL, PRIMARY KEY (st_dev, st_ino, st_size, st_mtime_ns, sig_algorithm))""")
+		c.execute("""CREATE INDEX IF NOT EXISTS idx_SignatureCache_last_access_time ON SignatureCache(last_access_time)""")
+		c.close()
+		self.db.commit()
+	# ### def _prepare_table
+
+	def _load_recent_entries(self):
+		c = self.db.cursor()
+		c.execute("""SELECT st_dev, st_ino, st_size, st_mtime_ns, sig_algorithm, file_sig FROM SignatureCache ORDER BY last_access_time DESC LIMIT ?""", (self.capacity,))
+		rows = c.fetchall()
+		c.close()
+		for r in reversed(rows):
+			self._entries[(int(r[0]), int(r[1]), int(r[2]), int(r[3]), str(r[4]),)] = str(r[5])
+	# ### def _load_recent_entries
+
+	def lookup(self, stat_key, algorithm):
+		""" 查詢快取
+
+		參數:
+			stat_key - _get_stat_key() 傳回的鍵
+			algorithm - 簽章演算法名稱
+		回傳值:
+			簽章字串，沒有快取時傳回 None
+		"""
+		k = stat_key + (algorithm,)
+		file_sig = self._entries.pop(k, None)
+		if file_sig is None:
+			self.miss_count = self.miss_count + 1
+			return None
+		self._entries[k] = file_sig
+		self._touched[k] = int(time.time())
+		self.hit_count = self.hit_count + 1
+		return file_sig
+	# ### def lookup
+
+	def store(self, stat_key, algorithm, file_sig):
+		""" 新增快取項目
+
+		參數:
+			stat_key - _get_stat_key() 傳回的鍵
+			algorithm - 簽章演算法名稱
+			file_sig - 簽章字串
+		回傳值:
+			(無)
+		"""
+		k = stat_key + (algorithm,)
+		self._entries.pop(k, None)
+		self._entries[k] = file_sig
+		self._touched.pop(k, None)
+		while len(self._entries) > self.capacity:
+			evicted_k, _sig, = self._entries.popitem(last=False)
+			self._touched.pop(evicted_k, None)
+		c = self.db.cursor()
+		c.execute("""INSERT OR REPLACE INTO SignatureCache(st_dev, st_ino, st_size, st_mtime_ns, sig_algorithm, file_sig, last_access_time) VALUES(?, ?, ?, ?, ?, ?, ?)""", k + (file_sig, int(time.time()),))
+		c.close()
+	# ### def store
+
+	def flush(self):
+		""" 將使用時間寫回資料庫，並刪除資料庫中超過容量的最久未使用項目
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		c = self.db.cursor()
+		if len(self._touched) > 0:
+			c.executemany("""UPDATE SignatureCache SET last_access_time=? WHERE (st_dev = ?) AND (st_ino = ?) AND (st_size = ?) AND (st_mtime_ns = ?) AND (sig_algorithm = ?)""",
+					[(tstamp,) + k for k, tstamp, in self._touched.iteritems()])
+			self._touched = {}
+		c.execute("""DELETE FROM SignatureCache WHERE rowid IN (SELECT rowid FROM SignatureCache ORDER BY last_access_time DESC LIMIT -1 OFFSET ?)""", (self.capacity,))
+		c.close()
+	# ### def flush
+# ### class SignatureCache
+
+
+class CommitPolicy(object):
+	""" 中介資訊資料庫的日誌模式與交易提交方式 """
+
+	def __init__(self, journal_mode=None, synchronous=None, batch_size=1, interval=1.0):
+		""" 建構子
+
+		參數:
+			journal_mode=None - SQLite 日誌模式 (delete, truncate, persist, memory, wal, off)，None 表示不變更
+			synchronous=None - SQLite synchronous 等級 (off, normal, full, extra)，None 表示不變更
+			batch_size=1 - 累積多少筆寫入後提交一次交易，1 表示每次寫入都提交
+			interval=1.0 - 累積的寫入最長等待多久 (秒) 後提交
+		"""
+		super(CommitPolicy, self).__init__()
+
+		self.journal_mode = None
+		if journal_mode is not None:
+			journal_mode = str(journal_mode).strip().lower()
+			if journal_mode in _JOURNAL_MODES:
+				self.journal_mode = journal_mode
+			else:
+				syslog.syslog(syslog.LOG_WARNING, "unknown journal mode %r, keep database default." % (journal_mode,))
+		self.synchronous = None
+		if synchronous is not None:
+			synchronous = str(synchronous).strip().lower()
+			if synchronous in _SYNCHRONOUS_LEVELS:
+				self.synchronous = synchronous
+			else:
+				syslog.syslog(syslog.LOG_WARNING, "unknown synchronous level %r, keep database default." % (synchronous,))
+		self.batch_size = max(int(batch_size), 1)
+		self.interval = max(float(interval), 0.0)
+	# ### def __init__
+
+	def apply_pragmas(self, db):
+		""" 在資料庫連線上設定日誌模式與 synchronous 等級
+
+		參數:
+			db - sqlite3 連線物件
+		"""
+		c = db.cursor()
+		if self.journal_mode is not None:
+			c.execute("PRAGMA journal_mode=%s" % (self.journal_mode,))
+			r = c.fetchone()
+			if (r is None) or (str(r[0]).lower() != self.journal_mode):
+				syslog.syslog(syslog.LOG_WARNING, "cannot switch journal mode to %r (current: %r)." % (self.journal_mode, None if (r is None) else r[0],))
+		if self.synchronous is not None:
+			c.execute("PRAGMA synchronous=%s" % (self.synchronous,))
+		c.close()
+	# ### def apply_pragmas
+# ### class CommitPolicy
+
+
+def _serialized_access(m):
+	""" 以 MetaStorage 物件的 lock 包覆資料庫操作方法 (資料庫連線由事件派送 worker 與主迴圈共用) """
+	@functools.wraps(m)
+	def _wrapped(self, *args, **kwds):
+		with self._lock:
+			return m(self, *args, **kwds)
+	return _wrapped
+# ### def _serialized_access
+
+
+class MetaStorageBackend(object):
+	""" 中介資訊資料庫的共同介面與檔案簽章計算
+
+	子類別需實作重複檢查、檔案存在檢查、已刪除檔案清除、資料維護與資料筆數查詢，
+	有累積寫入的實作另需覆寫 flush()、flush_if_due()、get_flush_interval() 與 close()
+	"""
+
+	def __init__(self, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine=None):
+		""" 建構子
+
 		參數:
-			file_path - 資料庫檔案路徑
 			meta_dupcheck_reserve_day - 重複檔案資料保存天數 (重複性檢查)
 			meta_missingfile_reserve_day - 已消失檔案資料保存天數 (新增或修改檔案檢查)
+			signature_engine - 計算檔案簽章用的 SignatureEngine 物件，None 表示使用 md5
 		"""
-		super(MetaStorage, self).__init__()
+		super(MetaStorageBackend, self).__init__()
+
+		self._lock = threading.RLock()
 
-		self.db = sqlite3.connect(file_path)	#@UndefinedVariable
 		self.meta_dupcheck_reserve_second = meta_dupcheck_reserve_day * 86400
 		self.meta_missingfile_reserve_second = meta_missingfile_reserve_day * 86400
 		self.lastmaintain = time.time()
 
+		self._row_counts = {}
+		self._row_counts_tstamp = 0
+		self._row_counts_refreshing = False
+
+		self.signature_engine = SignatureEngine() if (signature_engine is None) else signature_engine
+		self._legacy_sig_algorithms = []	# 資料庫中仍存在的其他簽章演算法紀錄
+
+		self.signature_cache = None
+		self._offered_sigs = collections.OrderedDict()	# stat key -> 監視器預先算好的簽章字典
+
+		self.dupcheck_prefilter = False	# 只有支援 test_file_duplication_staged() 的實作會啟用
+		self.commit_count = 0
+	# ### def __init__
+
+	def _group_commit(self):
+		""" (需在持有 lock 時呼叫) 記錄一筆寫入，需要提交交易的實作覆寫 """
+		pass
+	# ### def _group_commit
+
+	def flush(self, blocking=True):
+		""" 寫出累積的資料
+
+		參數:
+			blocking=True - 是否等待資料庫存取鎖
+		回傳值:
+			True - 已無累積的資料
+			False - 資料庫忙碌，未寫出
+		"""
+		return True
+	# ### def flush
+
+	def flush_if_due(self):
+		""" 累積的資料已到寫出時間時寫出 (不等待資料庫存取鎖，由主迴圈定期呼叫) """
+		pass
+	# ### def flush_if_due
+
+	def get_flush_interval(self):
+		""" 取得主迴圈呼叫 flush_if_due() 的間隔 (秒)，None 表示不需要 """
+		return None
+	# ### def get_flush_interval
+
+	def close(self):
+		pass
+	# ### def close
+
+	def _maintain_database(self):
+		""" 資料庫維護: 刪除過舊的資料 """
+		raise NotImplementedError("%s._maintain_database" % (self.__class__.__name__,))
+	# ### def _maintain_database
+
+	def get_row_counts(self, max_age=30):
+		""" 取得各資料表的資料筆數 (不可等待資料庫存取鎖)
+
+		參數:
+			max_age=30 - 查詢結果的快取時間 (秒)
+		回傳值:
+			以資料表名稱為鍵、資料筆數為值的字典
+		"""
+		raise NotImplementedError("%s.get_row_counts" % (self.__class__.__name__,))
+	# ### def get_row_counts
+
+	def test_file_duplication_and_checkin(self, file_name, file_sig, lifetime_retain=False, legacy_file_sigs=None, file_size=None, sample_sig=None):
+		""" 檢查檔案是不是重複，並在是新檔案時新增相關紀錄 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.test_file_duplication_and_checkin" % (self.__class__.__name__,))
+	# ### def test_file_duplication_and_checkin
+
+	def test_file_presence_and_checkin(self, file_relfolder, file_name, file_size, file_mtime, tstamp=None):
+		""" 檢查檔案是不是已經存在，並新增或更新相關紀錄 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.test_file_presence_and_checkin" % (self.__class__.__name__,))
+	# ### def test_file_presence_and_checkin
+
+	def test_folder_presence_and_checkin(self, file_relfolder, file_stats, tstamp=None):
+		""" 一次檢查同一資料夾內多個檔案是不是已經存在 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.test_folder_presence_and_checkin" % (self.__class__.__name__,))
+	# ### def test_folder_presence_and_checkin
+
+	def test_file_deletion_and_purge(self, tstamp=None):
+		""" 傳回已刪除檔案的串列並清除其紀錄 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.test_file_deletion_and_purge" % (self.__class__.__name__,))
+	# ### def test_file_deletion_and_purge
+
+	def get_folder_signature(self, file_relfolder):
+		""" 取得資料夾上次列出內容時記錄的簽章 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.get_folder_signature" % (self.__class__.__name__,))
+	# ### def get_folder_signature
+
+	def checkin_folder_signature(self, file_relfolder, dir_mtime, dir_ctime, entry_count, subdirs, tstamp=None):
+		""" 記錄資料夾簽章 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.checkin_folder_signature" % (self.__class__.__name__,))
+	# ### def checkin_folder_signature
+
+	def get_unsettled_files(self, file_relfolder):
+		""" 取得資料夾中尚在新增或修改中的檔案名稱 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.get_unsettled_files" % (self.__class__.__name__,))
+	# ### def get_unsettled_files
+
+	def refresh_folder_presence(self, file_relfolder, tstamp, skip_names=()):
+		""" 更新資料夾中檔案存在紀錄的最後確認時間 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.refresh_folder_presence" % (self.__class__.__name__,))
+	# ### def refresh_folder_presence
+
+	def load_scan_checkpoint(self, name):
+		""" 讀取掃描檢查點 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.load_scan_checkpoint" % (self.__class__.__name__,))
+	# ### def load_scan_checkpoint
+
+	def save_scan_checkpoint(self, name, checkpoint):
+		""" 儲存或清除掃描檢查點 (參數與回傳值見 MetaStorage) """
+		raise NotImplementedError("%s.save_scan_checkpoint" % (self.__class__.__name__,))
+	# ### def save_scan_checkpoint
+
+	def get_signature_algorithms(self):
+		""" 取得重複檢查需要的簽章演算法 (設定的演算法在前，其後是資料庫中仍有紀錄的其他演算法)
+
+		參數: (無)
+		回傳值:
+			演算法名稱串列
+		"""
+		return [self.signature_engine.algorithm] + self._legacy_sig_algorithms
+	# ### def get_signature_algorithms
+
+	def offer_file_signatures(self, st, file_sigs):
+		""" 提供已經算好的檔案簽章 (例如在檔案寫入過程中即時計算)，下次計算同一檔案簽章時直接使用
+		檔案 (裝置、inode、大小、修改時間) 有變動時不會被使用
+
+		參數:
+			st - 計算簽章時檔案的 os.stat() 結果
+			file_sigs - 以演算法名稱為鍵、數位簽章字串為值的字典
+		回傳值:
+			(無)
+		"""
+		with self._lock:
+			self._offered_sigs[_get_stat_key(st)] = file_sigs
+			while len(self._offered_sigs) > _OFFERED_SIG_CAPACITY:
+				self._offered_sigs.popitem(False)
+	# ### def offer_file_signatures
+
+	def compute_file_signatures(self, filepath):
+		""" 以設定的簽章演算法計算檔案簽章，資料庫中仍有其他演算法的紀錄時一併計算 (檔案只讀取一次)
+		有啟用簽章快取時，檔案 (裝置、inode、大小、修改時間) 未變動則直接使用快取的簽章而不讀取檔案
+		(由 offer_file_signatures() 提供的簽章也是如此)
+
+		參數:
+			filepath - 檔案路徑
+		回傳值:
+			以演算法名稱為鍵、數位簽章字串為值的字典 (必定含有 signature_engine.algorithm)
+		"""
+		with open(filepath, 'rb') as f:
+			return self._compute_file_signatures_from_file(f)
+	# ### def compute_file_signatures
+
+	def _lookup_known_signatures(self, f, algorithms=None):
+		""" 取得已經算好的檔案簽章 (監視器提供或是快取中的簽章)，不讀取檔案內容
+
+		參數:
+			f - 以二進位模式開啟的檔案物件
+			algorithms=None - 演算法名稱串列，None 表示重複檢查需要的所有演算法
+		回傳值:
+			以演算法名稱為鍵、數位簽章字串為值的字典，有任何演算法沒有現成簽章時為 None
+		"""
+		if algorithms is None:
+			algorithms = self.get_signature_algorithms()
+		if (self.signature_cache is None) and (len(self._offered_sigs) == 0):
+			return None
+
+		stat_key = _get_stat_key(os.fstat(f.fileno()))
+		result = {}
+		with self._lock:
+			offered_sigs = self._offered_sigs.get(stat_key, {})
+			for algorithm in algorithms:
+				file_sig = offered_sigs.get(algorithm)
+				if (file_sig is None) and (self.signature_cache is not None):
+					file_sig = self.signature_cache.lookup(stat_key, algorithm)
+				if file_sig is None:
+					return None
+				result[algorithm] = file_sig
+			self._offered_sigs.pop(stat_key, None)
+		return result
+	# ### def _lookup_known_signatures
+
+	def _compute_file_signatures_from_file(self, f, algorithms=None):
+		if algorithms is None:
+			algorithms = self.get_signature_algorithms()
+		if (self.signature_cache is None) and (len(self._offered_sigs) == 0):
+			return self.signature_engine.compute_signatures_from_file(f, algorithms)
+
+		stat_key = _get_stat_key(os.fstat(f.fileno()))
+		result = {}
+		with self._lock:
+			offered_sigs = self._offered_sigs.pop(stat_key, {})
+			for algorithm in algorithms:
+				file_sig = offered_sigs.get(algorithm)
+				if (file_sig is None) and (self.signature_cache is not None):
+					file_sig = self.signature_cache.lookup(stat_key, algorithm)
+				if file_sig is not None:
+					result[algorithm] = file_sig
+		missing_algorithms = [algorithm for algorithm in algorithms if (algorithm not in result)]
+		if len(missing_algorithms) > 0:
+			computed_sigs = self.signature_engine.compute_signatures_from_file(f, missing_algorithms)
+			if (self.signature_cache is not None) and (_get_stat_key(os.fstat(f.fileno())) == stat_key):	# 計算期間檔案沒有變動才放入快取
+				with self._lock:
+					for algorithm, file_sig, in computed_sigs.iteritems():
+						self.signature_cache.store(stat_key, algorithm, file_sig)
+					self._group_commit()
+			result.update(computed_sigs)
+		return result
+	# ### def _compute_file_signatures_from_file
+# ### class MetaStorageBackend
+
+
+class _DayPartitions(object):
+	""" 依新增時間以日 (UTC) 分割的資料表集合
+	資料表名稱為 <base_name>_YYYYMMDD，另有存放長期留存紀錄的 <base_name>_permanent；
+	紀錄更新時留在原本的資料表，所有分割資料表經由暫存檢視表 <base_name>_all (UNION ALL) 一次查詢
+	"""
+
+	def __init__(self, base_name, table_schema, index_schemas, with_permanent=False):
+		""" 建構子
+
+		參數:
+			base_name - 資料表名稱前綴
+			table_schema - 建立資料表用的欄位定義 (CREATE TABLE 的括號內容)
+			index_schemas - (索引名稱後綴, 欄位串列) 形式的 tuple 串列
+			with_permanent=False - 是否有長期留存資料表
+		"""
+		super(_DayPartitions, self).__init__()
+
+		self.base_name = base_name
+		self.table_schema = table_schema
+		self.index_schemas = index_schemas
+		self.permanent_table = (base_name + '_permanent') if with_permanent else None
+		self.view_name = base_name + '_all'
+
+		self._day_tables = []	# 由新到舊排序的日分割資料表名稱
+		self._name_regex = re.compile('^' + re.escape(base_name) + '_([0-9]{8})$')
+	# ### def __init__
+
+	def _create_table(self, c, table_name):
+		c.execute("CREATE TABLE IF NOT EXISTS %s(%s)" % (table_name, self.table_schema,))
+		for index_suffix, index_columns, in self.index_schemas:
+			c.execute("CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s(%s)" % (table_name, index_suffix, table_name, index_columns,))
+	# ### def _create_table
+
+	def _rebuild_view(self, c):
+		""" 依目前的分割資料表重建查詢用的暫存檢視表 (partition_name 欄位為紀錄所在的資料表名稱) """
+		c.execute("DROP VIEW IF EXISTS temp.%s" % (self.view_name,))
+		c.execute("CREATE TEMP VIEW %s AS %s" % (self.view_name, " UNION ALL ".join(["SELECT '%s' AS partition_name, * FROM %s" % (table_name, table_name,) for table_name in self.tables()]),))
+	# ### def _rebuild_view
+
+	def load(self, c):
+		""" 由資料庫中找出既有的分割資料表，並建立長期留存資料表與查詢用的檢視表
+
+		參數:
+			c - 資料庫 cursor
+		"""
+		if self.permanent_table is not None:
+			self._create_table(c, self.permanent_table)
+		c.execute("""SELECT name FROM sqlite_master WHERE (type = 'table')""")
+		day_tables = [str(r[0]) for r in c.fetchall() if (self._name_regex.match(str(r[0])) is not None)]
+		day_tables.sort(reverse=True)
+		self._day_tables = day_tables
+		if len(self.tables()) == 0:	# 檢視表至少要有一個資料表
+			self.table_for(c, time.time())
+		else:
+			self._rebuild_view(c)
+	# ### def load
+
+	def is_partition(self, table_name):
+		""" 檢查資料表名稱是不是日分割資料表的名稱 """
+		return (self._name_regex.match(table_name) is not None)
+	# ### def is_partition
+
+	def drop_indexes(self, c, table_name):
+		""" 刪除分割資料表的索引 (資料表要改名時使用)
+
+		參數:
+			c - 資料庫 cursor
+			table_name - 資料表名稱
+		"""
+		for index_suffix, _index_columns, in self.index_schemas:
+			c.execute("DROP INDEX IF EXISTS idx_%s_%s" % (table_name, index_suffix,))
+	# ### def drop_indexes
+
+	def table_for(self, c, tstamp, lifetime_retain=False):
+		""" 取得存放給定時間新增的紀錄的資料表名稱，資料表不存在時建立
+
+		參數:
+			c - 資料庫 cursor
+			tstamp - 新增時間
+			lifetime_retain=False - 是否為長期留存的紀錄
+		回傳值:
+			資料表名稱
+		"""
+		if lifetime_retain and (self.permanent_table is not None):
+			return self.permanent_table
+		table_name = "%s_%s" % (self.base_name, time.strftime('%Y%m%d', time.gmtime(tstamp)),)
+		if table_name not in self._day_tables:
+			self._create_table(c, table_name)
+			self._day_tables.append(table_name)
+			self._day_tables.sort(reverse=True)
+			self._rebuild_view(c)
+		return table_name
+	# ### def table_for
+
+	def tables(self):
+		""" 取得所有分割資料表名稱 (長期留存資料表在前，其後由新到舊) """
+		if self.permanent_table is None:
+			return list(self._day_tables)
+		return [self.permanent_table] + self._day_tables
+	# ### def tables
+
+	def find_expired(self, expire_tstamp):
+		""" 找出新增時間都早於給定時戳的日分割資料表 (其中最後確認時間較新的紀錄要在刪除資料表前搬走)
+
+		參數:
+			expire_tstamp - 時戳
+		回傳值:
+			資料表名稱串列
+		"""
+		expired = []
+		for table_name in self._day_tables:
+			day_start = calendar.timegm(time.strptime(self._name_regex.match(table_name).group(1), '%Y%m%d'))
+			if (day_start + 86400) <= expire_tstamp:
+				expired.append(table_name)
+		return expired
+	# ### def find_expired
+
+	def detach(self, c, table_name):
+		""" 將資料表由集合中移除並重建檢視表 (之後的查詢不再讀取，需由呼叫者刪除資料表)
+
+		參數:
+			c - 資料庫 cursor
+			table_name - 資料表名稱
+		"""
+		self._day_tables.remove(table_name)
+		if len(self.tables()) == 0:
+			self.table_for(c, time.time())
+		else:
+			self._rebuild_view(c)
+	# ### def detach
+# ### class _DayPartitions
+
+
+def _count_table_rows(file_path, table_groups):
+	""" (在背景 worker 中執行) 以另一個資料庫連線計算各資料表的資料筆數
+
+	參數:
+		file_path - 資料庫檔案路徑
+		table_groups - (名稱, 資料表名稱串列) 形式的 tuple 串列，同一名稱的資料表筆數合計
+	回傳值:
+		以名稱為鍵、資料筆數為值的字典
+	"""
+	result = {}
+	db = sqlite3.connect(file_path, timeout=600)
+	try:
+		for name, table_names, in table_groups:
+			row_count = 0
+			for table_name in table_names:
+				try:
+					row_count = row_count + int(db.execute("SELECT COUNT(*) FROM %s" % (table_name,)).fetchone()[0])
+				except sqlite3.OperationalError:	# 分割資料表已被刪除
+					pass
+			result[name] = row_count
+	finally:
+		db.close()
+	return result
+# ### def _count_table_rows
+
+
+class MetaStorage(MetaStorageBackend):
+	""" 儲存 Meta 資料的資料庫物件 (SQLite，預設的中介資訊資料庫) """
+
+	def __init__(self, file_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine=None, signature_cache_size=0, dupcheck_prefilter=False, commit_policy=None):
+		""" 建構子
+		參數:
+			file_path - 資料庫檔案路徑
+			meta_dupcheck_reserve_day - 重複檔案資料保存天數 (重複性檢查)
+			meta_missingfile_reserve_day - 已消失檔案資料保存天數 (新增或修改檔案檢查)
+			signature_engine - 計算檔案簽章用的 SignatureEngine 物件，None 表示使用 md5
+			signature_cache_size - 檔案簽章快取容量 (筆)，0 表示不使用快取
+			dupcheck_prefilter - 重複檢查是否先比對檔案大小與取樣簽章 (見 test_file_duplication_staged())
+			commit_policy - 日誌模式與交易提交方式 (CommitPolicy 物件)，None 表示每次寫入都提交
+		"""
+		super(MetaStorage, self).__init__(meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine)
+
+		self.file_path = file_path
+		self.db = sqlite3.connect(file_path, timeout=60, check_same_thread=False)	#@UndefinedVariable
+
+		# {{{ day partitions
+		self._dupcheck_parts = _DayPartitions('DuplicateCheck',
+				"file_name TEXT NOT NULL, file_sig TEXT NOT NULL, first_contact_time DATETIME NOT NULL, last_contact_time DATETIME NOT NULL, lifetime_retain INTEGER NOT NULL, sig_algorithm TEXT NOT NULL, file_size INTEGER, sample_sig TEXT, file_path TEXT, file_mtime INTEGER, PRIMARY KEY (file_name, file_sig)",
+				(('fingerprint', 'file_name, file_size, sample_sig',),), True)
+		self._presence_parts = _DayPartitions('PresenceCheck',
+				"folder_id INTEGER NOT NULL, file_name TEXT NOT NULL, file_size INTEGER NOT NULL, file_mtime INTEGER NOT NULL, report_status INTEGER NOT NULL, first_contact_time DATETIME NOT NULL, last_contact_time DATETIME NOT NULL, PRIMARY KEY (folder_id, file_name)",
+				(('lastcontacttime', 'last_contact_time',),))
+		self._folder_ids = {}	# 資料夾字典快取: file_relfolder -> folder_id
+		self._maintenance_pool = None
+		if ':memory:' != file_path:	# 資料筆數由背景 worker 以另一個連線計算
+			self._maintenance_pool = workerpool.WorkerPool('meta-maintenance', 1)
+			self._maintenance_pool.start()
+		# }}} day partitions
+
+		# {{{ group commit
+		self.commit_policy = CommitPolicy() if (commit_policy is None) else commit_policy
+		self.commit_policy.apply_pragmas(self.db)
+		self._uncommitted_count = 0	# 尚未提交的寫入筆數 (同一連線讀取得到未提交的寫入，重複檢查結果不受影響)
+		self._uncommitted_tstamp = 0
+		# }}} group commit
+
 		self._prepare_database()
 		self._maintain_database()
+
+		if signature_cache_size > 0:
+			self.signature_cache = SignatureCache(self.db, signature_cache_size)
+
+		self.dupcheck_prefilter = dupcheck_prefilter
 	# ### __init__
 
 	def _prepare_database(self):
@@ -47,51 +854,262 @@ class MetaStorage(object):
 		"""
 		c = self.db.cursor()
 
-		c.execute("""CREATE TABLE IF NOT EXISTS DuplicateCheck(file_name TEXT NOT NULL, file_sig TEXT NOT NULL, first_contact_time DATETIME NOT NULL, last_contact_time DATETIME NOT NULL, lifetime_retain INTEGER NOT NULL, PRIMARY KEY (file_name, file_sig))""")
-		c.execute("""CREATE INDEX IF NOT EXISTS idx_DuplicateCheck_lifetime_retain ON DuplicateCheck(last_contact_time, lifetime_retain)""")
-		#c.execute("""CREATE INDEX IF NOT EXISTS idx_DuplicateCheck_last_contact_time ON """)
+		c.execute("""CREATE TABLE IF NOT EXISTS FolderDictionary(folder_id INTEGER PRIMARY KEY, file_relfolder TEXT NOT NULL UNIQUE)""")
+		c.execute("""CREATE TABLE IF NOT EXISTS ScanCheckpoint(name TEXT NOT NULL PRIMARY KEY, checkpoint BLOB NOT NULL, update_time INTEGER NOT NULL)""")
+		c.execute("""CREATE TABLE IF NOT EXISTS DirectorySignature(folder_id INTEGER PRIMARY KEY, dir_mtime REAL, dir_ctime REAL, entry_count INTEGER NOT NULL, subdirs TEXT NOT NULL, last_contact_time INTEGER NOT NULL)""")
 
-		c.execute("""CREATE TABLE IF NOT EXISTS PresenceCheck(file_relfolder TEXT NOT NULL, file_name TEXT NOT NULL, file_size INTEGER NOT NULL, file_mtime INTEGER NOT NULL, report_status INTEGER NOT NULL, first_contact_time DATETIME NOT NULL, last_contact_time DATETIME NOT NULL, PRIMARY KEY (file_relfolder, file_name))""")
-		c.execute("""CREATE INDEX IF NOT EXISTS idx_PresenceCheck_lastcontacttime ON PresenceCheck(last_contact_time)""")
-		#c.execute("""CREATE INDEX IF NOT EXISTS idx_PresenceCheck_lastcontacttime ON PresenceCheck(last_contact_time)""")
+		c.execute("""SELECT name FROM sqlite_master WHERE (type = 'table')""")
+		table_names = [str(r[0]) for r in c.fetchall()]
+
+		# {{{ 找出以資料夾路徑字串記錄的 PresenceCheck 資料表 (舊版資料庫)，改名後再搬到新的分割資料表
+		textfolder_tables = []
+		if 'PresenceCheck' in table_names:
+			textfolder_tables.append('PresenceCheck')
+		for table_name in table_names:
+			if not self._presence_parts.is_partition(table_name):
+				continue
+			c.execute("PRAGMA table_info(%s)" % (table_name,))
+			if 'file_relfolder' in [r[1] for r in c.fetchall()]:
+				self._presence_parts.drop_indexes(c, table_name)
+				c.execute("ALTER TABLE %s RENAME TO %s_textfolder" % (table_name, table_name,))
+				textfolder_tables.append(table_name + '_textfolder')
+		# }}} 找出以資料夾路徑字串記錄的 PresenceCheck 資料表
+
+		# {{{ 沒有檔案路徑欄位的 DuplicateCheck 分割資料表 (舊版資料庫)
+		for table_name in table_names:
+			if (not self._dupcheck_parts.is_partition(table_name)) and (table_name != self._dupcheck_parts.permanent_table):
+				continue
+			c.execute("PRAGMA table_info(%s)" % (table_name,))
+			if 'file_path' not in [r[1] for r in c.fetchall()]:
+				c.execute("ALTER TABLE %s ADD COLUMN file_path TEXT" % (table_name,))
+				c.execute("ALTER TABLE %s ADD COLUMN file_mtime INTEGER" % (table_name,))
+		# }}} 沒有檔案路徑欄位的 DuplicateCheck 分割資料表
+
+		self._dupcheck_parts.load(c)
+		self._presence_parts.load(c)
+
+		if 'DuplicateCheck' in table_names:	# 舊版資料庫: 未分割的資料表
+			c.execute("""PRAGMA table_info(DuplicateCheck)""")
+			dupcheck_columns = [r[1] for r in c.fetchall()]
+			if 'sig_algorithm' not in dupcheck_columns:	# 舊版資料庫: 簽章皆為 md5
+				c.execute("""ALTER TABLE DuplicateCheck ADD COLUMN sig_algorithm TEXT NOT NULL DEFAULT '%s'""" % (_DEFAULT_SIG_ALGORITHM,))
+			if 'file_size' not in dupcheck_columns:	# 舊版資料庫: 沒有大小與取樣簽章 (NULL)，重複檢查時一律比對完整簽章
+				c.execute("""ALTER TABLE DuplicateCheck ADD COLUMN file_size INTEGER""")
+				c.execute("""ALTER TABLE DuplicateCheck ADD COLUMN sample_sig TEXT""")
+			if 'file_path' not in dupcheck_columns:
+				c.execute("""ALTER TABLE DuplicateCheck ADD COLUMN file_path TEXT""")
+				c.execute("""ALTER TABLE DuplicateCheck ADD COLUMN file_mtime INTEGER""")
+			self._migrate_legacy_table(c, 'DuplicateCheck', self._dupcheck_parts, _DUPCHECK_COLUMNS, "(lifetime_retain != 0)")
+		for table_name in textfolder_tables:
+			c.execute("INSERT OR IGNORE INTO FolderDictionary(file_relfolder) SELECT DISTINCT file_relfolder FROM %s" % (table_name,))
+			self._migrate_legacy_table(c, table_name, self._presence_parts, _PRESENCE_COLUMNS,
+					select_columns='FolderDictionary.folder_id, file_name, file_size, file_mtime, report_status, first_contact_time, last_contact_time',
+					join_clause='INNER JOIN FolderDictionary USING (file_relfolder)')
 
 		c.close()
 		self.db.commit()
+
+		self._refresh_legacy_sig_algorithms()
 	# ### _prepare_database
 
+	def _migrate_legacy_table(self, c, legacy_table, partitions, columns, permanent_condition=None, select_columns=None, join_clause=''):
+		""" 將舊版資料表的紀錄依最後確認時間搬到分割資料表，並刪除舊版資料表
+
+		參數:
+			c - 資料庫 cursor
+			legacy_table - 舊版資料表名稱
+			partitions - _DayPartitions 物件
+			columns - 欄位串列字串
+			permanent_condition=None - 選出長期留存紀錄的條件，None 表示沒有長期留存紀錄
+			select_columns=None - 由舊版資料表選出對應 columns 的欄位串列字串，None 表示與 columns 相同
+			join_clause='' - 選出紀錄時要結合的資料表 (JOIN 子句)
+		回傳值: (無)
+		"""
+		if select_columns is None:
+			select_columns = columns
+		day_condition = "(1 = 1)"
+		if permanent_condition is not None:
+			c.execute("INSERT INTO %s(%s) SELECT %s FROM %s %s WHERE %s" % (partitions.permanent_table, columns, select_columns, legacy_table, join_clause, permanent_condition,))
+			day_condition = "(NOT %s)" % (permanent_condition,)
+		c.execute("SELECT DISTINCT CAST(last_contact_time / 86400 AS INTEGER) FROM %s WHERE %s" % (legacy_table, day_condition,))
+		for day_index in [int(r[0]) for r in c.fetchall()]:
+			table_name = partitions.table_for(c, day_index * 86400)
+			c.execute("INSERT INTO %s(%s) SELECT %s FROM %s %s WHERE %s AND (CAST(last_contact_time / 86400 AS INTEGER) = ?)" % (table_name, columns, select_columns, legacy_table, join_clause, day_condition,), (day_index,))
+		c.execute("DROP TABLE %s" % (legacy_table,))
+		syslog.syslog(syslog.LOG_INFO, "moved records of %s into day partitions" % (legacy_table,))
+	# ### def _migrate_legacy_table
+
+	def _refresh_legacy_sig_algorithms(self):
+		""" 找出資料庫中使用其他簽章演算法的紀錄，在這些紀錄過期前重複檢查也要比對這些演算法的簽章 """
+		c = self.db.cursor()
+		c.execute("""SELECT DISTINCT sig_algorithm FROM %s WHERE (sig_algorithm != ?)""" % (self._dupcheck_parts.view_name,), (self.signature_engine.algorithm,))
+		sig_algorithms = set([str(r[0]) for r in c.fetchall()])
+		self._legacy_sig_algorithms = [a for a in sorted(sig_algorithms) if (_get_digest_constructor(a) is not None)]
+		c.close()
+	# ### def _refresh_legacy_sig_algorithms
+
 	def _maintain_database(self):
-		""" 資料庫維護: 刪除過舊的資料 """
+		""" 資料庫維護: 刪除過舊的資料
+		過舊的資料以整個日分割資料表為單位刪除 (長期留存資料表不刪除)，
+		資料表中最後確認時間還在保存期限內的紀錄先搬到對應日期的分割資料表
+		"""
 
 		now_tstamp = time.time()
 		if (now_tstamp - self.lastmaintain) < 7200:	# 如果離上次資料維護很近，不進行維護作業
 			return
 		self.lastmaintain = now_tstamp
 
+		if self.signature_cache is not None:
+			self.signature_cache.flush()
+
 		c = self.db.cursor()
+		self._expire_partitions(c, self._dupcheck_parts, _DUPCHECK_COLUMNS, int(now_tstamp - self.meta_dupcheck_reserve_second))
+		self._expire_partitions(c, self._presence_parts, _PRESENCE_COLUMNS, int(now_tstamp - self.meta_missingfile_reserve_second))
+		c.close()
+		self._commit_now()
 
-		# 刪除過舊的重複性檢查資料
-		c.execute("""DELETE FROM DuplicateCheck WHERE ((CAST(strftime('%s', 'now') AS INTEGER) - ?) > last_contact_time) AND (lifetime_retain = 0)""",
-				(self.meta_dupcheck_reserve_second,))
+		self._refresh_legacy_sig_algorithms()
+	# ### _maintain_database
 
-		# 刪除過舊的新增或修改檔案檢查資料
-		c.execute("""DELETE FROM PresenceCheck WHERE (? > last_contact_time)""",
-				(int(now_tstamp - self.meta_missingfile_reserve_second),))
+	def _expire_partitions(self, c, partitions, columns, expire_tstamp):
+		""" (需在持有 lock 時呼叫) 刪除過期的日分割資料表，仍在保存期限內的紀錄先依最後確認時間搬到其他分割資料表
 
-		c.close()
-		self.db.commit()
-	# ### _maintain_database
+		參數:
+			c - 資料庫 cursor
+			partitions - _DayPartitions 物件
+			columns - 欄位串列字串
+			expire_tstamp - 最後確認時間早於此時戳的紀錄會被刪除
+		回傳值: (無)
+		"""
+		for table_name in partitions.find_expired(expire_tstamp):
+			drop_tstamp = time.time()
+			c.execute("SELECT DISTINCT CAST(last_contact_time / 86400 AS INTEGER) FROM %s WHERE (last_contact_time >= ?)" % (table_name,), (expire_tstamp,))
+			for day_index in [int(r[0]) for r in c.fetchall()]:
+				dst_table = partitions.table_for(c, day_index * 86400)
+				c.execute("INSERT INTO %s(%s) SELECT %s FROM %s WHERE (last_contact_time >= ?) AND (CAST(last_contact_time / 86400 AS INTEGER) = ?)" % (dst_table, columns, columns, table_name,), (expire_tstamp, day_index,))
+			partitions.detach(c, table_name)
+			c.execute("DROP TABLE IF EXISTS %s" % (table_name,))
+			self._commit_now()
+			syslog.syslog(syslog.LOG_INFO, "dropped expired meta partition %s (%.3fs)" % (table_name, time.time() - drop_tstamp,))
+	# ### def _expire_partitions
+
+	def _get_folder_id(self, c, file_relfolder, create=False):
+		""" (需在持有 lock 時呼叫) 由資料夾字典取得資料夾代碼
+
+		參數:
+			c - 資料庫 cursor
+			file_relfolder - 檔案所在相對路徑
+			create=False - 資料夾不在字典中時是否新增
+		回傳值:
+			資料夾代碼，資料夾不在字典中且不新增時為 None
+		"""
+		folder_id = self._folder_ids.get(file_relfolder)
+		if folder_id is not None:
+			return folder_id
+		c.execute("""SELECT folder_id FROM FolderDictionary WHERE (file_relfolder = ?)""", (file_relfolder,))
+		r = c.fetchone()
+		if r is not None:
+			folder_id = int(r[0])
+		elif create:
+			c.execute("""INSERT INTO FolderDictionary(file_relfolder) VALUES(?)""", (file_relfolder,))
+			folder_id = c.lastrowid
+		else:
+			return None
+		self._folder_ids[file_relfolder] = folder_id
+		return folder_id
+	# ### def _get_folder_id
+
+	def _locate_row(self, c, partitions, where_clause, where_args):
+		""" (需在持有 lock 時呼叫) 經由檢視表找出含有符合條件紀錄的分割資料表
+
+		參數:
+			c - 資料庫 cursor
+			partitions - _DayPartitions 物件
+			where_clause - 選出紀錄的條件
+			where_args - 條件參數 tuple
+		回傳值:
+			資料表名稱，沒有符合條件的紀錄時為 None
+		"""
+		c.execute("SELECT partition_name FROM %s WHERE %s LIMIT 1" % (partitions.view_name, where_clause,), where_args)
+		r = c.fetchone()
+		if r is None:
+			return None
+		return str(r[0])
+	# ### def _locate_row
 
 	def close(self):
-		self.db.close()
+		with self._lock:
+			self._close_impl()
+		if self._maintenance_pool is not None:
+			self._maintenance_pool.stop()	# 等待背景計算資料筆數完畢
+			self._maintenance_pool = None
 	# ### close
 
-	def test_file_duplication_and_checkin(self, file_name, file_sig, lifetime_retain=False):
+	def _commit_now(self):
+		""" (需在持有 lock 時呼叫) 立即提交交易 """
+		self.db.commit()
+		self._uncommitted_count = 0
+		self.commit_count = self.commit_count + 1
+	# ### def _commit_now
+
+	def _group_commit(self):
+		""" (需在持有 lock 時呼叫) 累積一筆寫入，累積筆數或等待時間達到門檻時才提交交易 """
+		self._uncommitted_count = self._uncommitted_count + 1
+		if 1 == self._uncommitted_count:
+			self._uncommitted_tstamp = time.time()
+		if (self._uncommitted_count >= self.commit_policy.batch_size) or ((time.time() - self._uncommitted_tstamp) >= self.commit_policy.interval):
+			self._commit_now()
+	# ### def _group_commit
+
+	def flush(self, blocking=True):
+		""" 提交累積的寫入
+
+		參數:
+			blocking=True - 是否等待資料庫存取鎖，False 時資料庫忙碌則不提交 (由主迴圈呼叫時使用)
+		回傳值:
+			True - 已無累積的寫入
+			False - 資料庫忙碌，未提交
+		"""
+		if not self._lock.acquire(blocking):
+			return False
+		try:
+			if self._uncommitted_count > 0:
+				self._commit_now()
+		finally:
+			self._lock.release()
+		return True
+	# ### def flush
+
+	def flush_if_due(self):
+		""" 累積的寫入已等待超過提交間隔時提交 (不等待資料庫存取鎖，由主迴圈定期呼叫) """
+		if (self._uncommitted_count > 0) and ((time.time() - self._uncommitted_tstamp) >= self.commit_policy.interval):
+			self.flush(False)
+	# ### def flush_if_due
+
+	def get_flush_interval(self):
+		if self.commit_policy.batch_size > 1:
+			return self.commit_policy.interval
+		return None
+	# ### def get_flush_interval
+
+	def _close_impl(self):
+		if self.signature_cache is not None:
+			self.signature_cache.flush()
+		self._commit_now()
+		self.db.close()
+	# ### def _close_impl
+
+	@_serialized_access
+	def test_file_duplication_and_checkin(self, file_name, file_sig, lifetime_retain=False, legacy_file_sigs=None, file_size=None, sample_sig=None):
 		""" 檢查檔案是不是重複，並在是新檔案時新增相關紀錄
 
 		參數:
 			file_name - 檔案名稱
-			file_sig - 檔案簽章
+			file_sig - 檔案簽章 (以 signature_engine.algorithm 計算)
 			lifetime_retain - 檔案紀錄是否長期留存不納入 maintain/purge 作業
+			legacy_file_sigs=None - 以其他演算法計算的簽章字典 (演算法名稱為鍵)，用於比對更換演算法前的紀錄
+			file_size=None - 檔案大小 (新增紀錄時一併儲存，供 test_file_duplication_staged() 使用)
+			sample_sig=None - 取樣簽章 (同上)
 		回傳值:
 			True - File is duplicated
 			False - File is not duplicated
@@ -99,27 +1117,175 @@ class MetaStorage(object):
 		self._maintain_database()
 
 		result = False
+		now_tstamp = int(time.time())
 
 		c = self.db.cursor()
 
-		c.execute("""SELECT COUNT(*) FROM DuplicateCheck WHERE (file_name = ?) AND (file_sig = ?)""", (file_name, file_sig,))
-		r = c.fetchone()
-		if int(r[0]) == 0:
+		src_table = self._locate_row(c, self._dupcheck_parts, "(file_name = ?) AND (file_sig = ?)", (file_name, file_sig,))
+		if src_table is None:
 			if lifetime_retain:
 				lifetime_retain = 1
 			else:
 				lifetime_retain = 0
 
-			c.execute("""INSERT INTO DuplicateCheck(file_name, file_sig, first_contact_time, last_contact_time, lifetime_retain) VALUES(?, ?, CAST(strftime('%s', 'now') AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER), ?)""", (file_name, file_sig, lifetime_retain,))
+			# {{{ 比對以其他演算法記錄的簽章
+			if legacy_file_sigs:
+				for sig_algorithm, legacy_sig, in legacy_file_sigs.iteritems():
+					if self._locate_row(c, self._dupcheck_parts, "(file_name = ?) AND (file_sig = ?) AND (sig_algorithm = ?)", (file_name, legacy_sig, sig_algorithm,)) is not None:
+						result = True
+						break
+			# }}} 比對以其他演算法記錄的簽章
+
+			table_name = self._dupcheck_parts.table_for(c, now_tstamp, lifetime_retain)
+			c.execute("""INSERT INTO %s(%s) VALUES(?, ?, ?, ?, ?, ?, ?, ?, NULL, NULL)""" % (table_name, _DUPCHECK_COLUMNS,), (file_name, file_sig, now_tstamp, now_tstamp, lifetime_retain, self.signature_engine.algorithm, file_size, sample_sig,))
 		else:
-			c.execute("""UPDATE DuplicateCheck SET last_contact_time=CAST(strftime('%s', 'now') AS INTEGER) WHERE (file_name = ?) AND (file_sig = ?)""", (file_name, file_sig,))
+			c.execute("""UPDATE %s SET last_contact_time=? WHERE (file_name = ?) AND (file_sig = ?)""" % (src_table,), (now_tstamp, file_name, file_sig,))
 			result = True
 		c.close()
-		self.db.commit()
+		self._group_commit()
 
 		return result
 	# ### test_file_duplication_and_checkin
 
+	def _resolve_sample_row(self, file_name, row_sig, stored_path, stored_mtime, file_size):
+		""" 計算只以大小與取樣簽章記錄的紀錄的完整簽章 (有新檔案的大小與取樣簽章和紀錄相同時才呼叫)
+		紀錄的檔案仍在原路徑且沒有變動 (大小與修改時間相同) 時讀取該檔案計算完整簽章並取代紀錄的簽章，
+		否則無法得知紀錄的完整簽章，將紀錄標示為無法驗證 (清除檔案路徑，之後不再嘗試計算，也不會被判定為重複)
+
+		參數:
+			file_name - 檔案名稱 (比對用的標籤)
+			row_sig - 紀錄的簽章 (_SAMPLE_SIG_PREFIX 開頭)
+			stored_path - 紀錄的檔案路徑
+			stored_mtime - 紀錄的檔案修改時戳 (奈秒)
+			file_size - 紀錄的檔案大小
+		回傳值: (無)
+		"""
+		file_sig = None
+		try:
+			with open(stored_path, 'rb') as f:
+				stat_key = _get_stat_key(os.fstat(f.fileno()))
+				if (stat_key[2] == file_size) and (stat_key[3] == stored_mtime):
+					computed_sig = self._compute_file_signatures_from_file(f, (self.signature_engine.algorithm,))[self.signature_engine.algorithm]
+					if _get_stat_key(os.fstat(f.fileno())) == stat_key:	# 計算期間檔案沒有變動
+						file_sig = computed_sig
+		except (IOError, OSError,):
+			pass
+		with self._lock:
+			c = self.db.cursor()
+			table_name = self._locate_row(c, self._dupcheck_parts, "(file_name = ?) AND (file_sig = ?)", (file_name, row_sig,))
+			if table_name is None:	# 其他執行緒已處理
+				pass
+			elif file_sig is None:
+				c.execute("""UPDATE %s SET file_path=NULL, file_mtime=NULL WHERE (file_name = ?) AND (file_sig = ?)""" % (table_name,), (file_name, row_sig,))
+				syslog.syslog(syslog.LOG_INFO, "cannot verify duplicate-check record of %r: file %r changed or removed" % (file_name, stored_path,))
+			elif self._locate_row(c, self._dupcheck_parts, "(file_name = ?) AND (file_sig = ?)", (file_name, file_sig,)) is not None:	# 已有相同內容的紀錄
+				c.execute("""DELETE FROM %s WHERE (file_name = ?) AND (file_sig = ?)""" % (table_name,), (file_name, row_sig,))
+			else:
+				c.execute("""UPDATE %s SET file_sig=?, file_path=NULL, file_mtime=NULL WHERE (file_name = ?) AND (file_sig = ?)""" % (table_name,), (file_sig, file_name, row_sig,))
+			c.close()
+			self._group_commit()
+	# ### def _resolve_sample_row
+
+	def test_file_duplication_staged(self, file_name, filepath, lifetime_retain=False):
+		""" 分階段檢查檔案是不是重複，並在是新檔案時新增相關紀錄
+		先以檔案大小及取樣簽章 (開頭、中間、結尾各一段資料) 篩選既有紀錄，
+		沒有相符的紀錄時以大小與取樣簽章為鍵記錄為新檔案 (連同檔案路徑與修改時間)，不計算完整簽章；
+		有相符的紀錄 (或是沒有大小資訊的舊紀錄) 時才計算新檔案的完整簽章比對，
+		相符的紀錄也還沒有完整簽章時，由紀錄的檔案路徑計算 (見 _resolve_sample_row())。
+		已有現成的完整簽章 (監視器即時計算或是簽章快取) 時直接以完整簽章比對及記錄
+
+		參數:
+			file_name - 檔案名稱 (比對用的標籤)
+			filepath - 檔案路徑
+			lifetime_retain - 檔案紀錄是否長期留存不納入 maintain/purge 作業
+		回傳值:
+			(is_duplicated, file_sig) 形式的 tuple，file_sig 在沒有計算完整簽章時為 None
+		"""
+		with open(filepath, 'rb') as f:
+			stat_key = _get_stat_key(os.fstat(f.fileno()))
+			file_size = stat_key[2]
+			sample_sig = compute_sample_signature(f, file_size)
+			f_sigs = self._lookup_known_signatures(f)
+			with self._lock:
+				self._maintain_database()
+				c = self.db.cursor()
+				c.execute("""SELECT file_sig, file_path, file_mtime FROM %s WHERE (file_name = ?) AND ((file_size IS NULL) OR ((file_size = ?) AND ((sample_sig IS NULL) OR (sample_sig = ?))))""" % (self._dupcheck_parts.view_name,), (file_name, file_size, sample_sig,))
+				candidates = c.fetchall()
+				if (len(candidates) == 0) and (f_sigs is None):
+					now_tstamp = int(time.time())
+					table_name = self._dupcheck_parts.table_for(c, now_tstamp, lifetime_retain)
+					c.execute("""INSERT INTO %s(%s) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""" % (table_name, _DUPCHECK_COLUMNS,),
+							(file_name, "%s%d:%s" % (_SAMPLE_SIG_PREFIX, file_size, sample_sig,), now_tstamp, now_tstamp, 1 if lifetime_retain else 0, self.signature_engine.algorithm, file_size, sample_sig, os.path.abspath(filepath), stat_key[3],))
+					c.close()
+					self._group_commit()
+					return (False, None,)
+				c.close()
+			# 計算相符紀錄的完整簽章 (不持有 lock)
+			for row_sig, stored_path, stored_mtime, in candidates:
+				if row_sig.startswith(_SAMPLE_SIG_PREFIX) and (stored_path is not None):
+					self._resolve_sample_row(file_name, row_sig, stored_path, stored_mtime, file_size)
+			if f_sigs is None:
+				f_sigs = self._compute_file_signatures_from_file(f)
+		f_sig = f_sigs.pop(self.signature_engine.algorithm)
+		return (self.test_file_duplication_and_checkin(file_name, f_sig, lifetime_retain, f_sigs, file_size, sample_sig), f_sig,)
+	# ### def test_file_duplication_staged
+
+	def _get_row_count_tables(self):
+		""" 取得要計算筆數的資料表，分割資料表依原本的資料表名稱合計 """
+		table_groups = [('DuplicateCheck', self._dupcheck_parts.tables(),), ('PresenceCheck', self._presence_parts.tables(),), ('FolderDictionary', ('FolderDictionary',),), ('DirectorySignature', ('DirectorySignature',),),]
+		if self.signature_cache is not None:
+			table_groups.append(('SignatureCache', ('SignatureCache',),))
+		return table_groups
+	# ### def _get_row_count_tables
+
+	def _store_row_counts(self, pending_call):
+		""" (在背景 worker 中執行) 保存背景查詢的資料筆數 """
+		if pending_call.exc_info is not None:
+			syslog.syslog(syslog.LOG_WARNING, "cannot count meta rows: %s" % (pending_call.exc_info[1],))
+		else:
+			self._row_counts = pending_call.result
+		self._row_counts_refreshing = False
+	# ### def _store_row_counts
+
+	def get_row_counts(self, max_age=30):
+		""" 取得各資料表的資料筆數 (分割資料表合計)
+		只傳回上次查詢的結果: 距上次查詢超過 max_age 秒時由背景 worker 以另一個連線重新查詢，
+		大型資料表的 COUNT(*) 不會佔用主迴圈 (查詢期間未提交的寫入不會被計入)。
+		記憶體資料庫無法由其他連線存取，改為在不需等待資料庫存取鎖時直接查詢
+
+		參數:
+			max_age=30 - 查詢結果的快取時間 (秒)
+		回傳值:
+			以資料表名稱為鍵、資料筆數為值的字典
+		"""
+		now_tstamp = time.time()
+		if ((now_tstamp - self._row_counts_tstamp) < max_age) or self._row_counts_refreshing:
+			return self._row_counts
+		if self._maintenance_pool is not None:
+			self._row_counts_refreshing = True
+			self._row_counts_tstamp = now_tstamp
+			self._maintenance_pool.submit(_count_table_rows, (self.file_path, self._get_row_count_tables(),), self._store_row_counts)
+			return self._row_counts
+		if not self._lock.acquire(False):
+			return self._row_counts
+		try:
+			result = {}
+			c = self.db.cursor()
+			for name, table_names, in self._get_row_count_tables():
+				row_count = 0
+				for table_name in table_names:
+					c.execute("SELECT COUNT(*) FROM %s" % (table_name,))
+					row_count = row_count + int(c.fetchone()[0])
+				result[name] = row_count
+			c.close()
+			self._row_counts = result
+			self._row_counts_tstamp = now_tstamp
+		finally:
+			self._lock.release()
+		return self._row_counts
+	# ### def get_row_counts
+
+	@_serialized_access
 	def test_file_presence_and_checkin(self, file_relfolder, file_name, file_size, file_mtime, tstamp=None):
 		""" 檢查檔案是不是已經存在，並新增或更新相關紀錄，並傳回檔案是新檔或是有變更等資訊
 
@@ -146,48 +1312,76 @@ class MetaStorage(object):
 
 		c = self.db.cursor()
 
-		c.execute("""SELECT file_size, file_mtime, report_status FROM PresenceCheck WHERE (file_relfolder = ?) AND (file_name = ?)""", (file_relfolder, file_name,))
+		folder_id = self._get_folder_id(c, file_relfolder, True)
+		c.execute("""SELECT file_size, file_mtime, report_status, partition_name FROM %s WHERE (folder_id = ?) AND (file_name = ?)""" % (self._presence_parts.view_name,), (folder_id, file_name,))
 		r = c.fetchone()
 		if r is None:
-			c.execute("""INSERT INTO PresenceCheck(file_relfolder, file_name, file_size, file_mtime, report_status, first_contact_time, last_contact_time) VALUES(?, ?, ?, ?, ?, ?, ?)""", (file_relfolder, file_name, file_size, file_mtime, _MSTORAGE_FRESH, tstamp, tstamp,))
+			table_name = self._presence_parts.table_for(c, tstamp)
+			c.execute("""INSERT INTO %s(%s) VALUES(?, ?, ?, ?, ?, ?, ?)""" % (table_name, _PRESENCE_COLUMNS,), (folder_id, file_name, file_size, file_mtime, _MSTORAGE_FRESH, tstamp, tstamp,))
 			result_status = FPCHK_FRESH
 		else:
-			meta_size = int(r[0])
-			meta_mtime = r[1]
-			meta_repstatus = int(r[2])
-
-			new_repstatus = meta_repstatus
-
-			# {{{ caculate new rep-status and return message
-			if (meta_size == file_size) and (meta_mtime == file_mtime):
-				if _MSTORAGE_FRESH == meta_repstatus:
-					new_repstatus = _MSTORAGE_EXISTED
-					result_status = FPCHK_NEW
-				elif _MSTORAGE_EXISTED == meta_repstatus:
-					new_repstatus = _MSTORAGE_EXISTED	# no change
-					result_status = FPCHK_STABLE
-				elif _MSTORAGE_MODIFING == meta_repstatus:
-					new_repstatus = _MSTORAGE_EXISTED
-					result_status = FPCHK_MODIFIED
-			else:
-				if _MSTORAGE_FRESH == meta_repstatus:
-					new_repstatus = _MSTORAGE_FRESH	# no change
-					result_status = FPCHK_FRESH
-				elif _MSTORAGE_EXISTED == meta_repstatus:
-					new_repstatus = _MSTORAGE_MODIFING
-					result_status = FPCHK_MODIFING
-				elif _MSTORAGE_MODIFING == meta_repstatus:
-					new_repstatus = _MSTORAGE_MODIFING	# no change
-					result_status = FPCHK_MODIFING
-			# }}} caculate new rep-status and return message
-
-			c.execute("""UPDATE PresenceCheck SET file_size=?, file_mtime=?, report_status=?, last_contact_time=? WHERE (file_relfolder = ?) AND (file_name = ?)""", (file_size, file_mtime, new_repstatus, tstamp, file_relfolder, file_name,))
+			new_repstatus, result_status, = _compute_presence_transition(int(r[0]), r[1], int(r[2]), file_size, file_mtime)
+			c.execute("""UPDATE %s SET file_size=?, file_mtime=?, report_status=?, last_contact_time=? WHERE (folder_id = ?) AND (file_name = ?)""" % (r[3],), (file_size, file_mtime, new_repstatus, tstamp, folder_id, file_name,))
 		c.close()
-		self.db.commit()
+		self._group_commit()
 
 		return result_status
 	# ### test_file_presence_and_checkin
+
+	@_serialized_access
+	def test_folder_presence_and_checkin(self, file_relfolder, file_stats, tstamp=None):
+		""" 一次檢查同一資料夾內多個檔案是不是已經存在，並在同一個交易中新增或更新相關紀錄
+		結果與對每個檔案呼叫 test_file_presence_and_checkin() 相同
+
+		參數:
+			file_relfolder - 檔案所在相對路徑
+			file_stats - 含有 (檔案名稱, 檔案大小, 檔案修改時戳) tuple 的串列
+			tstamp - 檢查時戳
+		回傳值:
+			與 file_stats 順序相同的 FPCHK_* 串列
+		"""
+		self._maintain_database()
+
+		if tstamp is None:
+			tstamp = int(time.time())
+
+		c = self.db.cursor()
+
+		folder_id = self._get_folder_id(c, file_relfolder, True)
+		dst_table = self._presence_parts.table_for(c, tstamp)	# 新紀錄存放的分割資料表
+		meta_rows = {}
+		c.execute("""SELECT file_name, file_size, file_mtime, report_status, partition_name FROM %s WHERE (folder_id = ?)""" % (self._presence_parts.view_name,), (folder_id,))
+		for r in c.fetchall():
+			meta_rows[r[0]] = (int(r[1]), r[2], int(r[3]), str(r[4]),)
+
+		result = []
+		to_insert = []
+		to_update = {}	# 分割資料表 -> 要更新的紀錄串列 (紀錄留在原本的分割資料表)
+		for file_name, file_size, file_mtime, in file_stats:
+			file_size = int(file_size)
+			file_mtime = int(file_mtime)
+			r = meta_rows.get(file_name)
+			if r is None:
+				to_insert.append((folder_id, file_name, file_size, file_mtime, _MSTORAGE_FRESH, tstamp, tstamp,))
+				meta_rows[file_name] = (file_size, file_mtime, _MSTORAGE_FRESH, dst_table,)	# 同名檔案重複出現時與逐一檢查的結果一致
+				result.append(FPCHK_FRESH)
+			else:
+				new_repstatus, result_status, = _compute_presence_transition(r[0], r[1], r[2], file_size, file_mtime)
+				to_update.setdefault(r[3], []).append((file_size, file_mtime, new_repstatus, tstamp, folder_id, file_name,))
+				meta_rows[file_name] = (file_size, file_mtime, new_repstatus, r[3],)
+				result.append(result_status)
+
+		if len(to_insert) > 0:
+			c.executemany("""INSERT INTO %s(%s) VALUES(?, ?, ?, ?, ?, ?, ?)""" % (dst_table, _PRESENCE_COLUMNS,), to_insert)
+		for table_name, update_rows, in to_update.iteritems():
+			c.executemany("""UPDATE %s SET file_size=?, file_mtime=?, report_status=?, last_contact_time=? WHERE (folder_id = ?) AND (file_name = ?)""" % (table_name,), update_rows)
+		c.close()
+		self._group_commit()
+
+		return result
+	# ### def test_folder_presence_and_checkin
 	
+	@_serialized_access
 	def test_file_deletion_and_purge(self, tstamp=None):
 		""" 傳回已刪除檔案的串列
 		
@@ -203,43 +1397,535 @@ class MetaStorage(object):
 
 		c = self.db.cursor()
 
-		c.execute("""SELECT file_relfolder, file_name FROM PresenceCheck WHERE (last_contact_time < ?)""", (tstamp,))
-		r = c.fetchone()
-		while r is not None:
-			deleted_file.append( (r[0], r[1],) )
+		for table_name in self._presence_parts.tables():
+			c.execute("""SELECT FolderDictionary.file_relfolder, file_name FROM %s INNER JOIN FolderDictionary USING (folder_id) WHERE (last_contact_time < ?)""" % (table_name,), (tstamp,))
 			r = c.fetchone()
-		c.execute("""DELETE FROM PresenceCheck WHERE (last_contact_time < ?)""", (tstamp,))
+			while r is not None:
+				deleted_file.append( (r[0], r[1],) )
+				r = c.fetchone()
+			c.execute("""DELETE FROM %s WHERE (last_contact_time < ?)""" % (table_name,), (tstamp,))
+		c.execute("""DELETE FROM DirectorySignature WHERE (last_contact_time < ?)""", (tstamp,))
 
 		c.close()
-		self.db.commit()
+		self._group_commit()
 
 		return deleted_file
 	# ### def test_file_deletion_and_purge
+
+	@_serialized_access
+	def get_folder_signature(self, file_relfolder):
+		""" 取得資料夾上次列出內容時記錄的簽章
+
+		參數:
+			file_relfolder - 資料夾相對路徑
+		回傳值:
+			(dir_mtime, dir_ctime, entry_count, subdirs) 形式的 tuple，subdirs 為子資料夾名稱 tuple；沒有紀錄時為 None
+		"""
+		c = self.db.cursor()
+		result = None
+		folder_id = self._get_folder_id(c, file_relfolder)
+		if folder_id is not None:
+			c.execute("""SELECT dir_mtime, dir_ctime, entry_count, subdirs FROM DirectorySignature WHERE (folder_id = ?)""", (folder_id,))
+			r = c.fetchone()
+			if r is not None:
+				result = (r[0], r[1], int(r[2]), tuple(r[3].split('/')) if r[3] else (),)
+		c.close()
+		return result
+	# ### def get_folder_signature
+
+	@_serialized_access
+	def checkin_folder_signature(self, file_relfolder, dir_mtime, dir_ctime, entry_count, subdirs, tstamp=None):
+		""" 記錄資料夾簽章，並更新最後確認時間
+
+		參數:
+			file_relfolder - 資料夾相對路徑
+			dir_mtime - 資料夾修改時戳，None 表示簽章不可信任 (下次必須重新列出內容)
+			dir_ctime - 資料夾狀態變更時戳
+			entry_count - 資料夾中的項目數量
+			subdirs - 子資料夾名稱串列
+			tstamp - 檢查時戳
+		回傳值:
+			(無)
+		"""
+		if tstamp is None:
+			tstamp = int(time.time())
+		c = self.db.cursor()
+		folder_id = self._get_folder_id(c, file_relfolder, True)
+		c.execute("""INSERT OR REPLACE INTO DirectorySignature(folder_id, dir_mtime, dir_ctime, entry_count, subdirs, last_contact_time) VALUES(?, ?, ?, ?, ?, ?)""", (folder_id, dir_mtime, dir_ctime, entry_count, '/'.join(subdirs), tstamp,))
+		c.close()
+		self._group_commit()
+	# ### def checkin_folder_signature
+
+	@_serialized_access
+	def get_unsettled_files(self, file_relfolder):
+		""" 取得資料夾中尚在新增或修改中 (還沒有回報為新檔案或已修改) 的檔案名稱
+
+		參數:
+			file_relfolder - 資料夾相對路徑
+		回傳值:
+			檔案名稱串列
+		"""
+		c = self.db.cursor()
+		result = []
+		folder_id = self._get_folder_id(c, file_relfolder)
+		if folder_id is not None:
+			c.execute("""SELECT file_name FROM %s WHERE (folder_id = ?) AND (report_status IN (?, ?))""" % (self._presence_parts.view_name,), (folder_id, _MSTORAGE_FRESH, _MSTORAGE_MODIFING,))
+			result = [r[0] for r in c.fetchall()]
+		c.close()
+		return result
+	# ### def get_unsettled_files
+
+	@_serialized_access
+	def refresh_folder_presence(self, file_relfolder, tstamp, skip_names=()):
+		""" 更新資料夾中檔案存在紀錄的最後確認時間 (不檢查檔案，用於內容沒有變動的資料夾)
+
+		參數:
+			file_relfolder - 資料夾相對路徑
+			tstamp - 檢查時戳
+			skip_names=() - 不更新的檔案名稱 (另外檢查過的檔案)
+		回傳值:
+			(無)
+		"""
+		c = self.db.cursor()
+		folder_id = self._get_folder_id(c, file_relfolder)
+		if folder_id is not None:
+			skip_names = set(skip_names)
+			to_update = {}	# 分割資料表 -> 要更新的紀錄串列
+			c.execute("""SELECT file_name, partition_name FROM %s WHERE (folder_id = ?)""" % (self._presence_parts.view_name,), (folder_id,))
+			for r in c.fetchall():
+				if r[0] not in skip_names:
+					to_update.setdefault(str(r[1]), []).append((tstamp, folder_id, r[0],))
+			for table_name, update_rows, in to_update.iteritems():
+				c.executemany("""UPDATE %s SET last_contact_time=? WHERE (folder_id = ?) AND (file_name = ?)""" % (table_name,), update_rows)
+			self._group_commit()
+		c.close()
+	# ### def refresh_folder_presence
+
+	@_serialized_access
+	def load_scan_checkpoint(self, name):
+		""" 讀取掃描檢查點
+
+		參數:
+			name - 檢查點名稱
+		回傳值:
+			save_scan_checkpoint() 存入的物件，沒有檢查點或無法讀取時為 None
+		"""
+		c = self.db.cursor()
+		c.execute("""SELECT checkpoint FROM ScanCheckpoint WHERE (name = ?)""", (name,))
+		r = c.fetchone()
+		c.close()
+		if r is None:
+			return None
+		try:
+			return cPickle.loads(str(r[0]))
+		except Exception as e:
+			syslog.syslog(syslog.LOG_WARNING, "cannot load scan checkpoint [%s]: %s" % (name, e,))
+		return None
+	# ### def load_scan_checkpoint
+
+	@_serialized_access
+	def save_scan_checkpoint(self, name, checkpoint):
+		""" 儲存掃描檢查點並立即提交交易
+
+		參數:
+			name - 檢查點名稱
+			checkpoint - 要儲存的物件 (可 pickle)，None 表示清除檢查點
+		回傳值:
+			(無)
+		"""
+		c = self.db.cursor()
+		if checkpoint is None:
+			c.execute("""DELETE FROM ScanCheckpoint WHERE (name = ?)""", (name,))
+		else:
+			c.execute("""INSERT OR REPLACE INTO ScanCheckpoint(name, checkpoint, update_time) VALUES(?, ?, ?)""", (name, sqlite3.Binary(cPickle.dumps(checkpoint, cPickle.HIGHEST_PROTOCOL)), int(time.time()),))
+		c.close()
+		self._commit_now()
+	# ### def save_scan_checkpoint
 # ### MetaStorage
 
 
+class MemoryMetaStorage(MetaStorageBackend):
+	""" 儲存 Meta 資料在記憶體中的資料庫物件，定期將快照寫入檔案，啟動時由快照還原
+	重複檢查以 (檔名, 簽章) 為鍵、檔案存在檢查以資料夾與檔名為鍵的 dict 查找，不需要任何 I/O；
+	程式異常結束時遺失最後一次快照之後的紀錄
+	"""
+
+	def __init__(self, file_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine=None, snapshot_interval=300):
+		""" 建構子
+		參數:
+			file_path - 快照檔案路徑
+			meta_dupcheck_reserve_day - 重複檔案資料保存天數 (重複性檢查)
+			meta_missingfile_reserve_day - 已消失檔案資料保存天數 (新增或修改檔案檢查)
+			signature_engine - 計算檔案簽章用的 SignatureEngine 物件，None 表示使用 md5
+			snapshot_interval - 有變動時寫入快照的間隔 (秒)
+		"""
+		super(MemoryMetaStorage, self).__init__(meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine)
+
+		self.file_path = file_path
+		self.snapshot_interval = max(float(snapshot_interval), 1.0)
+
+		self._dupcheck = {}	# (file_name, file_sig) -> (first_contact_time, last_contact_time, lifetime_retain, sig_algorithm)
+		self._presence = {}	# file_relfolder -> {file_name: (file_size, file_mtime, report_status, first_contact_time, last_contact_time)}
+		self._presence_count = 0
+		self._dirsig = {}	# file_relfolder -> (dir_mtime, dir_ctime, entry_count, subdirs, last_contact_time)
+		self._checkpoints = {}	# 掃描檢查點名稱 -> 檢查點物件
+
+		self._dirty = False
+		self._snapshot_tstamp = time.time()
+		self._snapshot_lock = threading.Lock()	# 避免同時寫入快照檔
+
+		self._load_snapshot()
+		self._refresh_legacy_sig_algorithms()
+	# ### __init__
+
+	def _load_snapshot(self):
+		""" 由快照檔還原紀錄
+		檔案不是可讀取的快照時 (例如 sqlite 實作的資料庫檔) 先將其更名保留再以空的資料庫開始，
+		無法更名時丟出例外，避免之後寫入快照時覆蓋掉該檔案
+		"""
+		if not os.path.exists(self.file_path):
+			return
+		try:
+			with open(self.file_path, 'rb') as fp:
+				snapshot = cPickle.load(fp)
+			if (not isinstance(snapshot, dict)) or (_SNAPSHOT_FORMAT_VERSION != snapshot.get('version')):
+				raise ValueError("not a meta snapshot of version %r" % (_SNAPSHOT_FORMAT_VERSION,))
+			self._dupcheck = snapshot['dupcheck']
+			self._presence = snapshot['presence']
+			self._dirsig = snapshot.get('dirsig', {})
+			self._checkpoints = snapshot.get('checkpoints', {})
+		except Exception as e:
+			invalid_path = "%s.invalid-%d" % (self.file_path, int(time.time()),)
+			os.rename(self.file_path, invalid_path)
+			syslog.syslog(syslog.LOG_WARNING, "cannot load meta snapshot [%s], moved to [%s] and start with empty storage: %s" % (self.file_path, invalid_path, e,))
+			self._dupcheck = {}
+			self._presence = {}
+			self._dirsig = {}
+			self._checkpoints = {}
+		self._presence_count = sum([len(v) for v in self._presence.itervalues()])
+		syslog.syslog(syslog.LOG_INFO, "loaded meta snapshot [%s] (duplicate-check=%d, presence-check=%d)" % (self.file_path, len(self._dupcheck), self._presence_count,))
+	# ### def _load_snapshot
+
+	def _refresh_legacy_sig_algorithms(self):
+		algorithms = set([r[3] for r in self._dupcheck.itervalues()])
+		algorithms.discard(self.signature_engine.algorithm)
+		self._legacy_sig_algorithms = [a for a in algorithms if (_get_digest_constructor(a) is not None)]
+	# ### def _refresh_legacy_sig_algorithms
+
+	def _maintain_database(self):
+		""" (需在持有 lock 時呼叫) 資料維護: 刪除過舊的資料 """
+		now_tstamp = time.time()
+		if (now_tstamp - self.lastmaintain) < 7200:	# 如果離上次資料維護很近，不進行維護作業
+			return
+		self.lastmaintain = now_tstamp
+
+		# 刪除過舊的重複性檢查資料
+		expire_tstamp = int(now_tstamp) - self.meta_dupcheck_reserve_second
+		for k in [k for k, r, in self._dupcheck.iteritems() if ((r[1] < expire_tstamp) and (0 == r[2]))]:
+			del self._dupcheck[k]
+
+		# 刪除過舊的新增或修改檔案檢查資料
+		expire_tstamp = int(now_tstamp - self.meta_missingfile_reserve_second)
+		self._purge_presence(expire_tstamp)
+
+		self._dirty = True
+		self._refresh_legacy_sig_algorithms()
+	# ### def _maintain_database
+
+	def _purge_presence(self, tstamp):
+		""" (需在持有 lock 時呼叫) 刪除最後確認時間早於給定時戳的檔案存在紀錄
+
+		參數:
+			tstamp - 時戳
+		回傳值:
+			含有被刪除紀錄檔案相對路徑與檔名 tuple 的串列
+		"""
+		purged = []
+		for file_relfolder, folder_rows, in self._presence.items():
+			for file_name in [n for n, r, in folder_rows.iteritems() if (r[4] < tstamp)]:
+				del folder_rows[file_name]
+				purged.append((file_relfolder, file_name,))
+			if 0 == len(folder_rows):
+				del self._presence[file_relfolder]
+		self._presence_count = self._presence_count - len(purged)
+		return purged
+	# ### def _purge_presence
+
+	def flush(self, blocking=True):
+		""" 將快照寫入檔案 (持有資料庫存取鎖時只複製紀錄，序列化與寫入暫存檔再更名的過程中不持有)
+
+		參數:
+			blocking=True - 是否等待資料庫存取鎖
+		回傳值:
+			True - 已寫入或沒有變動
+			False - 資料庫忙碌，未寫入
+		"""
+		if not self._snapshot_lock.acquire(blocking):
+			return False
+		try:
+			if not self._lock.acquire(blocking):
+				return False
+			try:
+				if not self._dirty:
+					return True
+				snapshot = {
+					'version': _SNAPSHOT_FORMAT_VERSION,
+					'dupcheck': self._dupcheck.copy(),	# 紀錄值都是 tuple，複製 dict 即可
+					'presence': dict([(k, v.copy(),) for k, v, in self._presence.iteritems()]),
+					'dirsig': self._dirsig.copy(),
+					'checkpoints': self._checkpoints.copy(),	# 檢查點儲存後不會再被修改
+				}
+				self._dirty = False
+				self._snapshot_tstamp = time.time()
+			finally:
+				self._lock.release()
+			data = cPickle.dumps(snapshot, cPickle.HIGHEST_PROTOCOL)
+			snapshot = None
+			tmp_path = self.file_path + '.tmp'
+			try:
+				with open(tmp_path, 'wb') as fp:
+					fp.write(data)
+					fp.flush()
+					os.fsync(fp.fileno())
+				os.rename(tmp_path, self.file_path)
+			except (IOError, OSError,) as e:
+				syslog.syslog(syslog.LOG_WARNING, "cannot write meta snapshot [%s]: %s" % (self.file_path, e,))
+				self._dirty = True
+				return False
+			self.commit_count = self.commit_count + 1
+		finally:
+			self._snapshot_lock.release()
+		return True
+	# ### def flush
+
+	def flush_if_due(self):
+		if self._dirty and ((time.time() - self._snapshot_tstamp) >= self.snapshot_interval):
+			self.flush(False)
+	# ### def flush_if_due
+
+	def get_flush_interval(self):
+		return self.snapshot_interval
+	# ### def get_flush_interval
+
+	def close(self):
+		self.flush()
+	# ### def close
+
+	def get_row_counts(self, max_age=30):
+		return {'DuplicateCheck': len(self._dupcheck), 'PresenceCheck': self._presence_count, 'DirectorySignature': len(self._dirsig),}
+	# ### def get_row_counts
+
+	@_serialized_access
+	def test_file_duplication_and_checkin(self, file_name, file_sig, lifetime_retain=False, legacy_file_sigs=None, file_size=None, sample_sig=None):
+		""" 檢查檔案是不是重複，並在是新檔案時新增相關紀錄 (參數與回傳值見 MetaStorage.test_file_duplication_and_checkin()) """
+		self._maintain_database()
+
+		now_tstamp = int(time.time())
+		self._dirty = True
+		k = (file_name, file_sig,)
+		r = self._dupcheck.get(k)
+		if r is not None:
+			self._dupcheck[k] = (r[0], now_tstamp, r[2], r[3],)
+			return True
+
+		result = False
+		# {{{ 比對以其他演算法記錄的簽章
+		if legacy_file_sigs:
+			for sig_algorithm, legacy_sig, in legacy_file_sigs.iteritems():
+				r = self._dupcheck.get((file_name, legacy_sig,))
+				if (r is not None) and (sig_algorithm == r[3]):
+					result = True
+					break
+		# }}} 比對以其他演算法記錄的簽章
+
+		self._dupcheck[k] = (now_tstamp, now_tstamp, 1 if lifetime_retain else 0, self.signature_engine.algorithm,)
+		return result
+	# ### def test_file_duplication_and_checkin
+
+	@_serialized_access
+	def test_file_presence_and_checkin(self, file_relfolder, file_name, file_size, file_mtime, tstamp=None):
+		""" 檢查檔案是不是已經存在，並新增或更新相關紀錄 (參數與回傳值見 MetaStorage.test_file_presence_and_checkin()) """
+		return self._checkin_presence(file_relfolder, ((file_name, file_size, file_mtime,),), tstamp)[0]
+	# ### def test_file_presence_and_checkin
+
+	@_serialized_access
+	def test_folder_presence_and_checkin(self, file_relfolder, file_stats, tstamp=None):
+		""" 一次檢查同一資料夾內多個檔案是不是已經存在 (參數與回傳值見 MetaStorage.test_folder_presence_and_checkin()) """
+		return self._checkin_presence(file_relfolder, file_stats, tstamp)
+	# ### def test_folder_presence_and_checkin
+
+	def _checkin_presence(self, file_relfolder, file_stats, tstamp):
+		self._maintain_database()
+
+		if tstamp is None:
+			tstamp = int(time.time())
+
+		self._dirty = True
+		folder_rows = self._presence.get(file_relfolder)
+		if folder_rows is None:
+			folder_rows = {}
+			self._presence[file_relfolder] = folder_rows
+		result = []
+		for file_name, file_size, file_mtime, in file_stats:
+			file_size = int(file_size)
+			file_mtime = int(file_mtime)
+			r = folder_rows.get(file_name)
+			if r is None:
+				folder_rows[file_name] = (file_size, file_mtime, _MSTORAGE_FRESH, tstamp, tstamp,)
+				self._presence_count = self._presence_count + 1
+				result.append(FPCHK_FRESH)
+			else:
+				new_repstatus, result_status, = _compute_presence_transition(r[0], r[1], r[2], file_size, file_mtime)
+				folder_rows[file_name] = (file_size, file_mtime, new_repstatus, r[3], tstamp,)
+				result.append(result_status)
+		return result
+	# ### def _checkin_presence
+
+	@_serialized_access
+	def test_file_deletion_and_purge(self, tstamp=None):
+		""" 傳回已刪除檔案的串列並清除其紀錄 (參數與回傳值見 MetaStorage.test_file_deletion_and_purge()) """
+		if tstamp is None:
+			tstamp = time.time() - self.meta_missingfile_reserve_second
+		self._dirty = True
+		for file_relfolder in [k for k, r, in self._dirsig.iteritems() if (r[4] < tstamp)]:
+			del self._dirsig[file_relfolder]
+		return self._purge_presence(tstamp)
+	# ### def test_file_deletion_and_purge
+
+	@_serialized_access
+	def get_folder_signature(self, file_relfolder):
+		""" 取得資料夾上次列出內容時記錄的簽章 (參數與回傳值見 MetaStorage.get_folder_signature()) """
+		r = self._dirsig.get(file_relfolder)
+		if r is None:
+			return None
+		return r[:4]
+	# ### def get_folder_signature
+
+	@_serialized_access
+	def checkin_folder_signature(self, file_relfolder, dir_mtime, dir_ctime, entry_count, subdirs, tstamp=None):
+		""" 記錄資料夾簽章 (參數與回傳值見 MetaStorage.checkin_folder_signature()) """
+		if tstamp is None:
+			tstamp = int(time.time())
+		self._dirty = True
+		self._dirsig[file_relfolder] = (dir_mtime, dir_ctime, entry_count, tuple(subdirs), tstamp,)
+	# ### def checkin_folder_signature
+
+	@_serialized_access
+	def get_unsettled_files(self, file_relfolder):
+		""" 取得資料夾中尚在新增或修改中的檔案名稱 (參數與回傳值見 MetaStorage.get_unsettled_files()) """
+		folder_rows = self._presence.get(file_relfolder, {})
+		return [n for n, r, in folder_rows.iteritems() if (r[2] in (_MSTORAGE_FRESH, _MSTORAGE_MODIFING,))]
+	# ### def get_unsettled_files
+
+	@_serialized_access
+	def refresh_folder_presence(self, file_relfolder, tstamp, skip_names=()):
+		""" 更新資料夾中檔案存在紀錄的最後確認時間 (參數與回傳值見 MetaStorage.refresh_folder_presence()) """
+		folder_rows = self._presence.get(file_relfolder)
+		if folder_rows is None:
+			return
+		self._dirty = True
+		skip_names = set(skip_names)
+		for file_name, r, in folder_rows.items():
+			if file_name not in skip_names:
+				folder_rows[file_name] = r[:4] + (tstamp,)
+	# ### def refresh_folder_presence
+
+	@_serialized_access
+	def load_scan_checkpoint(self, name):
+		""" 讀取掃描檢查點 (參數與回傳值見 MetaStorage.load_scan_checkpoint()) """
+		return self._checkpoints.get(name)
+	# ### def load_scan_checkpoint
+
+	@_serialized_access
+	def save_scan_checkpoint(self, name, checkpoint):
+		""" 儲存或清除掃描檢查點，於下次寫入快照時保存 (參數與回傳值見 MetaStorage.save_scan_checkpoint()) """
+		self._dirty = True
+		if checkpoint is None:
+			self._checkpoints.pop(name, None)
+		else:
+			self._checkpoints[name] = checkpoint
+	# ### def save_scan_checkpoint
+# ### class MemoryMetaStorage
+
+
+def create_meta_storage(backend, file_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine=None, signature_cache_size=0, dupcheck_prefilter=False, commit_policy=None, snapshot_interval=300, snapshot_path=None):
+	""" 依名稱建立中介資訊資料庫物件
+
+	參數:
+		backend - 實作名稱 ('sqlite' 或 'memory')
+		file_path - 資料庫檔案路徑
+		meta_dupcheck_reserve_day - 重複檔案資料保存天數
+		meta_missingfile_reserve_day - 已消失檔案資料保存天數
+		signature_engine - 計算檔案簽章用的 SignatureEngine 物件
+		signature_cache_size - 檔案簽章快取容量 (筆，僅 sqlite)
+		dupcheck_prefilter - 重複檢查是否先以檔案大小與取樣簽章篩選 (僅 sqlite)
+		commit_policy - 日誌模式與交易提交方式 (僅 sqlite)
+		snapshot_interval - 寫入快照的間隔 (秒，僅 memory)
+		snapshot_path - 快照檔案路徑 (僅 memory)，None 表示在資料庫檔案路徑後加上 .snapshot (不與 sqlite 實作的資料庫檔共用)
+	回傳值:
+		MetaStorageBackend 物件
+	"""
+	if 'memory' == backend:
+		if (signature_cache_size > 0) or dupcheck_prefilter:
+			syslog.syslog(syslog.LOG_WARNING, "memory meta storage does not support signature cache and duplicate check prefilter, ignored.")
+		if snapshot_path is None:
+			snapshot_path = file_path + '.snapshot'
+		return MemoryMetaStorage(snapshot_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine, snapshot_interval)
+	if 'sqlite' != backend:
+		syslog.syslog(syslog.LOG_WARNING, "unknown meta storage backend %r, use sqlite." % (backend,))
+	return MetaStorage(file_path, meta_dupcheck_reserve_day, meta_missingfile_reserve_day, signature_engine, signature_cache_size, dupcheck_prefilter, commit_policy)
+# ### def create_meta_storage
+
+
+_default_signature_engine = SignatureEngine()
+
+def _compute_presence_transition(meta_size, meta_mtime, meta_repstatus, file_size, file_mtime):
+	""" 依紀錄與目前的檔案大小、修改時戳計算新的紀錄狀態與檢查結果
+
+	參數:
+		meta_size - 紀錄的檔案大小
+		meta_mtime - 紀錄的檔案修改時戳
+		meta_repstatus - 紀錄的狀態 (_MSTORAGE_*)
+		file_size - 目前的檔案大小
+		file_mtime - 目前的檔案修改時戳
+	回傳值:
+		(新的紀錄狀態, FPCHK_* 檢查結果) 形式的 tuple
+	"""
+	new_repstatus = meta_repstatus
+	result_status = None
+	if (meta_size == file_size) and (meta_mtime == file_mtime):
+		if _MSTORAGE_FRESH == meta_repstatus:
+			new_repstatus = _MSTORAGE_EXISTED
+			result_status = FPCHK_NEW
+		elif _MSTORAGE_EXISTED == meta_repstatus:
+			new_repstatus = _MSTORAGE_EXISTED	# no change
+			result_status = FPCHK_STABLE
+		elif _MSTORAGE_MODIFING == meta_repstatus:
+			new_repstatus = _MSTORAGE_EXISTED
+			result_status = FPCHK_MODIFIED
+	else:
+		if _MSTORAGE_FRESH == meta_repstatus:
+			new_repstatus = _MSTORAGE_FRESH	# no change
+			result_status = FPCHK_FRESH
+		elif _MSTORAGE_EXISTED == meta_repstatus:
+			new_repstatus = _MSTORAGE_MODIFING
+			result_status = FPCHK_MODIFING
+		elif _MSTORAGE_MODIFING == meta_repstatus:
+			new_repstatus = _MSTORAGE_MODIFING	# no change
+			result_status = FPCHK_MODIFING
+	return (new_repstatus, result_status,)
+# ### def _compute_presence_transition
+
+
 def compute_file_signature(filepath):
-	""" 計算檔案的數位簽章
+	""" 計算檔案的數位簽章 (md5)
 
 	參數:
 		filepath - 檔案路徑
 	回傳值:
 		數位簽章字串
 	"""
-	with open(filepath, 'rb') as f:
-		digester = hashlib.md5()
-		reach_eof = False
-		while reach_eof == False:
-			data = f.read(8192)
-			if not data:
-				reach_eof = True
-			else:
-				digester.update(data)
-
-	raw_dgst = digester.digest()
-	encoded_dgst = base64.b64encode(raw_dgst)
-	encoded_dgst = encoded_dgst.strip('=')
-	return encoded_dgst
+	return _default_signature_engine.compute(filepath)
 # ### compute_file_signature
 
 
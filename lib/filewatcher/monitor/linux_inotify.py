@@ -4,11 +4,18 @@
 """ 檔案系統監視模組 (Linux iNotify) """
 
 import os
+import zlib
+import errno
+import fcntl
+import syslog
+import Queue
 import pyinotify
 
 from filewatcher import componentprop
 from filewatcher import filewatchconfig
 from filewatcher import watcher
+from filewatcher import metadatum
+from filewatcher import workerpool
 
 
 def _get_relpath(path, start):
@@ -155,9 +162,326 @@ def monitor_configure(config, metastorage):
 		set_ignorance_checker(str(config['ignorance-checker']))
 
 	set_revise_period(config.get('revise-interval'))
+
+	# 檔案寫入過程中即時計算簽章
+	if ('stream-hashing' in config) and (config['stream-hashing']):
+		set_stream_hashing(metastorage, config.get('stream-hashing-max-files'))
 # ### def monitor_configure
 
 
+_STREAM_DIGEST_MAX_FILES = 256	# 同時即時計算簽章的檔案數量預設上限
+_STREAM_CHECK_BLOCK_SIZE = 4096	# 每次有寫入時快速檢查檔案是否只有附加寫入所比對的開頭與結尾資料量
+_STREAM_VERIFY_BLOCK_SIZE = 1048576	# 檔案關閉時逐區塊比對 CRC32 確認已計算部分沒有被改寫的區塊大小
+
+_stream_metastorage = None
+_stream_max_files = _STREAM_DIGEST_MAX_FILES
+def set_stream_hashing(metastorage, max_files=None):
+	""" 啟用檔案寫入過程中即時計算簽章 (需要訂閱 IN_MODIFY 事件)
+	檔案在寫入期間有被截短或是非附加寫入時放棄即時計算，改由監看引擎在檔案關閉後讀取整個檔案計算。
+	inotify 會合併連續的 IN_MODIFY 事件，每次寫入時只比對開頭與結尾區塊無法發現中段被改寫，
+	因此檔案關閉時會再讀取一次已計算的部分並逐區塊比對 CRC32，確認無誤才交出簽章
+	(省下的是簽章演算法的運算，而非讀取檔案的 I/O)。
+	讀取檔案與計算簽章都在單一的即時簽章 worker 中依事件順序進行，不佔用主迴圈；
+	即時計算中檔案的後續事件也經由該 worker 轉回主迴圈送出，監看引擎收到事件時簽章已經交出
+
+	參數:
+		metastorage - 中介資訊資料庫物件 (計算好的簽章經由 offer_file_signatures() 交給監看引擎)
+		max_files=None - 同時即時計算簽章的檔案數量上限
+	"""
+	global _stream_metastorage, _stream_max_files
+
+	if metastorage is None:
+		syslog.syslog(syslog.LOG_WARNING, "linux_inotify: stream hashing requires meta storage, disabled.")
+		return
+	_stream_metastorage = metastorage
+	if max_files is not None:
+		_stream_max_files = max(int(max_files), 1)
+	syslog.syslog(syslog.LOG_INFO, "linux_inotify: stream hashing enabled (max-files=%d)." % (_stream_max_files,))
+# ### def set_stream_hashing
+
+
+class _StreamDigest(object):
+	""" 單一檔案的即時簽章計算狀態 """
+
+	def __init__(self, fullpath, algorithms, read_buffer_size):
+		super(_StreamDigest, self).__init__()
+
+		self.fullpath = fullpath
+		self.fp = open(fullpath, 'rb')
+		st = os.fstat(self.fp.fileno())
+		self.file_ident = (st.st_dev, st.st_ino,)
+		self.signature = metadatum.IncrementalSignature(algorithms)
+		self.read_buffer_size = read_buffer_size
+		self.offset = 0
+		self.head_block = ''
+		self.tail_block = ''
+		self.block_crcs = []	# 已計算部分每個完整區塊的 CRC32
+		self.partial_crc = 0	# 已計算部分最後不完整區塊的 CRC32
+		self.partial_size = 0
+	# ### def __init__
+
+	def _read_at(self, offset, size):
+		self.fp.seek(offset)
+		return self.fp.read(size)
+	# ### def _read_at
+
+	def check_append_only(self, st):
+		""" 檢查自上次讀取後檔案是否只有附加寫入 (已讀取部分的開頭與結尾區塊沒有變動)
+
+		參數:
+			st - 檔案目前的 os.fstat() 結果
+		回傳值:
+			True - 只有附加寫入
+			False - 檔案被截短、換成其他檔案或是已讀取的部分被改寫
+		"""
+		if ((st.st_dev, st.st_ino,) != self.file_ident) or (st.st_size < self.offset):
+			return False
+		if self.offset > 0:
+			if self._read_at(0, len(self.head_block)) != self.head_block:
+				return False
+			if self._read_at(self.offset - len(self.tail_block), len(self.tail_block)) != self.tail_block:
+				return False
+		return True
+	# ### def check_append_only
+
+	def _checksum_block(self, data):
+		""" 將新讀取的資料併入區塊 CRC32 """
+		while len(data) > 0:
+			piece = data[:(_STREAM_VERIFY_BLOCK_SIZE - self.partial_size)]
+			data = data[len(piece):]
+			self.partial_crc = zlib.crc32(piece, self.partial_crc)
+			self.partial_size = self.partial_size + len(piece)
+			if _STREAM_VERIFY_BLOCK_SIZE == self.partial_size:
+				self.block_crcs.append(self.partial_crc)
+				self.partial_crc = 0
+				self.partial_size = 0
+	# ### def _checksum_block
+
+	def verify_hashed(self):
+		""" 重新讀取已計算簽章的部分，逐區塊比對 CRC32 確認內容沒有被改寫
+
+		回傳值:
+			True - 內容與計算簽章時相同
+			False - 已計算的部分被改寫
+		"""
+		self.fp.seek(0)
+		for block_crc in self.block_crcs:
+			if zlib.crc32(self.fp.read(_STREAM_VERIFY_BLOCK_SIZE)) != block_crc:
+				return False
+		if self.partial_size > 0:
+			if zlib.crc32(self.fp.read(self.partial_size)) != self.partial_crc:
+				return False
+		return True
+	# ### def verify_hashed
+
+	def feed_appended(self, file_size):
+		""" 讀取新附加的資料並更新簽章
+
+		參數:
+			file_size - 檔案目前大小
+		"""
+		self.fp.seek(self.offset)
+		remain_size = file_size - self.offset
+		while remain_size > 0:
+			data = self.fp.read(min(remain_size, self.read_buffer_size))
+			if not data:
+				break
+			self.signature.update(data)
+			self._checksum_block(data)
+			if len(self.head_block) < _STREAM_CHECK_BLOCK_SIZE:
+				self.head_block = self.head_block + data[:(_STREAM_CHECK_BLOCK_SIZE - len(self.head_block))]
+			self.tail_block = (self.tail_block + data[-_STREAM_CHECK_BLOCK_SIZE:])[-_STREAM_CHECK_BLOCK_SIZE:]
+			self.offset = self.offset + len(data)
+			remain_size = remain_size - len(data)
+	# ### def feed_appended
+
+	def update(self):
+		""" 檔案有寫入時呼叫
+
+		回傳值:
+			True - 繼續即時計算
+			False - 需放棄即時計算
+		"""
+		st = os.fstat(self.fp.fileno())
+		if not self.check_append_only(st):
+			return False
+		self.feed_appended(st.st_size)	# 大小沒有增加時可能是前一次讀取已讀到這次寫入，中段被改寫則由檔案關閉時的逐區塊比對發現
+		return True
+	# ### def update
+
+	def finish(self):
+		""" 檔案寫入結束時呼叫，確認已計算的部分沒有被改寫後讀取剩下的資料並完成簽章
+
+		回傳值:
+			(os.stat 結果, 簽章字典) 形式的 tuple，需放棄即時計算時傳回 None
+		"""
+		st = os.fstat(self.fp.fileno())
+		if (not self.check_append_only(st)) or (not self.verify_hashed()):
+			return None
+		self.feed_appended(st.st_size)
+		if self.offset != st.st_size:
+			return None
+		return (st, self.signature.get_signatures(),)
+	# ### def finish
+
+	def close(self):
+		self.fp.close()
+	# ### def close
+# ### class _StreamDigest
+
+
+_STREAM_DIGESTS = {}	# (僅在即時簽章 worker 中存取) 檔案完整路徑 -> _StreamDigest 物件 (已放棄即時計算、等待檔案關閉的檔案為 None)
+_stream_stats = {
+	'completed': 0,
+	'fallback': 0,
+	'bytes': 0,
+}
+
+_stream_pool = None	# 即時簽章 worker (只有一個執行緒，依送入順序處理同一檔案的事件)
+_stream_update_queued = set()	# 已送入 worker 但還沒開始讀取的 IN_MODIFY 檔案路徑 (避免重複送入)
+_stream_paths = set()	# (僅在主迴圈中存取) 已送入 worker 即時計算、還沒收到結束事件的檔案路徑
+_stream_held_triggers = {}	# (僅在主迴圈中存取) 檔案路徑 -> 經由 worker 轉送、還沒送出的事件數
+_stream_trigger_queue = Queue.Queue()	# worker 轉回主迴圈送出的事件
+_stream_trigger_pipe = None	# 通知主迴圈有事件轉回用的 pipe
+
+def _discard_stream_digest(fullpath, is_fallback=False):
+	""" (在即時簽章 worker 中執行) 放棄檔案的即時簽章計算 """
+	stream_digest = _STREAM_DIGESTS.pop(fullpath, None)
+	if stream_digest is None:
+		return
+	stream_digest.close()
+	if is_fallback:
+		_stream_stats['fallback'] = _stream_stats['fallback'] + 1
+# ### def _discard_stream_digest
+
+def _update_stream_digest(fullpath):
+	""" (在即時簽章 worker 中執行) 檔案有寫入 (IN_MODIFY) 時更新即時簽章 """
+	_stream_update_queued.discard(fullpath)	# 之後的寫入需要再次送入
+	if fullpath in _STREAM_DIGESTS:
+		stream_digest = _STREAM_DIGESTS[fullpath]
+		if stream_digest is None:
+			return
+	else:
+		if len(_STREAM_DIGESTS) >= _stream_max_files:
+			return
+		try:
+			stream_digest = _StreamDigest(fullpath, _stream_metastorage.get_signature_algorithms(), _stream_metastorage.signature_engine.read_buffer_size)
+		except (IOError, OSError,):
+			return
+		_STREAM_DIGESTS[fullpath] = stream_digest
+	offset = stream_digest.offset
+	try:
+		is_streaming = stream_digest.update()
+	except (IOError, OSError,):
+		is_streaming = False
+	_stream_stats['bytes'] = _stream_stats['bytes'] + (stream_digest.offset - offset)
+	if not is_streaming:
+		_discard_stream_digest(fullpath, True)
+		_STREAM_DIGESTS[fullpath] = None	# 檔案關閉前不再即時計算
+# ### def _update_stream_digest
+
+def _finish_stream_digest(fullpath):
+	""" (在即時簽章 worker 中執行) 檔案寫入結束 (IN_CLOSE_WRITE) 時完成即時簽章並交給中介資訊資料庫 """
+	if fullpath not in _STREAM_DIGESTS:
+		return
+	stream_digest = _STREAM_DIGESTS[fullpath]
+	if stream_digest is None:
+		del _STREAM_DIGESTS[fullpath]
+		return
+	try:
+		r = stream_digest.finish()
+	except (IOError, OSError,):
+		r = None
+	if r is None:
+		_discard_stream_digest(fullpath, True)
+		return
+	_discard_stream_digest(fullpath)
+	st, file_sigs, = r
+	_stream_metastorage.offer_file_signatures(st, file_sigs)
+	_stream_stats['completed'] = _stream_stats['completed'] + 1
+# ### def _finish_stream_digest
+
+def _post_stream_trigger(fullpath, watcher_eventcode):
+	""" (在即時簽章 worker 中執行) 將事件轉回主迴圈送出 """
+	_stream_trigger_queue.put((fullpath, watcher_eventcode,))
+	try:
+		os.write(_stream_trigger_pipe[1], 'x')
+	except OSError as e:
+		if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK,):	# pipe 已滿時主迴圈一定會被喚醒
+			raise
+# ### def _post_stream_trigger
+
+def _drain_stream_triggers(arg):
+	""" 即時簽章 worker 有事件轉回時由主迴圈呼叫 """
+	watcher_instance, target_directory, = arg
+	try:
+		while os.read(_stream_trigger_pipe[0], 4096):
+			pass
+	except OSError as e:
+		if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK,):
+			raise
+	while True:
+		try:
+			fullpath, watcher_eventcode, = _stream_trigger_queue.get(False)
+		except Queue.Empty:
+			return
+		remain_count = _stream_held_triggers.pop(fullpath) - 1
+		if remain_count > 0:
+			_stream_held_triggers[fullpath] = remain_count
+		_trigger_operation(watcher_instance, target_directory, fullpath, watcher_eventcode)
+# ### def _drain_stream_triggers
+
+def _start_stream_worker(watcher_instance, target_directory):
+	""" 啟動即時簽章 worker 並註冊事件轉回主迴圈用的 pipe """
+	global _stream_pool, _stream_trigger_pipe
+
+	pipe_r, pipe_w, = os.pipe()
+	for fd in (pipe_r, pipe_w,):
+		flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+		fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+	_stream_trigger_pipe = (pipe_r, pipe_w,)
+	watcher_instance.process_driver.add_reader(pipe_r, _drain_stream_triggers, (watcher_instance, target_directory,))
+	_stream_pool = workerpool.WorkerPool('inotify-stream-digest', 1)
+	_stream_pool.start()
+# ### def _start_stream_worker
+
+def _submit_stream_update(watcher_instance, target_directory, fullpath):
+	""" 檔案有寫入 (IN_MODIFY) 時將讀取新資料的工作送入即時簽章 worker """
+	if fullpath not in _stream_paths:
+		path, name, = os.path.split(fullpath)
+		w_match = watcher_instance.watch_entries.find_entry(name, _get_relpath(path, target_directory))
+		if (w_match is None) or (not w_match[0].do_dupcheck):	# 只計算需要重複檢查的檔案，其他檔案的事件不經由 worker 轉送
+			return
+		_stream_paths.add(fullpath)
+	if fullpath in _stream_update_queued:	# 還沒開始讀取，到時會一併讀到這次寫入的資料
+		return
+	_stream_update_queued.add(fullpath)
+	_stream_pool.submit(_update_stream_digest, (fullpath,))
+# ### def _submit_stream_update
+
+def _submit_stream_finish(fullpath):
+	""" 檔案寫入結束 (IN_CLOSE_WRITE) 時將完成簽章的工作送入即時簽章 worker
+
+	回傳值:
+		True - 已送入，事件需經由 worker 轉送
+		False - 檔案沒有在即時計算
+	"""
+	if fullpath not in _stream_paths:
+		return False
+	_stream_paths.discard(fullpath)
+	_stream_pool.submit(_finish_stream_digest, (fullpath,))
+	return True
+# ### def _submit_stream_finish
+
+def _submit_stream_discard(fullpath):
+	""" 檔案被刪除或移走時將放棄即時簽章的工作送入即時簽章 worker """
+	if fullpath not in _stream_paths:
+		return
+	_stream_paths.discard(fullpath)
+	_stream_pool.submit(_discard_stream_digest, (fullpath,))
+# ### def _submit_stream_discard
+
+
 _MTIME_WATCH_FILES = {}
 
 def _trigger_operation(watcher_instance, target_directory, fullpath, watcher_eventcode):
@@ -167,6 +491,20 @@ def _trigger_operation(watcher_instance, target_directory, fullpath, watcher_eve
 	watcher_instance.discover_file_change(name, relpath, watcher_eventcode)
 # ### def _trigger_operation
 
+def _hold_operation(fullpath, watcher_eventcode):
+	""" 經由即時簽章 worker 轉送事件，在已送入 worker 的工作完成後才由主迴圈送出 """
+	_stream_held_triggers[fullpath] = _stream_held_triggers.get(fullpath, 0) + 1
+	_stream_pool.submit(_post_stream_trigger, (fullpath, watcher_eventcode,))
+# ### def _hold_operation
+
+def _deliver_operation(watcher_instance, target_directory, fullpath, watcher_eventcode):
+	""" 送出事件，檔案在即時簽章 worker 中還有工作時經由 worker 轉送以保持順序 """
+	if (_stream_pool is not None) and ((fullpath in _stream_paths) or (fullpath in _stream_held_triggers)):
+		_hold_operation(fullpath, watcher_eventcode)
+		return
+	_trigger_operation(watcher_instance, target_directory, fullpath, watcher_eventcode)
+# ### def _deliver_operation
+
 def _periodical_watch_files_flush(arg):
 	watcher_instance, target_directory, = arg
 
@@ -191,7 +529,7 @@ def _periodical_watch_files_flush(arg):
 
 	for fullpath in to_trigger:
 		_MTIME_WATCH_FILES.pop(fullpath, None)
-		_trigger_operation(watcher_instance, target_directory, fullpath, watcher.FEVENT_MODIFIED)
+		_deliver_operation(watcher_instance, target_directory, fullpath, watcher.FEVENT_MODIFIED)
 # ### def _periodical_watch_files_flush
 
 class _EventHandler(pyinotify.ProcessEvent):
@@ -204,7 +542,7 @@ class _EventHandler(pyinotify.ProcessEvent):
 
 	def trigger_operation(self, pathname, watcher_eventcode):
 		fullpath = os.path.abspath(pathname)
-		_trigger_operation(self.watcher_instance, self.target_directory, fullpath, watcher_eventcode)
+		_deliver_operation(self.watcher_instance, self.target_directory, fullpath, watcher_eventcode)
 	# ### def trigger_operation
 
 	def process_IN_CREATE(self, event):
@@ -223,8 +561,17 @@ class _EventHandler(pyinotify.ProcessEvent):
 				_MTIME_WATCH_FILES[aux] = (st.st_size, st.st_mtime,)
 	# ### def process_IN_CREATE
 
+	def process_IN_MODIFY(self, event):
+		if event.dir:
+			return
+		_submit_stream_update(self.watcher_instance, self.target_directory, os.path.abspath(event.pathname))
+	# ### def process_IN_MODIFY
+
 	def process_IN_CLOSE_WRITE(self, event):
 		print "inotify::IN_CLOSE_WRITE: %r" % (event.pathname,)
+		if (_stream_pool is not None) and _submit_stream_finish(os.path.abspath(event.pathname)):
+			_hold_operation(os.path.abspath(event.pathname), watcher.FEVENT_MODIFIED)	# 簽章交出後才送出事件
+			return
 		self.trigger_operation(event.pathname, watcher.FEVENT_MODIFIED)
 	# ### def process_IN_CLOSE_WRITE
 
@@ -233,8 +580,15 @@ class _EventHandler(pyinotify.ProcessEvent):
 		self.trigger_operation(event.pathname, watcher.FEVENT_MODIFIED)
 	# ### def process.IN_MOVED_TO
 
+	def process_IN_MOVED_FROM(self, event):
+		if _stream_pool is not None:
+			_submit_stream_discard(os.path.abspath(event.pathname))	# 寫入中被移走的檔案改在關閉後計算簽章
+	# ### def process_IN_MOVED_FROM
+
 	def process_IN_DELETE(self, event):
 		print "inotify::IN_DELETE: %r" % (event.pathname,)
+		if _stream_pool is not None:
+			_submit_stream_discard(os.path.abspath(event.pathname))
 		self.trigger_operation(event.pathname, watcher.FEVENT_DELETED)
 	# ### def process_IN_DELETE
 
@@ -245,6 +599,12 @@ class _EventHandler(pyinotify.ProcessEvent):
 	# ### def process_IN_Q_OVERFLOW
 # ### class _EventHandler
 
+def _read_inotify_events(notifier):
+	""" iNotify 檔案描述子可讀時由主迴圈呼叫 """
+	notifier.read_events()
+	notifier.process_events()
+# ### def _read_inotify_events
+
 _watchmanager = None
 def monitor_start(watcher_instance, target_directory, recursive_watch=False):
 	""" 開始監控目錄作業
@@ -263,13 +623,18 @@ def monitor_start(watcher_instance, target_directory, recursive_watch=False):
 		mask = mask | pyinotify.IN_CREATE	# @UndefinedVariable
 	if _queue_overflow_event_callback is not None:
 		mask = mask | pyinotify.IN_Q_OVERFLOW	# @UndefinedVariable
+	if _stream_metastorage is not None:
+		mask = mask | pyinotify.IN_MODIFY | pyinotify.IN_MOVED_FROM	# @UndefinedVariable
 
 	if _watchmanager is not None:
 		print "ERR: linux_inotify: designed to watch one directory only, unspecified behavior with multiple monitor_start."
 
 	_watchmanager = pyinotify.WatchManager(exclude_filter=_ExcludeFilter(target_directory, recursive_watch))
 	handler = _EventHandler(watcher_instance, target_directory)
-	_notifier = pyinotify.AsyncNotifier(_watchmanager, handler, channel_map=watcher_instance.process_driver.async_map)
+	_notifier = pyinotify.Notifier(_watchmanager, handler, timeout=0)
+	watcher_instance.process_driver.add_reader(_watchmanager.get_fd(), _read_inotify_events, _notifier)
+	if (_stream_metastorage is not None) and (_stream_pool is None):
+		_start_stream_worker(watcher_instance, target_directory)
 
 	auto_add_folder = False if (not recursive_watch) else True
 	_wdd = _watchmanager.add_watch(target_directory, mask, rec=True, auto_add=auto_add_folder)
@@ -281,6 +646,25 @@ def monitor_start(watcher_instance, target_directory, recursive_watch=False):
 # ### def monitor_start
 
 
+def get_module_gauges():
+	""" 取得監視器即時量測值 (選用，由主迴圈呼叫，不可等待任何鎖或 I/O)
+
+	參數:
+		(無)
+	回傳值:
+		(名稱, 標籤字典, 數值) 形式的 tuple 串列
+	"""
+	gauges = [('inotify_pending_stability_files', None, len(_MTIME_WATCH_FILES),)]
+	if _watchmanager is not None:
+		gauges.append(('inotify_watch_count', None, len(_watchmanager.watches),))
+	if _stream_metastorage is not None:
+		gauges.append(('inotify_stream_digest_files', None, len([v for v in _STREAM_DIGESTS.values() if (v is not None)]),))
+		for k in ('completed', 'fallback', 'bytes',):
+			gauges.append(('inotify_stream_digest_' + k, None, _stream_stats[k],))
+	return gauges
+# ### def get_module_gauges
+
+
 def monitor_stop():
 	""" 停止作業，準備結束
 
@@ -289,7 +673,15 @@ def monitor_stop():
 	回傳值:
 		(無)
 	"""
-	pass
+	global _stream_pool
+
+	if _stream_pool is not None:
+		_stream_pool.stop()
+		_stream_pool = None
+	for fullpath in _STREAM_DIGESTS.keys():
+		_discard_stream_digest(fullpath)
+	_STREAM_DIGESTS.clear()
+	_stream_paths.clear()
 # ### def monitor_stop
 
 
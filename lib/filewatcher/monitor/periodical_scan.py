@@ -4,13 +4,23 @@
 """ 定時掃描變更檔案系統監視模組 """
 
 import os
+import stat
+import errno
 import time
+import heapq
 import syslog
+import Queue
 
 from filewatcher import componentprop
 from filewatcher import filewatchconfig
 from filewatcher import metadatum
 from filewatcher import watcher
+from filewatcher import workerpool
+
+try:
+	from scandir import scandir as _scandir
+except ImportError:
+	_scandir = None
 
 
 _cached_module_prop_instance = componentprop.MonitorProp('periodical-scan')
@@ -47,6 +57,18 @@ def set_ignorance_checker(checker):
 _scan_interval = 1200
 _cron_interval_style = False
 _blackout_time = []
+_scan_worker_count = 0	# 平行讀取資料夾的 worker 數量，0 表示在主迴圈中依序讀取
+_scan_pool = None
+_scan_time_slice = 0.2	# 主迴圈每次推進掃描的時間 (秒)，之後先處理其他事件再繼續
+
+_RESULT_POLL_INTERVAL = 0.05	# 等待工作池讀取資料夾時，再次檢查結果的間隔 (秒)
+_CHECKPOINT_INTERVAL = 30	# 儲存掃描檢查點的間隔 (秒)
+_prune_unchanged_folders = False	# 是否略過簽章 (修改與狀態變更時戳) 沒有變動的資料夾
+_prefilter_watch_entries = False	# 是否只讀取與記錄可能吻合監看規則的檔案與資料夾
+_settle_probe_delay = 0	# 新增或修改中的檔案在多少秒後再次確認是否已穩定，0 表示等到下次掃描
+
+_SETTLE_PROBE_MAX_ATTEMPTS = 5	# 每個檔案最多再次確認的次數，之後留給下次掃描
+_SETTLE_PROBE_MAX_PENDING = 65536	# 等待再次確認的檔案數量上限
 
 _metastorage = None
 
@@ -59,7 +81,7 @@ def monitor_configure(config, metastorage):
 	回傳值:
 		(無)
 	"""
-	global _scan_interval, _cron_interval_style, _blackout_time, _metastorage
+	global _scan_interval, _cron_interval_style, _blackout_time, _scan_worker_count, _scan_time_slice, _prune_unchanged_folders, _prefilter_watch_entries, _settle_probe_delay, _metastorage
 
 	# {{{ 掃描間隔
 	if 'scan_interval' in config:
@@ -75,10 +97,43 @@ def monitor_configure(config, metastorage):
 			_scan_interval = 1200
 	# }}} 掃描間隔
 
+	# 平行掃描 worker 數量
+	if 'scan_workers' in config:
+		try:
+			_scan_worker_count = max(int(config['scan_workers']), 0)
+		except:
+			_scan_worker_count = 0
+
+	# 每次推進掃描的時間
+	if 'scan_time_slice' in config:
+		try:
+			_scan_time_slice = max(float(config['scan_time_slice']), 0.01)
+		except:
+			_scan_time_slice = 0.2
+
 	# 是否使用儲存紀錄到 MetaStorage 的比對方式
 	if ('use_meta' in config) and (config['use_meta']) and (metastorage is not None):
 		_metastorage = metastorage
 
+	# 是否略過沒有變動的資料夾 (需要 MetaStorage 記錄資料夾簽章)
+	if ('prune_unchanged_folders' in config) and (config['prune_unchanged_folders']) and (_metastorage is not None):
+		_prune_unchanged_folders = True
+
+	# 是否在讀取檔案資訊前先以監看規則過濾
+	if ('prefilter_watch_entries' in config) and (config['prefilter_watch_entries']):
+		_prefilter_watch_entries = True
+
+	# 再次確認新增或修改中檔案的延遲 (需要 MetaStorage 記錄檔案狀態，修改時戳以秒為單位比對故至少 1 秒)
+	if ('settle_probe_delay' in config) and (_metastorage is not None):
+		try:
+			_settle_probe_delay = float(config['settle_probe_delay'])
+			if _settle_probe_delay > 0:
+				_settle_probe_delay = max(_settle_probe_delay, 1.0)
+			else:
+				_settle_probe_delay = 0
+		except:
+			_settle_probe_delay = 0
+
 	# {{{ 將不掃描時間讀入
 	if ('blackout_time' in config) and (isinstance('blackout_time', list)):
 		for t in config['blackout_time']:
@@ -97,69 +152,523 @@ def monitor_configure(config, metastorage):
 	if 'ignorance-checker' in config:
 		set_ignorance_checker(str(config['ignorance-checker']))
 
-	syslog.syslog(syslog.LOG_INFO, "periodical_scan configurated (scan_interval=%d/c:%r)." % (_scan_interval, _cron_interval_style,))
+	syslog.syslog(syslog.LOG_INFO, "periodical_scan configurated (scan_interval=%d/c:%r, scan_workers=%d, scan_time_slice=%r, scandir=%r, prune_unchanged_folders=%r, prefilter_watch_entries=%r, settle_probe_delay=%r)." % (_scan_interval, _cron_interval_style, _scan_worker_count, _scan_time_slice, (_scandir is not None), _prune_unchanged_folders, _prefilter_watch_entries, _settle_probe_delay,))
 # ### def monitor_configure
 
 
-def _scan_walk_impl(last_scan_time, watcher_instance, target_directory, recursive_watch):
-	current_tstamp = int(time.time())
-	for root, dirs, files in os.walk(target_directory):
-		# 製造相對路徑
-		relpath = os.path.relpath(root, target_directory)
-		if '.' == relpath:
-			relpath = ''
+_scan_progress = {
+	'running': 0,
+	'folder_count': 0,
+	'file_count': 0,
+	'changed_count': 0,
+	'pruned_folder_count': 0,
+	'filtered_folder_count': 0,
+	'pending_folder_count': 0,
+	'eta_second': None,
+	'start_tstamp': None,
+	'last_scan_elapsed': None,
+}
+
+_probe_heap = []	# 等待再次確認的檔案: (預定時戳, 監測目標資料夾, 資料夾相對路徑, 檔案名稱, 第幾次確認) 形式的 tuple
+_probe_pending = set()	# 等待再次確認的 (資料夾相對路徑, 檔案名稱)
+_probe_timer_due = None	# 已排定的再次確認呼叫的時戳
+_probe_stats = {
+	'promoted': 0,
+	'expired': 0,
+}
+
+def _enqueue_settle_probe(watcher_instance, target_directory, relpath, filename, attempt=1):
+	""" 排定在 (settle_probe_delay x 確認次數) 秒後再次確認新增或修改中的檔案是否已穩定
 
-		# {{{ 掃描所有檔案是否有變動
-		for f in files:
-			fpath = os.path.join(root, f)
-			try:
-				finfo = os.stat(fpath)
-			except:
-				continue
+	參數:
+		watcher_instance - watcher.WatcherEngine 物件實體
+		target_directory - 監測目標資料夾
+		relpath - 資料夾相對路徑
+		filename - 檔案名稱
+		attempt=1 - 第幾次確認
+	回傳值:
+		(無)
+	"""
+	k = (relpath, filename,)
+	if (k in _probe_pending) or (len(_probe_pending) >= _SETTLE_PROBE_MAX_PENDING):
+		return
+	_probe_pending.add(k)
+	heapq.heappush(_probe_heap, (time.time() + _settle_probe_delay * attempt, target_directory, relpath, filename, attempt,))
+	_arm_settle_probe(watcher_instance)
+# ### def _enqueue_settle_probe
+
+def _arm_settle_probe(watcher_instance):
+	""" 依最早到期的檔案排定再次確認的呼叫 (已排定的呼叫不晚於最早到期時間時不重複排定) """
+	global _probe_timer_due
+
+	if len(_probe_heap) < 1:
+		return
+	due_tstamp = _probe_heap[0][0]
+	if (_probe_timer_due is not None) and (_probe_timer_due <= due_tstamp):
+		return
+	_probe_timer_due = due_tstamp
+	watcher_instance.process_driver.call_later(due_tstamp - time.time(), _run_settle_probe, (watcher_instance, due_tstamp,))
+# ### def _arm_settle_probe
+
+def _probe_file(watcher_instance, target_directory, relpath, filename, attempt):
+	""" 再次確認檔案，已穩定時送給監看引擎，仍在變動中時再排定下一次確認 """
+	try:
+		finfo = os.stat(os.path.join(target_directory, relpath, filename))
+	except OSError:	# 已刪除或無法存取，留給下次掃描處理
+		return
+	r = _metastorage.test_file_presence_and_checkin(relpath, filename, finfo.st_size, finfo.st_mtime)
+	if (metadatum.FPCHK_NEW == r) or (metadatum.FPCHK_MODIFIED == r):
+		_probe_stats['promoted'] += 1
+		watcher_instance.discover_file_change(filename, relpath, watcher.FEVENT_MODIFIED)
+	elif (metadatum.FPCHK_FRESH == r) or (metadatum.FPCHK_MODIFING == r):
+		if attempt < _SETTLE_PROBE_MAX_ATTEMPTS:
+			_enqueue_settle_probe(watcher_instance, target_directory, relpath, filename, attempt + 1)
+		else:
+			_probe_stats['expired'] += 1
+# ### def _probe_file
+
+def _run_settle_probe(arg):
+	""" (由主迴圈呼叫) 在一個時間片段內再次確認已到期的檔案 """
+	global _probe_timer_due
+
+	watcher_instance, due_tstamp, = arg
+	if due_tstamp != _probe_timer_due:	# 已被較早的排定取代
+		return
+	_probe_timer_due = None
+	deadline_tstamp = time.time() + _scan_time_slice
+	while len(_probe_heap) > 0:
+		current_tstamp = time.time()
+		if (_probe_heap[0][0] > current_tstamp) or (current_tstamp >= deadline_tstamp):
+			break
+		_due_tstamp, target_directory, relpath, filename, attempt, = heapq.heappop(_probe_heap)
+		_probe_pending.discard((relpath, filename,))
+		try:
+			_probe_file(watcher_instance, target_directory, relpath, filename, attempt)
+		except Exception as e:
+			syslog.syslog(syslog.LOG_WARNING, "periodical_scan: failed on probing file [%s/%s]: [%s]" % (relpath, filename, e,))
+	_arm_settle_probe(watcher_instance)
+# ### def _run_settle_probe
 
-			is_updated_file = False
+def _check_folder_files(last_scan_time, watcher_instance, target_directory, relpath, file_stats, current_tstamp):
+	""" 找出資料夾中有變動的檔案並送給監看引擎
 
-			# {{{ 檢查是否是有變動的檔案
-			if _metastorage is not None:	# 採用資料庫檢查
-				r = _metastorage.test_file_presence_and_checkin(relpath, f, finfo.st_size, finfo.st_mtime, current_tstamp)
+	參數:
+		last_scan_time - 上次掃描的時戳
+		watcher_instance - watcher.WatcherEngine 物件實體
+		target_directory - 監測目標資料夾
+		relpath - 資料夾相對路徑
+		file_stats - 含有 (檔案名稱, 檔案大小, 檔案修改時戳) tuple 的串列
+		current_tstamp - 本次掃描的時戳
+	回傳值:
+		(無)
+	"""
+	_scan_progress['folder_count'] += 1
+	_scan_progress['file_count'] += len(file_stats)
+
+	# {{{ 找出有變動的檔案
+	updated_files = []
+	if _metastorage is not None:	# 採用資料庫檢查 (整個資料夾一次比對)
+		if len(file_stats) > 0:
+			presence_status = _metastorage.test_folder_presence_and_checkin(relpath, file_stats, current_tstamp)
+			for finfo, r, in zip(file_stats, presence_status):
 				if (metadatum.FPCHK_NEW == r) or (metadatum.FPCHK_MODIFIED == r):
-					is_updated_file = True
-			elif finfo.st_mtime > last_scan_time:	# 採用時間比對
-				is_updated_file = True
-			# }}} 檢查是否是有變動的檔案
-
-			if is_updated_file:
-				watcher_instance.discover_file_change(f, relpath, watcher.FEVENT_MODIFIED)
-		# }}} 掃描所有檔案是否有變動
-
-		# {{{ 檢查是否要掃描子資料夾
-		if recursive_watch:
-			if _ignorance_checker is not None:
-				to_drop = []
-				for d in dirs:
-					drel = os.path.join(relpath, d)
-					if _ignorance_checker(drel, None):
-						to_drop.append(d)
-				for d in to_drop:
-					dirs.remove(d)
-		else:
-			del dirs[:]
-		# }}} 檢查是否要掃描子資料夾
+					updated_files.append(finfo[0])
+				elif (_settle_probe_delay > 0) and ((metadatum.FPCHK_FRESH == r) or (metadatum.FPCHK_MODIFING == r)):
+					_enqueue_settle_probe(watcher_instance, target_directory, relpath, finfo[0])
+	else:	# 採用時間比對
+		updated_files = [finfo[0] for finfo in file_stats if (finfo[2] > last_scan_time)]
+	# }}} 找出有變動的檔案
+
+	for f in updated_files:
+		_scan_progress['changed_count'] += 1
+		watcher_instance.discover_file_change(f, relpath, watcher.FEVENT_MODIFIED)
+# ### def _check_folder_files
 
-	# 產生刪除檔案資料
+def _check_unchanged_folder(last_scan_time, watcher_instance, target_directory, relpath, folder_signature, current_tstamp):
+	""" 處理內容沒有變動的資料夾: 只檢查上次仍在新增或修改中的檔案，其他檔案紀錄只更新最後確認時間
+
+	參數:
+		last_scan_time - 上次掃描的時戳
+		watcher_instance - watcher.WatcherEngine 物件實體
+		target_directory - 監測目標資料夾
+		relpath - 資料夾相對路徑
+		folder_signature - 資料夾簽章 (見 MetaStorage.get_folder_signature())
+		current_tstamp - 本次掃描的時戳
+	回傳值:
+		(無)
+	"""
+	_scan_progress['pruned_folder_count'] += 1
+	folderpath = os.path.join(target_directory, relpath) if relpath else target_directory
+	unsettled_files = _metastorage.get_unsettled_files(relpath)
+	file_stats = []
+	for f in unsettled_files:
+		try:
+			finfo = os.stat(os.path.join(folderpath, f))
+		except:
+			continue
+		file_stats.append((f, finfo.st_size, finfo.st_mtime,))
+	_check_folder_files(last_scan_time, watcher_instance, target_directory, relpath, file_stats, current_tstamp)
+	_metastorage.refresh_folder_presence(relpath, current_tstamp, unsettled_files)
+	_metastorage.checkin_folder_signature(relpath, folder_signature[0], folder_signature[1], folder_signature[2], folder_signature[3], current_tstamp)
+# ### def _check_unchanged_folder
+
+def _report_deleted_files(watcher_instance, current_tstamp):
+	""" 產生刪除檔案資料 """
 	if _metastorage is not None:
 		df = _metastorage.test_file_deletion_and_purge(current_tstamp - 1)
 		for dfinfo in df:
 			watcher_instance.discover_file_change(dfinfo[1], dfinfo[0], watcher.FEVENT_DELETED)
-# ### def _scan_walk_impl
+# ### def _report_deleted_files
+
+class _ListdirEntry(object):
+	""" 沒有 scandir 模組時使用的資料夾項目 (第一次需要時才 lstat 並以結果判斷型別，一般檔案不再重複 stat) """
+
+	def __init__(self, folderpath, name):
+		super(_ListdirEntry, self).__init__()
+
+		self.name = name
+		self.path = os.path.join(folderpath, name)
+		self._lstat = None
+		self._stat = None
+	# ### def __init__
+
+	def is_symlink(self):
+		if self._lstat is None:
+			self._lstat = os.lstat(self.path)
+		return stat.S_ISLNK(self._lstat.st_mode)
+	# ### def is_symlink
+
+	def stat(self):
+		if self._stat is None:
+			self._stat = os.stat(self.path) if self.is_symlink() else self._lstat
+		return self._stat
+	# ### def stat
+
+	def is_dir(self):
+		try:
+			return stat.S_ISDIR(self.stat().st_mode)
+		except OSError:
+			return False
+	# ### def is_dir
+# ### class _ListdirEntry
+
+def _iterate_folder(folderpath):
+	""" 列出資料夾中的項目 (DirEntry 或 _ListdirEntry 物件) """
+	if _scandir is not None:
+		return _scandir(folderpath)
+	return [_ListdirEntry(folderpath, name) for name in os.listdir(folderpath)]
+# ### def _iterate_folder
+
+def _scan_folder(target_directory, relpath, recursive_watch, known_signature=None, scan_filter=None):
+	""" (在 worker 中執行) 讀取一個資料夾中的檔案資訊與子資料夾名稱
+	與 os.walk 相同: 指向資料夾的符號連結不視為檔案也不進入掃描；已被移除的資料夾視為空資料夾，
+	其他讀取錯誤 (例如權限不足或 NFS ESTALE) 則丟出 OSError，不能把資料夾內的檔案當作已刪除
+
+	參數:
+		target_directory - 監測目標資料夾
+		relpath - 資料夾相對路徑
+		recursive_watch - 是否要遞迴監測子資料夾
+		known_signature=None - 上次記錄的資料夾簽章，資料夾的修改與狀態變更時戳都相同時不列出內容
+		scan_filter=None - 監看規則 (filewatchconfig.WatchEntryList 物件)，檔名與路徑不吻合任何規則的檔案不 stat 也不列入
+	回傳值:
+		(relpath, file_stats, subdirs, folder_signature) 形式的 tuple，
+		file_stats 為含有 (檔案名稱, 檔案大小, 檔案修改時戳) tuple 的串列，資料夾沒有變動時為 None；
+		subdirs 為要繼續掃描的子資料夾名稱串列；folder_signature 為資料夾簽章 (無法讀取資料夾時為 None)
+	"""
+	folderpath = os.path.join(target_directory, relpath) if relpath else target_directory
+	file_stats = []
+	subdirs = []
+	try:
+		folder_st = os.stat(folderpath)	# 在列出內容之前取得，列出過程中的變動會反映在下次的簽章比對
+		if (known_signature is not None) and (known_signature[0] is not None) and (known_signature[0] == folder_st.st_mtime) and (known_signature[1] == folder_st.st_ctime):
+			return (relpath, None, list(known_signature[3]) if recursive_watch else [], known_signature,)
+		list_tstamp = time.time()
+		entry_count = 0
+		for entry in _iterate_folder(folderpath):	# scandir 在逐項讀取時也可能發生錯誤
+			entry_count = entry_count + 1
+			is_watched = (scan_filter is None) or (scan_filter.find_entry(entry.name, relpath) is not None)
+			if (not is_watched) and (not recursive_watch):	# 不需要知道是否為資料夾
+				continue
+			try:
+				if entry.is_dir():
+					if not entry.is_symlink():
+						subdirs.append(entry.name)
+					continue
+				if not is_watched:
+					continue
+				finfo = entry.stat()
+			except OSError:
+				continue
+			file_stats.append((entry.name, finfo.st_size, finfo.st_mtime,))
+	except OSError as e:
+		if e.errno in (errno.ENOENT, errno.ENOTDIR,):	# 資料夾已被移除
+			return (relpath, [], [], None,)
+		raise
+	dir_mtime = folder_st.st_mtime
+	if max(folder_st.st_mtime, folder_st.st_ctime) >= (int(list_tstamp) - 1):	# 時戳精度內可能還有變動，下次不可略過
+		dir_mtime = None
+	folder_signature = (dir_mtime, folder_st.st_ctime, entry_count, tuple(subdirs),)
+	return (relpath, file_stats, subdirs if recursive_watch else [], folder_signature,)
+# ### def _scan_folder
+
+class _ScanSession(object):
+	""" 進行中的掃描: 以 generator 分段執行，每處理完一個資料夾暫停一次
+	待掃描的資料夾與進度可存成檢查點，重新啟動後由檢查點接續掃描
+	"""
+
+	def __init__(self, watcher_instance, checkpoint):
+		""" 建構子
+
+		參數:
+			watcher_instance - watcher.WatcherEngine 物件實體
+			checkpoint - 掃描檢查點字典 (見 _new_scan_checkpoint())
+		"""
+		super(_ScanSession, self).__init__()
+
+		self.watcher_instance = watcher_instance
+		self.target_directory = checkpoint['target_directory']
+		self.recursive_watch = checkpoint['recursive_watch']
+		self.scan_tstamp = checkpoint['scan_tstamp']
+		self.last_scan_time = checkpoint['last_scan_time']
+		self.scan_filter = watcher_instance.watch_entries if _prefilter_watch_entries else None
+		self.relist_folders = False	# 過濾規則變更後，上次記錄的資料夾簽章不能用來略過資料夾
+
+		self.pending = list(checkpoint['pending'])	# 尚未讀取的資料夾 (以堆疊順序處理)
+		self.failed_folders = list(checkpoint.get('failed_folders', ()))	# 無法讀取的資料夾 (本次掃描不產生刪除檔案資料)
+		self.inflight = set()	# 已送入工作池而尚未處理結果的資料夾
+		self.result_q = Queue.Queue()
+
+		self.resume_tstamp = time.time()
+		self.resume_folder_count = checkpoint['folder_count']
+		self.checkpoint_tstamp = self.resume_tstamp
+
+		self.steps = self._run()
+	# ### def __init__
+
+	def get_checkpoint(self):
+		""" 取得目前的掃描檢查點 (在兩次暫停之間，已處理的資料夾的子資料夾都已在待掃描串列中) """
+		checkpoint = {
+			'target_directory': self.target_directory,
+			'recursive_watch': self.recursive_watch,
+			'scan_tstamp': self.scan_tstamp,
+			'last_scan_time': self.last_scan_time,
+			'pending': list(self.inflight) + self.pending,
+			'failed_folders': list(self.failed_folders),
+			'last_folder_total': _last_folder_total,
+		}
+		for k in ('folder_count', 'file_count', 'changed_count', 'pruned_folder_count', 'filtered_folder_count', 'start_tstamp',):
+			checkpoint[k] = _scan_progress[k]
+		return checkpoint
+	# ### def get_checkpoint
+
+	def update_progress(self):
+		""" 更新待掃描資料夾數量與預估剩餘時間 (依本次啟動後的處理速度與上次掃描的資料夾總數估計) """
+		pending_count = len(self.pending) + len(self.inflight)
+		_scan_progress['pending_folder_count'] = pending_count
+		processed_count = _scan_progress['folder_count'] - self.resume_folder_count
+		elapsed = time.time() - self.resume_tstamp
+		if (processed_count > 0) and (elapsed > 0):
+			remaining_count = max(_last_folder_total - _scan_progress['folder_count'], pending_count)
+			_scan_progress['eta_second'] = remaining_count * elapsed / processed_count
+	# ### def update_progress
+
+	def _get_known_signature(self, relpath):
+		if _prune_unchanged_folders and (not self.relist_folders):
+			return _metastorage.get_folder_signature(relpath)
+		return None
+	# ### def _get_known_signature
+
+	def _next_result(self):
+		""" 取得下一個讀取完成的資料夾
+
+		回傳值:
+			(relpath, workerpool.PendingCall 物件) 形式的 tuple，沒有已完成的資料夾時為 None
+		"""
+		if _scan_pool is None:	# 在主迴圈中讀取
+			relpath = self.pending.pop()
+			self.inflight.add(relpath)
+			pcall = workerpool.PendingCall(_scan_folder, (self.target_directory, relpath, self.recursive_watch, self._get_known_signature(relpath), self.scan_filter,))
+			pcall.run()
+			return (relpath, pcall,)
+		while len(self.pending) > 0:
+			relpath = self.pending.pop()
+			self.inflight.add(relpath)
+			_scan_pool.submit(_scan_folder, (self.target_directory, relpath, self.recursive_watch, self._get_known_signature(relpath), self.scan_filter,), lambda pcall, relpath=relpath: self.result_q.put((relpath, pcall,)))
+		try:
+			relpath, pcall, = self.result_q.get(False)
+		except Queue.Empty:
+			return None
+		return (relpath, pcall,)
+	# ### def _next_result
+
+	def _run(self):
+		""" 掃描 (generator): 每處理完一個資料夾 yield 0，等待工作池讀取資料夾時 yield 建議的等待秒數 """
+		while (len(self.pending) > 0) or (len(self.inflight) > 0):
+			r = self._next_result()
+			if r is None:
+				yield _RESULT_POLL_INTERVAL
+				continue
+			relpath, pcall, = r
+			self.inflight.discard(relpath)
+			try:
+				result = pcall.wait()
+			except Exception as e:
+				syslog.syslog(syslog.LOG_WARNING, "periodical_scan: failed on scanning folder [%s]: [%s]" % (relpath, e,))
+				self.failed_folders.append(relpath)
+				yield 0
+				continue
+			relpath, file_stats, subdirs, folder_signature, = result
+
+			# {{{ 檢查是否要掃描子資料夾
+			for d in subdirs:
+				drel = os.path.join(relpath, d)
+				if (_ignorance_checker is not None) and _ignorance_checker(drel, None):
+					continue
+				if (self.scan_filter is not None) and (not self.scan_filter.may_match_folder_tree(drel)):
+					_scan_progress['filtered_folder_count'] += 1
+					continue
+				self.pending.append(drel)
+			# }}} 檢查是否要掃描子資料夾
+
+			if file_stats is None:
+				_check_unchanged_folder(self.last_scan_time, self.watcher_instance, self.target_directory, relpath, folder_signature, self.scan_tstamp)
+			else:
+				_check_folder_files(self.last_scan_time, self.watcher_instance, self.target_directory, relpath, file_stats, self.scan_tstamp)
+				if _prune_unchanged_folders and (folder_signature is not None):
+					_metastorage.checkin_folder_signature(relpath, folder_signature[0], folder_signature[1], folder_signature[2], folder_signature[3], self.scan_tstamp)
+			yield 0
+
+		if len(self.failed_folders) > 0:	# 無法讀取的資料夾內的檔案沒有更新紀錄，不能當作已刪除
+			syslog.syslog(syslog.LOG_WARNING, "periodical_scan: skipped deletion check, %d folder(s) could not be read (first: [%s])" % (len(self.failed_folders), self.failed_folders[0],))
+		else:
+			_report_deleted_files(self.watcher_instance, self.scan_tstamp)
+	# ### def _run
+# ### class _ScanSession
+
 
 _last_scan_tstamp = 0
+_last_folder_total = 0	# 上次完成的掃描所處理的資料夾數量 (估計剩餘時間用)
+_scan_session = None	# 進行中的掃描 (_ScanSession 物件)
+_resume_checkpoint = None	# 啟動時讀到的上次未完成掃描的檢查點
+
+def _get_checkpoint_name(target_directory):
+	return "periodical_scan:%s" % (target_directory,)
+# ### def _get_checkpoint_name
+
+def _get_filter_record_name(target_directory):
+	return "periodical_scan-filter:%s" % (target_directory,)
+# ### def _get_filter_record_name
+
+def _get_filter_fingerprint(scan_filter):
+	""" 取得過濾規則的內容 (檔名與路徑規則)，用來判斷上次記錄的資料夾簽章是否仍可使用 """
+	if scan_filter is None:
+		return None
+	return [(w_case.file_regex.pattern, None if (w_case.path_regex is None) else w_case.path_regex.pattern,) for w_case in scan_filter]
+# ### def _get_filter_fingerprint
+
+def _new_scan_checkpoint(target_directory, recursive_watch, current_tstamp):
+	""" 建立由根資料夾開始掃描的檢查點 """
+	return {
+		'target_directory': target_directory,
+		'recursive_watch': recursive_watch,
+		'scan_tstamp': int(current_tstamp),
+		'last_scan_time': _last_scan_tstamp,
+		'pending': [''],
+		'last_folder_total': _last_folder_total,
+		'folder_count': 0,
+		'file_count': 0,
+		'changed_count': 0,
+		'pruned_folder_count': 0,
+		'filtered_folder_count': 0,
+		'start_tstamp': current_tstamp,
+	}
+# ### def _new_scan_checkpoint
+
+def _save_scan_checkpoint(session):
+	if _metastorage is None:	# 沒有 MetaStorage 時無法接續掃描
+		return
+	_metastorage.save_scan_checkpoint(_get_checkpoint_name(session.target_directory), session.get_checkpoint())
+	session.checkpoint_tstamp = time.time()
+# ### def _save_scan_checkpoint
+
+def _start_scan(watcher_instance, checkpoint):
+	""" 開始 (或由檢查點接續) 掃描，之後由主迴圈分段執行
+
+	參數:
+		watcher_instance - watcher.WatcherEngine 物件實體
+		checkpoint - 掃描檢查點字典
+	回傳值:
+		(無)
+	"""
+	global _scan_session, _last_folder_total
+
+	_last_folder_total = checkpoint['last_folder_total']
+	_scan_progress.update({'running': 1, 'pending_folder_count': len(checkpoint['pending']), 'eta_second': None,})
+	for k in ('folder_count', 'file_count', 'changed_count', 'pruned_folder_count', 'start_tstamp',):
+		_scan_progress[k] = checkpoint[k]
+	_scan_progress['filtered_folder_count'] = checkpoint.get('filtered_folder_count', 0)
+	_scan_session = _ScanSession(watcher_instance, checkpoint)
+	if _prune_unchanged_folders and (_metastorage.load_scan_checkpoint(_get_filter_record_name(_scan_session.target_directory)) != _get_filter_fingerprint(_scan_session.scan_filter)):
+		_scan_session.relist_folders = True
+		syslog.syslog(syslog.LOG_INFO, "periodical_scan: watch entry filter changed, list all folders in this scan")
+	watcher_instance.process_driver.call_later(0, _advance_scan, watcher_instance)
+# ### def _start_scan
+
+def _finish_scan(session):
+	global _scan_session, _last_scan_tstamp, _last_folder_total
+
+	_scan_session = None
+	current_tstamp = time.time()
+	_last_scan_tstamp = current_tstamp
+	_last_folder_total = _scan_progress['folder_count']
+	_scan_progress.update({'running': 0, 'pending_folder_count': 0, 'eta_second': 0, 'last_scan_elapsed': current_tstamp - _scan_progress['start_tstamp'],})
+	if _metastorage is not None:
+		_metastorage.save_scan_checkpoint(_get_checkpoint_name(session.target_directory), None)
+	if _prune_unchanged_folders and session.relist_folders:
+		_metastorage.save_scan_checkpoint(_get_filter_record_name(session.target_directory), _get_filter_fingerprint(session.scan_filter))
+	syslog.syslog(syslog.LOG_INFO, "periodical_scan: finished (folders=%d, files=%d, changed=%d, pruned-folders=%d, filtered-folders=%d, failed-folders=%d, elapsed=%.1fs)" % (_scan_progress['folder_count'], _scan_progress['file_count'], _scan_progress['changed_count'], _scan_progress['pruned_folder_count'], _scan_progress['filtered_folder_count'], len(session.failed_folders), _scan_progress['last_scan_elapsed'],))
+# ### def _finish_scan
+
+def _advance_scan(watcher_instance):
+	""" (由主迴圈呼叫) 在一個時間片段內推進進行中的掃描，未完成時排定下一個片段 """
+	global _scan_session
+
+	session = _scan_session
+	if session is None:
+		return
+	deadline_tstamp = time.time() + _scan_time_slice
+	delay = 0
+	try:
+		while True:
+			wait_second = session.steps.next()
+			if wait_second > 0:
+				delay = wait_second
+				break
+			if time.time() >= deadline_tstamp:
+				break
+	except StopIteration:
+		_finish_scan(session)
+		return
+	except Exception as e:
+		syslog.syslog(syslog.LOG_WARNING, "periodical_scan: scan aborted: [%s]" % (e,))
+		_scan_session = None
+		_scan_progress['running'] = 0
+		return
+	session.update_progress()
+	if (time.time() - session.checkpoint_tstamp) >= _CHECKPOINT_INTERVAL:
+		_save_scan_checkpoint(session)
+		syslog.syslog(syslog.LOG_DEBUG, "periodical_scan: checkpoint (folders=%d, pending=%d, eta=%r)" % (_scan_progress['folder_count'], _scan_progress['pending_folder_count'], _scan_progress['eta_second'],))
+	watcher_instance.process_driver.call_later(delay, _advance_scan, watcher_instance)
+# ### def _advance_scan
 
 def _scan_worker(arg):
-	global _last_scan_tstamp
+	global _resume_checkpoint
 
 	watcher_instance, target_directory, recursive_watch, = arg
 
+	if _scan_session is not None:	# 上一次掃描尚未完成
+		return
+
 	min_scan_interval = _scan_interval / 4
 
 	perform_scan = False
@@ -167,7 +676,9 @@ def _scan_worker(arg):
 	tz_offset = metadatum.get_tzoffset()
 
 	# {{{ check if need do scan
-	if (current_tstamp - _last_scan_tstamp) > min_scan_interval:	# must > min_scan_interval to avoid over-scan
+	if _resume_checkpoint is not None:	# 接續重新啟動前未完成的掃描
+		perform_scan = True
+	elif (current_tstamp - _last_scan_tstamp) > min_scan_interval:	# must > min_scan_interval to avoid over-scan
 		if True == _cron_interval_style:
 			if (current_tstamp - (current_tstamp % _scan_interval)) > _last_scan_tstamp:
 				perform_scan = True
@@ -190,10 +701,13 @@ def _scan_worker(arg):
 		if _ignorance_checker is not None:
 			_ignorance_checker(None, None)
 
-		_scan_walk_impl(_last_scan_tstamp, watcher_instance, target_directory, recursive_watch)	# do scan
-
-		current_tstamp = time.time()
-		_last_scan_tstamp = current_tstamp
+		checkpoint = _resume_checkpoint
+		_resume_checkpoint = None
+		if checkpoint is None:
+			checkpoint = _new_scan_checkpoint(target_directory, recursive_watch, current_tstamp)
+		else:
+			syslog.syslog(syslog.LOG_INFO, "periodical_scan: resume scan started at %r (pending folders=%d)" % (checkpoint['start_tstamp'], len(checkpoint['pending']),))
+		_start_scan(watcher_instance, checkpoint)	# do scan
 # ### def _scan_worker
 
 
@@ -208,19 +722,63 @@ def monitor_start(watcher_instance, target_directory, recursive_watch=False):
 	回傳值:
 		(無)
 	"""
+	global _scan_pool, _resume_checkpoint
+
+	if (_scan_worker_count > 0) and (_scan_pool is None):
+		_scan_pool = workerpool.WorkerPool('periodical-scan', _scan_worker_count)
+		_scan_pool.start()
+
+	# {{{ 讀取上次未完成掃描的檢查點
+	if _metastorage is not None:
+		checkpoint = _metastorage.load_scan_checkpoint(_get_checkpoint_name(target_directory))
+		if (checkpoint is not None) and (checkpoint.get('recursive_watch') == recursive_watch) and (checkpoint.get('target_directory') == target_directory):
+			_resume_checkpoint = checkpoint
+	# }}} 讀取上次未完成掃描的檢查點
+
 	watcher_instance.process_driver.append_periodical_call(_scan_worker, (watcher_instance, target_directory, recursive_watch,), (_scan_interval / 4))
 # ### def monitor_start
 
 
+def get_module_gauges():
+	""" 取得監視器即時量測值 (選用，由主迴圈呼叫，不可等待任何鎖或 I/O)
+
+	參數:
+		(無)
+	回傳值:
+		(名稱, 標籤字典, 數值) 形式的 tuple 串列
+	"""
+	gauges = [('periodical_scan_last_tstamp', None, _last_scan_tstamp,)]
+	for k in ('running', 'folder_count', 'file_count', 'changed_count', 'pruned_folder_count', 'filtered_folder_count', 'pending_folder_count', 'eta_second', 'start_tstamp', 'last_scan_elapsed',):
+		gauges.append(('periodical_scan_' + k, None, _scan_progress[k],))
+	gauges.append(('periodical_scan_probe_pending_count', None, len(_probe_heap),))
+	for k in ('promoted', 'expired',):
+		gauges.append(('periodical_scan_probe_' + k + '_count', None, _probe_stats[k],))
+	return gauges
+# ### def get_module_gauges
+
+
 def monitor_stop():
-	""" 停止作業，準備結束
+	""" 停止作業，準備結束 (掃描進行中時儲存檢查點，下次啟動時接續)
 
 	參數:
 		(無)
 	回傳值:
 		(無)
 	"""
-	pass
+	global _scan_pool, _scan_session, _probe_timer_due
+
+	if _scan_session is not None:
+		_scan_session.update_progress()
+		_save_scan_checkpoint(_scan_session)
+		syslog.syslog(syslog.LOG_INFO, "periodical_scan: saved scan checkpoint (folders=%d, pending=%d)" % (_scan_progress['folder_count'], _scan_progress['pending_folder_count'],))
+		_scan_session = None
+	if _scan_pool is not None:
+		_scan_pool.stop()
+		_scan_pool = None
+	# 尚未再次確認的檔案留給下次掃描處理
+	del _probe_heap[:]
+	_probe_pending.clear()
+	_probe_timer_due = None
 # ### def monitor_stop
 
 
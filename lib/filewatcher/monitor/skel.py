@@ -46,6 +46,18 @@ def monitor_start(watcher_instance, target_directory, recursive_watch=False):
 # ### def monitor_start
 
 
+def get_module_gauges():
+	""" 取得監視器即時量測值 (選用，由主迴圈呼叫，不可等待任何鎖或 I/O)
+
+	參數:
+		(無)
+	回傳值:
+		(名稱, 標籤字典, 數值) 形式的 tuple 串列
+	"""
+	return []
+# ### def get_module_gauges
+
+
 def monitor_stop():
 	""" 停止作業，準備結束
 
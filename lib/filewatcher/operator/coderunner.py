@@ -6,6 +6,7 @@ import re
 import subprocess
 import syslog
 import threading
+import collections
 import Queue
 
 from filewatcher import componentprop
@@ -61,6 +62,10 @@ class _RunnerQueue:
 
 		self.cmd_queue = None
 		self.workers = None
+
+		self.async_running = None	# 以主迴圈等待結束的子行程 (popen, cmd) 串列
+		self.async_backlog = None
+		self._async_lock = threading.Lock()
 	# ### def __init__
 
 	def start_workers(self):
@@ -84,6 +89,78 @@ class _RunnerQueue:
 		syslog.syslog(syslog.LOG_INFO, "allocated threaded runner (Q=%r, size=%d)" % (self.queue_label, self.max_running_process,))
 	# ### def start_workers
 
+	def start_async(self):
+		""" 啟動由主迴圈等待子行程結束的執行方式 (不使用 worker thread)，需搭配 reap_children() 使用
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		if (self.max_running_process is None) or (self.max_running_process < 1):
+			syslog.syslog(syslog.LOG_INFO, "allocated static runner (Q=%r)" % (self.queue_label,))
+			return	# 最大執行行程為空值的話則維持直接執行
+
+		self.async_running = []
+		self.async_backlog = collections.deque()
+		syslog.syslog(syslog.LOG_INFO, "allocated asynchronous runner (Q=%r, size=%d)" % (self.queue_label, self.max_running_process,))
+	# ### def start_async
+
+	def _spawn_child(self, cmd):
+		""" (需在持有 _async_lock 時呼叫) 啟動子行程但不等待結束 """
+		try:
+			p = subprocess.Popen(cmd)
+		except Exception as e:
+			print "Have exception on subprocess.Popen: cmd=%r; exception=%s" % (cmd, e,)
+			syslog.syslog(syslog.LOG_INFO, "QueuedInvoke: run program [%s] with retcode=%d, Q=%r." % (cmd, -65536, self.queue_label,))
+			return
+		self.async_running.append((p, cmd,))
+	# ### def _spawn_child
+
+	def _run_async(self, cmd):
+		with self._async_lock:
+			if len(self.async_running) < self.max_running_process:
+				self._spawn_child(cmd)
+			else:
+				self.async_backlog.append(cmd)
+	# ### def _run_async
+
+	def reap_children(self):
+		""" 回收已結束的子行程，並由等待中的命令補上空出的執行數
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		if self.async_running is None:
+			return
+		with self._async_lock:
+			still_running = []
+			for p, cmd, in self.async_running:
+				retcode = p.poll()
+				if retcode is None:
+					still_running.append((p, cmd,))
+				else:
+					syslog.syslog(syslog.LOG_INFO, "QueuedInvoke: run program [%s] with retcode=%d, pid=%d/%r." % (cmd, retcode, p.pid, self.queue_label,))
+			self.async_running = still_running
+			while (len(self.async_backlog) > 0) and (len(self.async_running) < self.max_running_process):
+				self._spawn_child(self.async_backlog.popleft())
+	# ### def reap_children
+
+	def get_gauges(self):
+		""" 取得佇列即時量測值 (不等待 lock)
+
+		參數: (無)
+		回傳值:
+			(名稱, 標籤字典, 數值) 形式的 tuple 串列
+		"""
+		labels = {'queue': self.queue_label}
+		gauges = [('coderunner_max_running', labels, self.max_running_process,)]
+		if self.async_running is not None:
+			gauges.append(('coderunner_queue_depth', labels, len(self.async_backlog),))
+			gauges.append(('coderunner_running', labels, len(self.async_running),))
+		elif self.cmd_queue is not None:
+			gauges.append(('coderunner_queue_depth', labels, self.cmd_queue.qsize(),))
+		return gauges
+	# ### def get_gauges
+
 	def run_program(self, cmdlist, filepath, carry_variable, logqueue):
 		""" 執行指定的程式執行作業
 
@@ -116,7 +193,10 @@ class _RunnerQueue:
 					cmd.append(v)
 		# }}} build command
 
-		if self.cmd_queue is None:
+		if self.async_running is not None:
+			self._run_async(cmd)
+			logqueue.append("queued program [%s: %r] into queue=%s" % (progpath, cmd, self.queue_label))
+		elif self.cmd_queue is None:
 			runprog_retcode = subprocess.call(cmd)
 			logqueue.append("run program [%s: %r] with retcode=%d" % (progpath, cmd, runprog_retcode))
 		else:
@@ -130,6 +210,9 @@ class _RunnerQueue:
 		參數: (無)
 		回傳值: (無)
 		"""
+		if self.async_running is not None:
+			self._wait_async_children()
+			return
 		if self.cmd_queue is None:
 			return	# no worker running, naturally
 		for wk in self.workers:
@@ -140,6 +223,18 @@ class _RunnerQueue:
 		syslog.syslog(syslog.LOG_NOTICE, "RunnerQueue joining task queue (Q=%r)" % (self.queue_label,))
 		self.cmd_queue.join()
 	# ### def stop_workers
+
+	def _wait_async_children(self):
+		""" 等待所有子行程與等待中的命令執行完畢 """
+		syslog.syslog(syslog.LOG_NOTICE, "RunnerQueue waiting child processes (Q=%r)" % (self.queue_label,))
+		while True:
+			with self._async_lock:
+				if len(self.async_running) < 1:
+					break
+				p = self.async_running[0][0]
+			p.wait()
+			self.reap_children()
+	# ### def _wait_async_children
 # ### class Runner
 
 
@@ -194,12 +289,33 @@ def operator_configure(config, metastorage):
 
 	# setup default queue
 	_runner_queue['_DEFAULT'] = _RunnerQueue('_DEFAULT', default_max_running_process)
+# ### def operator_configure
+
 
-	# {{{ start workers
+def _reap_async_children(arg):
 	for runner in _runner_queue.itervalues():
-		runner.start_workers()
-	# }}} start workers
-# ### def operator_configure
+		runner.reap_children()
+# ### def _reap_async_children
+
+
+def operator_start(watcher_instance):
+	""" 開始作業: 主迴圈可以通知子行程結束時，以主迴圈回收子行程，否則啟動 worker thread 等待子行程
+
+	參數:
+		watcher_instance - watcher.WatcherEngine 物件實體
+	回傳值:
+		(無)
+	"""
+	process_driver = watcher_instance.process_driver
+	if hasattr(process_driver, 'add_child_watcher'):
+		for runner in _runner_queue.itervalues():
+			runner.start_async()
+		process_driver.add_child_watcher(_reap_async_children, None)
+		process_driver.append_periodical_call(_reap_async_children, None, 10)	# 防止遺漏 SIGCHLD
+	else:
+		for runner in _runner_queue.itervalues():
+			runner.start_workers()
+# ### def operator_start
 
 
 def read_operation_argv(argv):
@@ -278,6 +394,21 @@ def perform_operation(current_filepath, orig_filename, argv, oprexec_ref, logque
 # ### def perform_operation
 
 
+def get_module_gauges():
+	""" 取得操作器即時量測值 (選用，由主迴圈呼叫，不可等待任何鎖或 I/O)
+
+	參數:
+		(無)
+	回傳值:
+		(名稱, 標籤字典, 數值) 形式的 tuple 串列
+	"""
+	gauges = []
+	for runner in _runner_queue.itervalues():
+		gauges.extend(runner.get_gauges())
+	return gauges
+# ### def get_module_gauges
+
+
 def operator_stop():
 	""" 停止作業，準備結束
 
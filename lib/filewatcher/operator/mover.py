@@ -9,7 +9,7 @@ import shutil
 from filewatcher import componentprop
 
 
-_cached_module_prop_instance = componentprop.OperatorProp('mover', 'move_to', schedule_priority=2, run_priority=2)
+_cached_module_prop_instance = componentprop.OperatorProp('mover', 'move_to', schedule_priority=2, run_priority=2, consume_file=True)
 def get_module_prop():
 	""" 取得操作器各項特性/屬性
 
@@ -32,6 +32,18 @@ def operator_configure(config, metastorage):
 # ### def operator_configure
 
 
+def operator_start(watcher_instance):
+	""" 開始作業 (選用，監看引擎啟動時呼叫)
+
+	參數:
+		watcher_instance - watcher.WatcherEngine 物件實體
+	回傳值:
+		(無)
+	"""
+	pass
+# ### def operator_start
+
+
 def read_operation_argv(argv):
 	""" 取得操作設定
 
@@ -61,6 +73,18 @@ def perform_operation(current_filepath, orig_filename, argv, oprexec_ref, logque
 # ### def perform_operation
 
 
+def get_module_gauges():
+	""" 取得操作器即時量測值 (選用，由主迴圈呼叫，不可等待任何鎖或 I/O)
+
+	參數:
+		(無)
+	回傳值:
+		(名稱, 標籤字典, 數值) 形式的 tuple 串列
+	"""
+	return []
+# ### def get_module_gauges
+
+
 def operator_stop():
 	""" 停止作業，準備結束
 
@@ -0,0 +1,214 @@
+
+# -*- coding: utf-8 -*-
+
+""" 事件處理各階段的計數器與延遲直方圖 """
+
+import threading
+
+
+
+_SUB_BUCKET_BITS = 4	# 每個 2 的次方區段再線性切分為 16 格 (相對誤差約 6%)
+_SUB_BUCKET_COUNT = 1 << _SUB_BUCKET_BITS
+_MAX_SHIFT = 40	# 可記錄到約 2^44 微秒 (約 200 天)
+_BUCKET_COUNT = (_MAX_SHIFT + 2) * _SUB_BUCKET_COUNT
+
+_REPORT_PERCENTILES = (('p50', 0.50,), ('p90', 0.90,), ('p99', 0.99,), ('p999', 0.999,),)
+
+
+def _value_to_bucket(v):
+	""" 取得微秒數值所屬的直方圖格子索引
+
+	參數:
+		v - 微秒數 (非負整數)
+	回傳值:
+		格子索引
+	"""
+	if v < _SUB_BUCKET_COUNT:
+		return v
+	shift = min(v.bit_length() - _SUB_BUCKET_BITS - 1, _MAX_SHIFT)
+	sub_idx = min(v >> shift, (_SUB_BUCKET_COUNT * 2) - 1) - _SUB_BUCKET_COUNT
+	return ((shift + 1) << _SUB_BUCKET_BITS) + sub_idx
+# ### def _value_to_bucket
+
+
+def _bucket_to_value(idx):
+	""" 取得直方圖格子的代表值 (格子範圍的中間值)
+
+	參數:
+		idx - 格子索引
+	回傳值:
+		微秒數
+	"""
+	if idx < _SUB_BUCKET_COUNT:
+		return idx
+	shift = (idx >> _SUB_BUCKET_BITS) - 1
+	lower_bound = (_SUB_BUCKET_COUNT + (idx & (_SUB_BUCKET_COUNT - 1))) << shift
+	return lower_bound + ((1 << shift) >> 1)
+# ### def _bucket_to_value
+
+
+class LatencyHistogram(object):
+	""" HDR 風格 (依 2 的次方分段，段內線性切分) 的延遲直方圖，以微秒為單位記錄 """
+
+	def __init__(self):
+		super(LatencyHistogram, self).__init__()
+
+		self.buckets = [0] * _BUCKET_COUNT
+		self.count = 0
+		self.total_usec = 0
+		self.min_usec = None
+		self.max_usec = 0
+	# ### def __init__
+
+	def record(self, elapsed_second):
+		""" 記錄一筆耗時 (呼叫端需自行處理同步)
+
+		參數:
+			elapsed_second - 耗時 (秒)
+		回傳值:
+			(無)
+		"""
+		v = max(int(elapsed_second * 1000000.0), 0)
+		self.buckets[_value_to_bucket(v)] += 1
+		self.count = self.count + 1
+		self.total_usec = self.total_usec + v
+		if (self.min_usec is None) or (v < self.min_usec):
+			self.min_usec = v
+		if v > self.max_usec:
+			self.max_usec = v
+	# ### def record
+
+	def get_percentile(self, ratio):
+		""" 取得百分位數
+
+		參數:
+			ratio - 百分位 (0.0 ~ 1.0)
+		回傳值:
+			微秒數，沒有紀錄時傳回 None
+		"""
+		if self.count < 1:
+			return None
+		threshold = max(int(self.count * ratio + 0.5), 1)
+		accumulated = 0
+		for idx, c, in enumerate(self.buckets):
+			accumulated = accumulated + c
+			if accumulated >= threshold:
+				return min(_bucket_to_value(idx), self.max_usec)
+		return self.max_usec
+	# ### def get_percentile
+
+	def snapshot(self):
+		""" 取得統計值
+
+		參數: (無)
+		回傳值:
+			含有 count, min, max, mean 與各百分位數 (微秒) 的字典
+		"""
+		r = {
+			'count': self.count,
+			'min': self.min_usec,
+			'max': self.max_usec,
+			'mean': ((self.total_usec / self.count) if (self.count > 0) else None),
+		}
+		for k, ratio, in _REPORT_PERCENTILES:
+			r[k] = self.get_percentile(ratio)
+		return r
+	# ### def snapshot
+# ### class LatencyHistogram
+
+
+class StageStatistics(object):
+	""" 以 (階段, 監看項目, 操作名稱) 為鍵的延遲直方圖，以及以 (計數器名稱, 監看項目) 為鍵的計數器 """
+
+	def __init__(self):
+		super(StageStatistics, self).__init__()
+
+		self._lock = threading.Lock()
+		self._histograms = {}
+		self._counters = {}
+	# ### def __init__
+
+	def record(self, stage_name, elapsed_second, entry_label='*', operator_name=None):
+		""" 記錄一個階段的耗時
+
+		參數:
+			stage_name - 階段名稱
+			elapsed_second - 耗時 (秒)
+			entry_label='*' - 監看項目標籤，尚未比對到監看項目的階段使用 '*'
+			operator_name=None - 操作名稱 (僅用於操作階段)
+		回傳值:
+			(無)
+		"""
+		k = (stage_name, entry_label, operator_name,)
+		with self._lock:
+			h = self._histograms.get(k)
+			if h is None:
+				h = LatencyHistogram()
+				self._histograms[k] = h
+			h.record(elapsed_second)
+	# ### def record
+
+	def increase(self, counter_name, entry_label='*'):
+		""" 計數器加一
+
+		參數:
+			counter_name - 計數器名稱
+			entry_label='*' - 監看項目標籤
+		回傳值:
+			(無)
+		"""
+		k = (counter_name, entry_label,)
+		with self._lock:
+			self._counters[k] = self._counters.get(k, 0) + 1
+	# ### def increase
+
+	def snapshot(self, reset=False):
+		""" 取得目前的統計資料
+
+		參數:
+			reset=False - 取得後是否清除統計資料
+		回傳值:
+			含有 histograms 與 counters 兩個串列的字典:
+			histograms - 每個元素為含有 stage, entry, operator 與 LatencyHistogram.snapshot() 各欄位的字典
+			counters - 每個元素為含有 counter, entry, value 的字典
+		"""
+		with self._lock:
+			histograms = self._histograms
+			counters = self._counters
+			if reset:
+				self._histograms = {}
+				self._counters = {}
+			histogram_result = []
+			for k in sorted(histograms.iterkeys()):
+				stage_name, entry_label, operator_name, = k
+				r = histograms[k].snapshot()
+				r['stage'] = stage_name
+				r['entry'] = entry_label
+				r['operator'] = operator_name
+				histogram_result.append(r)
+			counter_result = [{'counter': k[0], 'entry': k[1], 'value': counters[k]} for k in sorted(counters.iterkeys())]
+		return {'histograms': histogram_result, 'counters': counter_result}
+	# ### def snapshot
+
+	def format_report(self, reset=False):
+		""" 將統計資料轉為記錄用的字串串列
+
+		參數:
+			reset=False - 取得後是否清除統計資料
+		回傳值:
+			字串串列
+		"""
+		snapshot = self.snapshot(reset)
+		result = []
+		for r in snapshot['histograms']:
+			stage_name = r['stage'] if (r['operator'] is None) else ("%s:%s" % (r['stage'], r['operator'],))
+			result.append("stage=%s entry=%s count=%d mean=%rus p50=%rus p99=%rus max=%rus" % (stage_name, r['entry'], r['count'], r['mean'], r['p50'], r['p99'], r['max'],))
+		for r in snapshot['counters']:
+			result.append("counter=%s entry=%s value=%d" % (r['counter'], r['entry'], r['value'],))
+		return result
+	# ### def format_report
+# ### class StageStatistics
+
+
+
+# vim: ts=4 sw=4 ai nowrap
@@ -0,0 +1,179 @@
+
+# -*- coding: utf-8 -*-
+
+""" 以 Unix socket 提供即時量測值 (JSON 或 Prometheus 文字格式)，由主迴圈以非同步方式服務 """
+
+import os
+import stat
+import time
+import json
+import socket
+import syslog
+import asyncore
+
+
+
+_MAX_REQUEST_SIZE = 1024
+_METRIC_PREFIX = 'filewatcher_'
+
+
+def _escape_label_value(v):
+	return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+# ### def _escape_label_value
+
+
+def format_gauges_json(gauges, tstamp):
+	""" 將量測值轉為 JSON 字串
+
+	參數:
+		gauges - (名稱, 標籤字典, 數值) 形式的 tuple 串列
+		tstamp - 量測時戳
+	回傳值:
+		JSON 字串
+	"""
+	l = []
+	for metric_name, labels, value, in gauges:
+		l.append({'name': metric_name, 'labels': (labels or {}), 'value': value})
+	return json.dumps({'tstamp': tstamp, 'gauges': l})
+# ### def format_gauges_json
+
+
+def format_gauges_prometheus(gauges):
+	""" 將量測值轉為 Prometheus 文字格式
+
+	參數:
+		gauges - (名稱, 標籤字典, 數值) 形式的 tuple 串列，數值為 None 的項目會略過
+	回傳值:
+		Prometheus 文字格式字串
+	"""
+	grouped = {}
+	metric_order = []
+	for metric_name, labels, value, in gauges:
+		if value is None:
+			continue
+		if metric_name not in grouped:
+			grouped[metric_name] = []
+			metric_order.append(metric_name)
+		grouped[metric_name].append((labels, value,))
+	lines = []
+	for metric_name in metric_order:
+		full_name = _METRIC_PREFIX + metric_name
+		lines.append("# TYPE %s gauge" % (full_name,))
+		for labels, value, in grouped[metric_name]:
+			if labels:
+				label_text = ','.join(["%s=\"%s\"" % (k, _escape_label_value(labels[k]),) for k in sorted(labels.iterkeys())])
+				lines.append("%s{%s} %r" % (full_name, label_text, float(value),))
+			else:
+				lines.append("%s %r" % (full_name, float(value),))
+	lines.append('')
+	return '\n'.join(lines)
+# ### def format_gauges_prometheus
+
+
+class _StatsRequestChannel(asyncore.dispatcher):
+	""" 讀取一行請求 ('json' 或 'prometheus')，送出量測值後關閉連線 """
+
+	def __init__(self, sock, endpoint, async_map):
+		asyncore.dispatcher.__init__(self, sock, map=async_map)
+		self.endpoint = endpoint
+		self.request_buffer = ''
+		self.response_buffer = None
+	# ### def __init__
+
+	def readable(self):
+		return self.response_buffer is None
+	# ### def readable
+
+	def writable(self):
+		return self.response_buffer is not None
+	# ### def writable
+
+	def handle_read(self):
+		data = self.recv(_MAX_REQUEST_SIZE)
+		if not data:
+			return
+		self.request_buffer = self.request_buffer + data
+		if ('\n' in self.request_buffer) or (len(self.request_buffer) >= _MAX_REQUEST_SIZE):
+			request_line = self.request_buffer.split('\n', 1)[0].strip()
+			self.response_buffer = self.endpoint.build_response(request_line)
+	# ### def handle_read
+
+	def handle_write(self):
+		sent = self.send(self.response_buffer)
+		self.response_buffer = self.response_buffer[sent:]
+		if len(self.response_buffer) < 1:
+			self.close()
+	# ### def handle_write
+
+	def handle_close(self):
+		self.close()
+	# ### def handle_close
+
+	def handle_error(self):
+		syslog.syslog(syslog.LOG_WARNING, "stats endpoint: dropped client on error")
+		self.close()
+	# ### def handle_error
+# ### class _StatsRequestChannel
+
+
+class StatsEndpoint(asyncore.dispatcher):
+	""" 在 Unix socket 上接受量測值查詢
+
+	用戶端連線後送出一行請求: 'json' (預設) 或 'prometheus'，伺服端回應後關閉連線，例如:
+		echo prometheus | socat - UNIX-CONNECT:/var/run/filewatcher.sock
+	"""
+
+	def __init__(self, gauge_source, socket_path, async_map):
+		""" 建構子
+
+		參數:
+			gauge_source - 取得量測值的函式，傳回 (名稱, 標籤字典, 數值) 形式的 tuple 串列
+			socket_path - Unix socket 路徑
+			async_map - 主迴圈的 asyncore 通道字典
+		"""
+		asyncore.dispatcher.__init__(self, map=async_map)
+		self.gauge_source = gauge_source
+		self.socket_path = socket_path
+
+		if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+			os.unlink(socket_path)	# 移除上次執行留下的 socket
+		self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.bind(socket_path)
+		self.listen(8)
+		syslog.syslog(syslog.LOG_INFO, "stats endpoint listening on [%s]" % (socket_path,))
+	# ### def __init__
+
+	def handle_accept(self):
+		pair = self.accept()
+		if pair is None:
+			return
+		sock, _addr, = pair
+		_StatsRequestChannel(sock, self, self._map)
+	# ### def handle_accept
+
+	def build_response(self, request_line):
+		""" 產生回應內容
+
+		參數:
+			request_line - 請求內容 ('json' 或 'prometheus')
+		回傳值:
+			回應字串
+		"""
+		gauges = self.gauge_source()
+		if request_line.lower() in ('prometheus', 'metrics',):
+			return format_gauges_prometheus(gauges)
+		return format_gauges_json(gauges, time.time()) + '\n'
+	# ### def build_response
+
+	def close(self):
+		asyncore.dispatcher.close(self)
+		try:
+			os.unlink(self.socket_path)
+		except OSError:
+			pass
+	# ### def close
+# ### class StatsEndpoint
+
+
+
+# vim: ts=4 sw=4 ai nowrap
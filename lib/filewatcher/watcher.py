@@ -2,15 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import os
+import copy
 import time
 import signal
 import syslog
 import shutil
 import re
+import errno
+import fcntl
+import select
+import heapq
+import random
+import itertools
+import functools
+import threading
 import asyncore
 
 from filewatcher import filewatchconfig
 from filewatcher import metadatum
+from filewatcher import dispatcher
+from filewatcher import stagestats
+from filewatcher import statsendpoint
+from filewatcher import workerpool
 
 
 FEVENT_NEW = 1
@@ -29,7 +42,8 @@ class OperationExecRef(object):
 		參數:
 			filename_matchobj - 檔名 regex 比對結果物件
 			pathname_matchobj - 路徑 regex 比對結果物件 (如果有設定路徑比對，否則為 None)
-			digisig - 數位簽章 (如果有設定內容重複檢查或是夾帶數位簽章，否則為 None)
+			digisig - 數位簽章 (如果有設定內容重複檢查或是夾帶數位簽章，否則為 None；啟用 duplicate_check_prefilter 時，
+				大小與取樣簽章沒有和既有紀錄相符、也沒有現成簽章 (監視器即時計算或是簽章快取) 的新檔案不計算完整簽章，這裡也會是 None)
 			event_type - 事件形式
 			is_dismiss_event - 是否為檔案刪除事件
 		"""
@@ -52,43 +66,184 @@ class OperationExecRef(object):
 
 
 class PeriodicalCall(object):
-	def __init__(self, call_object, call_arg=None, min_interval=10):
+	""" 定期呼叫項目，記錄排定時間與執行統計 """
+
+	def __init__(self, call_object, call_arg=None, min_interval=10, jitter_ratio=0.05):
+		""" 建構子
+		參數:
+			call_object - 要呼叫的函式，函數原型: (call_arg)
+			call_arg - 呼叫參數
+			min_interval - 呼叫間隔 (秒)，最小為 10 秒
+			jitter_ratio - 每次排定時間加上的隨機延遲上限 (呼叫間隔的比例)，避免多個定期呼叫同時執行
+		"""
 		super(PeriodicalCall, self).__init__()
 
 		self.call_object = call_object
 		self.call_arg = call_arg
 
 		self.min_interval = max(min_interval, 10)
+		self.jitter_second = max(self.min_interval * jitter_ratio, 0)
+
+		self.scheduled_tstamp = 0	# 未加隨機延遲的排定時間
+		self.deadline_tstamp = 0	# 實際排定的呼叫時間
 
-		self.actual_min_interval = self.min_interval
-		self.last_invoke_tstamp = 0;
+		self.run_count = 0
+		self.overrun_count = 0	# 執行時間超過呼叫間隔的次數
+		self.skipped_count = 0	# 因延遲而略過的排定次數
+		self.last_elapsed = 0.0
+		self.last_lateness = 0.0
 	# ### def __init__
 
-	def __recaculate_invoke_interval(self, last_time_consumption):
-		new_interval = int( ((self.actual_min_interval * 98) + last_time_consumption + self.min_interval) / 100 )
-		if new_interval > self.min_interval:
-			self.actual_min_interval = new_interval
-	# ### def __recaculate_invoke_interval
+	def get_name(self):
+		return getattr(self.call_object, '__name__', repr(self.call_object))
+	# ### def get_name
+
+	def schedule_first(self, current_tstamp):
+		""" 排定第一次呼叫的時間 (立即呼叫)
+
+		參數:
+			current_tstamp - 目前時戳
+		回傳值:
+			排定的呼叫時戳
+		"""
+		self.scheduled_tstamp = current_tstamp
+		self.deadline_tstamp = current_tstamp
+		return self.deadline_tstamp
+	# ### def schedule_first
+
+	def schedule_next(self, current_tstamp):
+		""" 依固定間隔排定下一次呼叫的時間，已經錯過的排定時間會被略過並計數
+
+		參數:
+			current_tstamp - 目前時戳
+		回傳值:
+			排定的呼叫時戳
+		"""
+		next_tstamp = self.scheduled_tstamp + self.min_interval
+		if next_tstamp <= current_tstamp:
+			missed = int((current_tstamp - next_tstamp) / self.min_interval) + 1
+			self.skipped_count = self.skipped_count + missed
+			next_tstamp = next_tstamp + (missed * self.min_interval)
+		self.scheduled_tstamp = next_tstamp
+		self.deadline_tstamp = next_tstamp + random.uniform(0, self.jitter_second)
+		return self.deadline_tstamp
+	# ### def schedule_next
 
 	def invoke(self):
-		current_tstamp = time.time()
+		""" 執行呼叫並記錄執行統計
 
-		if (current_tstamp - self.last_invoke_tstamp) > self.actual_min_interval:
+		參數:
+			(無)
+		回傳值:
+			呼叫結束時的時戳
+		"""
+		current_tstamp = time.time()
+		self.last_lateness = max(current_tstamp - self.deadline_tstamp, 0.0)
+		try:
 			self.call_object(self.call_arg)
+		except Exception as e:
+			syslog.syslog(syslog.LOG_WARNING, "Having Exception on Periodical Call [%s]: [%s]." % (self.get_name(), e,))
+		callcomplete_tstamp = time.time()
 
-			callcomplete_tstamp = time.time()
-			self.__recaculate_invoke_interval(callcomplete_tstamp - current_tstamp)
-
-			self.last_invoke_tstamp = current_tstamp
+		self.run_count = self.run_count + 1
+		self.last_elapsed = callcomplete_tstamp - current_tstamp
+		if self.last_elapsed > self.min_interval:
+			self.overrun_count = self.overrun_count + 1
 
-			return True
-		else:
-			return False
+		return callcomplete_tstamp
 	# ### def invoke
+
+	def get_stats(self):
+		""" 取得執行統計
+
+		參數:
+			(無)
+		回傳值:
+			含有各項統計值的字典
+		"""
+		return {
+			'name': self.get_name(),
+			'interval': self.min_interval,
+			'run': self.run_count,
+			'overrun': self.overrun_count,
+			'skipped': self.skipped_count,
+			'last_elapsed': self.last_elapsed,
+			'last_lateness': self.last_lateness,
+			'next_deadline': self.deadline_tstamp,
+		}
+	# ### def get_stats
 # ### class PeriodicalCall
 
+class DeferredCall(object):
+	""" 只執行一次的延遲呼叫項目 (由 ProcessDriver.call_later() 建立) """
+
+	def __init__(self, call_object, call_arg=None):
+		""" 建構子
+		參數:
+			call_object - 要呼叫的函式，函數原型: (call_arg)
+			call_arg - 呼叫參數
+		"""
+		super(DeferredCall, self).__init__()
+
+		self.call_object = call_object
+		self.call_arg = call_arg
+	# ### def __init__
+
+	def get_name(self):
+		return getattr(self.call_object, '__name__', repr(self.call_object))
+	# ### def get_name
+
+	def schedule_next(self, current_tstamp):
+		""" 不再排定呼叫 """
+		return None
+	# ### def schedule_next
+
+	def invoke(self):
+		""" 執行呼叫
+
+		參數:
+			(無)
+		回傳值:
+			呼叫結束時的時戳
+		"""
+		try:
+			self.call_object(self.call_arg)
+		except Exception as e:
+			syslog.syslog(syslog.LOG_WARNING, "Having Exception on Deferred Call [%s]: [%s]." % (self.get_name(), e,))
+		return time.time()
+	# ### def invoke
+# ### class DeferredCall
+
+class _ReaderChannel(asyncore.file_dispatcher):
+	""" 將 add_reader() 註冊的檔案描述子包裝成 asyncore 通道 """
+
+	def __init__(self, fd, callback, callback_arg, async_map):
+		asyncore.file_dispatcher.__init__(self, fd, map=async_map)
+		self.callback = callback
+		self.callback_arg = callback_arg
+	# ### def __init__
+
+	def writable(self):
+		return False
+	# ### def writable
+
+	def handle_read(self):
+		self.callback(self.callback_arg)
+	# ### def handle_read
+# ### class _ReaderChannel
+
 class ProcessDriver(object):
+	""" 主迴圈: 等待非同步通道事件，並在排定時間執行定期呼叫
+
+	定期呼叫依排定時間存放在 heap 中，等待通道事件時的 timeout 設為距離最近排定時間的秒數，
+	因此定期呼叫會在排定時間準時執行。
+	"""
+
 	def __init__(self, periodical_call_interval=180):
+		""" 建構子
+		參數:
+			periodical_call_interval - 沒有任何定期呼叫時的最長等待時間 (秒)
+		"""
 		super(ProcessDriver, self).__init__()
 
 		self.API_VERSION = 1
@@ -97,34 +252,349 @@ class ProcessDriver(object):
 
 		self.periodical_call_interval = periodical_call_interval
 		self.periodical_call = []
+		self._timer_heap = []
+		self._timer_seq = itertools.count()
+
+		self._readers = {}
 	# ### def __init__
 
+	def _push_timer(self, deadline_tstamp, pcall_obj):
+		heapq.heappush(self._timer_heap, (deadline_tstamp, next(self._timer_seq), pcall_obj,))
+	# ### def _push_timer
+
 	def append_periodical_call(self, call_object, call_arg=None, min_interval=10):
 		pcall_obj = PeriodicalCall(call_object, call_arg, min_interval)
 		self.periodical_call.append(pcall_obj)
+		self._push_timer(pcall_obj.schedule_first(time.time()), pcall_obj)
+		return pcall_obj
 	# ### def append_periodical_call
 
+	def call_later(self, delay, call_object, call_arg=None):
+		""" 排定在給定秒數後執行一次的呼叫 (在主迴圈中執行)
+		在定期呼叫或延遲呼叫中排定的呼叫，最早在主迴圈處理過一次通道事件之後才執行
+
+		參數:
+			delay - 延遲秒數
+			call_object - 要呼叫的函式，函數原型: (call_arg)
+			call_arg=None - 呼叫參數
+		回傳值:
+			DeferredCall 物件
+		"""
+		dcall_obj = DeferredCall(call_object, call_arg)
+		self._push_timer(time.time() + max(delay, 0), dcall_obj)
+		return dcall_obj
+	# ### def call_later
+
 	def invoke_periodical_call(self):
-		for pcall_obj in self.periodical_call:
-			pcall_obj.invoke()
+		""" 執行所有已到排定時間的定期呼叫
+
+		參數:
+			(無)
+		回傳值:
+			距離下一個排定時間的秒數
+		"""
+		current_tstamp = time.time()
+		pass_seq = next(self._timer_seq)	# 本輪執行中排定的呼叫留到下一輪 (避免延遲呼叫不斷排定自己而不處理通道事件)
+		while (len(self._timer_heap) > 0) and (self._timer_heap[0][0] <= current_tstamp) and (self._timer_heap[0][1] < pass_seq):
+			_deadline, _seq, pcall_obj, = heapq.heappop(self._timer_heap)
+			current_tstamp = pcall_obj.invoke()
+			next_tstamp = pcall_obj.schedule_next(current_tstamp)
+			if next_tstamp is not None:
+				self._push_timer(next_tstamp, pcall_obj)
+
+		if len(self._timer_heap) > 0:
+			return min(max(self._timer_heap[0][0] - current_tstamp, 0), self.periodical_call_interval)
+		return self.periodical_call_interval
 	# ### def invoke_periodical_call
 
-	def loop(self):
-		last_periodical_call_tstamp = 0
+	def add_reader(self, fd, callback, callback_arg=None):
+		""" 註冊要等待可讀事件的檔案描述子
 
+		參數:
+			fd - 檔案描述子
+			callback - 可讀時呼叫的函式，函數原型: (callback_arg)
+			callback_arg=None - 呼叫參數
+		"""
+		self.remove_reader(fd)
+		self._readers[fd] = _ReaderChannel(fd, callback, callback_arg, self.async_map)
+	# ### def add_reader
+
+	def remove_reader(self, fd):
+		""" 取消等待檔案描述子的可讀事件
+
+		參數:
+			fd - 檔案描述子
+		"""
+		channel = self._readers.pop(fd, None)
+		if channel is not None:
+			channel.close()
+	# ### def remove_reader
+
+	def get_timer_stats(self):
+		""" 取得所有定期呼叫的執行統計
+
+		參數:
+			(無)
+		回傳值:
+			含有各定期呼叫統計字典的串列
+		"""
+		return [pcall_obj.get_stats() for pcall_obj in self.periodical_call]
+	# ### def get_timer_stats
+
+	def loop(self):
 		while not _check_terminate_signal():
+			wait_second = self.invoke_periodical_call()
 			if self.async_map:
-				asyncore.loop(20, map=self.async_map, count=1)
+				asyncore.loop(wait_second, map=self.async_map, count=1)
+			elif wait_second > 0:
+				time.sleep(wait_second)
+	# ### def loop
+# ### class ProcessDriver
+
+
+def _set_fd_nonblocking(fd):
+	flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+	fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+# ### def _set_fd_nonblocking
+
+def _sigchld_handler(signum, frame):
+	""" SIGCHLD 處理器，實際處理由 signal wakeup fd 觸發主迴圈進行 """
+	pass
+# ### def _sigchld_handler
+
+class EpollProcessDriver(ProcessDriver):
+	""" 以 epoll 等待檔案描述子事件的主迴圈
+
+	監視模組以 add_reader() 直接註冊檔案描述子，asyncore 通道 (async_map) 也一併交由 epoll 等待，
+	子行程結束 (SIGCHLD) 則經由 signal wakeup fd 通知以 add_child_watcher() 註冊的函式，不需要佔用執行緒等待子行程。
+	"""
+
+	def __init__(self, periodical_call_interval=180):
+		""" 建構子
+		參數:
+			periodical_call_interval - 沒有任何定期呼叫時的最長等待時間 (秒)
+		"""
+		super(EpollProcessDriver, self).__init__(periodical_call_interval)
+
+		self._epoll = select.epoll()
+		self._async_registered = {}	# fd -> (已向 epoll 註冊的 asyncore 通道事件遮罩, 通道物件)
+
+		self._child_watchers = []
+		self._sigchld_pipe = None
+	# ### def __init__
+
+	def add_reader(self, fd, callback, callback_arg=None):
+		""" 註冊要等待可讀事件的檔案描述子
+
+		參數:
+			fd - 檔案描述子
+			callback - 可讀時呼叫的函式，函數原型: (callback_arg)
+			callback_arg=None - 呼叫參數
+		"""
+		if fd in self._readers:
+			self._epoll.modify(fd, select.EPOLLIN)
+		else:
+			self._epoll.register(fd, select.EPOLLIN)
+		self._readers[fd] = (callback, callback_arg,)
+	# ### def add_reader
+
+	def remove_reader(self, fd):
+		""" 取消等待檔案描述子的可讀事件
+
+		參數:
+			fd - 檔案描述子
+		"""
+		if self._readers.pop(fd, None) is not None:
+			self._epoll.unregister(fd)
+	# ### def remove_reader
+
+	def add_child_watcher(self, callback, callback_arg=None):
+		""" 註冊子行程結束時 (收到 SIGCHLD) 要呼叫的函式 (需在主執行緒呼叫)
+
+		參數:
+			callback - 要呼叫的函式，函數原型: (callback_arg)
+			callback_arg=None - 呼叫參數
+		"""
+		if self._sigchld_pipe is None:
+			pipe_r, pipe_w, = os.pipe()
+			_set_fd_nonblocking(pipe_r)
+			_set_fd_nonblocking(pipe_w)
+			self._sigchld_pipe = (pipe_r, pipe_w,)
+			signal.set_wakeup_fd(pipe_w)
+			signal.signal(signal.SIGCHLD, _sigchld_handler)
+			signal.siginterrupt(signal.SIGCHLD, False)	# 避免其他執行緒中的系統呼叫被 SIGCHLD 中斷
+			self.add_reader(pipe_r, self._drain_sigchld_pipe)
+		self._child_watchers.append((callback, callback_arg,))
+	# ### def add_child_watcher
+
+	def _drain_sigchld_pipe(self, _arg):
+		try:
+			while os.read(self._sigchld_pipe[0], 4096):
+				pass
+		except OSError as e:
+			if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK,):
+				raise
+		for callback, callback_arg, in self._child_watchers:
+			callback(callback_arg)
+	# ### def _drain_sigchld_pipe
+
+	def _sync_async_map(self):
+		""" 依 asyncore 通道目前的狀態更新 epoll 註冊 """
+		for fd, registered, in self._async_registered.items():
+			if self.async_map.get(fd) is not registered[1]:	# 通道已關閉 (檔案描述子可能已被新通道重複使用)
+				self._async_registered.pop(fd)
+				try:
+					self._epoll.unregister(fd)
+				except (IOError, ValueError,):
+					pass	# 檔案描述子已關閉
+		for fd, obj, in self.async_map.items():
+			mask = 0
+			if obj.readable():
+				mask = mask | select.EPOLLIN | select.EPOLLPRI
+			if obj.writable() and not obj.accepting:
+				mask = mask | select.EPOLLOUT
+			if mask:
+				mask = mask | select.EPOLLERR | select.EPOLLHUP
+			registered = self._async_registered.get(fd)
+			if (registered is not None) and (registered[0] == mask):
+				continue
+			if 0 == mask:
+				if registered is not None:
+					self._async_registered.pop(fd)
+					self._epoll.unregister(fd)
+			elif registered is None:
+				self._async_registered[fd] = (mask, obj,)
+				self._epoll.register(fd, mask)
 			else:
-				time.sleep(self.periodical_call_interval)
+				self._async_registered[fd] = (mask, obj,)
+				self._epoll.modify(fd, mask)
+	# ### def _sync_async_map
 
-			current_tstamp = time.time()
-			if (current_tstamp - last_periodical_call_tstamp) > self.periodical_call_interval:
-				last_periodical_call_tstamp = current_tstamp
-				self.invoke_periodical_call()
-			print "process-loop: %d/%d" % (last_periodical_call_tstamp, current_tstamp,)
+	def _poll(self, timeout):
+		""" 等待檔案描述子事件並呼叫對應的處理函式
+
+		參數:
+			timeout - 最長等待時間 (秒)
+		"""
+		self._sync_async_map()
+		try:
+			r = self._epoll.poll(timeout)
+		except IOError as e:
+			if e.errno != errno.EINTR:
+				raise
+			r = ()
+		for fd, flags, in r:
+			reader = self._readers.get(fd)
+			if reader is not None:
+				callback, callback_arg, = reader
+				callback(callback_arg)
+				continue
+			obj = self.async_map.get(fd)
+			if obj is not None:
+				asyncore.readwrite(obj, flags)
+	# ### def _poll
+
+	def loop(self):
+		while not _check_terminate_signal():
+			wait_second = self.invoke_periodical_call()
+			self._poll(wait_second)
 	# ### def loop
-# ### class ProcessDriver
+# ### class EpollProcessDriver
+
+
+def _create_process_driver(driver_name):
+	""" 依名稱建立主迴圈物件
+
+	參數:
+		driver_name - 主迴圈實作名稱 ('asyncore' 或 'epoll')
+	回傳值:
+		ProcessDriver 物件
+	"""
+	if 'epoll' == driver_name:
+		if hasattr(select, 'epoll'):
+			return EpollProcessDriver()
+		syslog.syslog(syslog.LOG_WARNING, "epoll is not available, fall back to asyncore process driver.")
+	return ProcessDriver()
+# ### def _create_process_driver
+
+
+def _is_file_consuming_block(opr_block):
+	""" 檢查作業塊內是否有會消耗掉檔案的作業 (例如移動檔案)
+
+	參數:
+		opr_block - 含有 OperationEntry 物件的串列
+	回傳值:
+		True - 作業塊會消耗掉檔案
+		False - 否
+	"""
+	for opr_ent in opr_block:
+		if getattr(opr_ent.opmodule.get_module_prop(), 'consume_file', False):
+			return True
+	return False
+# ### def _is_file_consuming_block
+
+
+def _fork_oprexec_ref(oprexec_ref):
+	""" 複製作業參考物件給同時執行的作業塊使用，carry_variable 各自獨立
+
+	參數:
+		oprexec_ref - 作業參考物件
+	回傳值:
+		複製的 OperationExecRef 物件
+	"""
+	forked_ref = copy.copy(oprexec_ref)
+	forked_ref.carry_variable = dict(oprexec_ref.carry_variable)
+	return forked_ref
+# ### def _fork_oprexec_ref
+
+
+def _report_coalesce_stats(event_coalescer):
+	syslog.syslog(syslog.LOG_INFO, "event coalescer: %s." % (event_coalescer.format_stats(),))
+# ### def _report_coalesce_stats
+
+
+def _record_stage_elapsed(stage_stats, stage_name, start_tstamp, entry_label='*'):
+	""" 記錄階段耗時
+
+	參數:
+		stage_stats - stagestats.StageStatistics 物件
+		stage_name - 階段名稱
+		start_tstamp - 階段開始時戳
+		entry_label='*' - 監看項目標籤
+	回傳值:
+		目前時戳 (可做為下一個階段的開始時戳)
+	"""
+	current_tstamp = time.time()
+	stage_stats.record(stage_name, current_tstamp - start_tstamp, entry_label)
+	return current_tstamp
+# ### def _record_stage_elapsed
+
+
+def _flush_meta_storage(metadb):
+	metadb.flush_if_due()
+# ### def _flush_meta_storage
+
+
+def _report_stage_stats(stage_stats):
+	for line in stage_stats.format_report(True):
+		syslog.syslog(syslog.LOG_INFO, "stage stats: %s" % (line,))
+# ### def _report_stage_stats
+
+
+def _to_watch_entry_list(watch_entries):
+	""" 將監看項目設定轉換為已編譯派送索引的 WatchEntryList 物件
+
+	參數:
+		watch_entries - 監看項目設定 (含有 MonitorEntry 物件的串列)
+	回傳值:
+		filewatchconfig.WatchEntryList 物件
+	"""
+	if isinstance(watch_entries, filewatchconfig.WatchEntryList):
+		return watch_entries
+	r = filewatchconfig.WatchEntryList(watch_entries)
+	r.compile_index()
+	return r
+# ### def _to_watch_entry_list
 
 
 class WatcherEngine(object):
@@ -141,7 +611,7 @@ class WatcherEngine(object):
 		super(WatcherEngine, self).__init__()
 
 		self.global_config = global_config
-		self.watch_entries = watch_entries
+		self.watch_entries = _to_watch_entry_list(watch_entries)
 		self.monitor_implement = monitor_implement
 		self.operation_deliver = operation_deliver
 
@@ -149,27 +619,102 @@ class WatcherEngine(object):
 
 		self.last_file_event_tstamp = time.time()
 		self.serialcounter = 1 + (self.last_file_event_tstamp % 1024)
-
-		self.process_driver = ProcessDriver()
+		self._serialcounter_lock = threading.Lock()
+
+		engine_config = self.global_config.engine_config
+
+		self.process_driver = _create_process_driver(engine_config.process_driver)
+
+		self.stage_stats = stagestats.StageStatistics()
+		if engine_config.stats_report_interval > 0:
+			self.process_driver.append_periodical_call(_report_stage_stats, self.stage_stats, engine_config.stats_report_interval)
+		self.stats_endpoint = None
+
+		if (self.metadb is not None) and (self.metadb.get_flush_interval() is not None):
+			self.process_driver.append_periodical_call(_flush_meta_storage, self.metadb, self.metadb.get_flush_interval())
+
+		# {{{ setup event dispatcher
+		self.event_dispatcher = None
+		if engine_config.dispatch_worker_count > 0:
+			self.event_dispatcher = dispatcher.EventDispatcher(self._process_file_change, engine_config.dispatch_worker_count, engine_config.dispatch_queue_size, engine_config.dispatch_block_on_overflow)
+		# }}} setup event dispatcher
+
+		# {{{ setup event coalescer
+		self.event_coalescer = None
+		if engine_config.coalesce_window > 0:
+			self.event_coalescer = dispatcher.EventCoalescer(self._deliver_file_change, engine_config.coalesce_window, engine_config.coalesce_max_delay)
+			self.process_driver.append_periodical_call(_report_coalesce_stats, self.event_coalescer, 600)
+		# }}} setup event coalescer
+
+		# {{{ setup operation block pool
+		self.operation_pool = None
+		if engine_config.operation_worker_count > 0:
+			self.operation_pool = workerpool.WorkerPool('operation-block', engine_config.operation_worker_count)
+		# }}} setup operation block pool
+
+		# {{{ setup signature pool
+		self.signature_pool = None
+		self._signing_paths = {}	# (folderpath, filename) -> 等待簽章計算完成後才處理的事件型別串列
+		self._signing_paths_lock = threading.Condition()	# 路徑解除暫存狀態時通知 (停止時等待用)
+		if (engine_config.signature_worker_count > 0) and (self.metadb is not None):
+			self.signature_pool = workerpool.BudgetedWorkerPool('signature', engine_config.signature_worker_count, engine_config.signature_inflight_bytes)
+		# }}} setup signature pool
 	# ### def __init__
 
 	def activate(self):
 		""" 啓動監看模組，開始作業
 		"""
+		if self.operation_pool is not None:
+			self.operation_pool.start()
+		if self.signature_pool is not None:
+			self.signature_pool.start()
+		if self.event_dispatcher is not None:
+			self.event_dispatcher.start()
+		if self.event_coalescer is not None:
+			self.event_coalescer.start()
+
+		for operator_name, operator_m in self.operation_deliver.iteritems():
+			if hasattr(operator_m, 'operator_start'):
+				operator_m.operator_start(self)
+				syslog.syslog(syslog.LOG_INFO, "started operator [%s]" % (operator_name,))
+
 		for monitor_name, monitor_m in self.monitor_implement.iteritems():
 			monitor_m.monitor_start(self, self.global_config.target_directory, self.global_config.recursive_watch)
 			syslog.syslog(syslog.LOG_INFO, "started monitor module [%s]" % (monitor_name,))
 
+		stats_socket_path = self.global_config.engine_config.stats_socket_path
+		if stats_socket_path is not None:
+			try:
+				self.stats_endpoint = statsendpoint.StatsEndpoint(self.get_gauges, stats_socket_path, self.process_driver.async_map)
+			except Exception as e:
+				syslog.syslog(syslog.LOG_WARNING, "cannot start stats endpoint on [%s]: %s" % (stats_socket_path, e,))
+
 		syslog.syslog(syslog.LOG_NOTICE, "Activated FileWatcher::%r." % (FW_APP_NAME,))
 	# ### def activate
 
 	def deactivate(self):
 		""" 停止監看與作業模組，終止作業
 		"""
+		if self.stats_endpoint is not None:
+			self.stats_endpoint.close()
+			self.stats_endpoint = None
+
 		for monitor_name, monitor_m in self.monitor_implement.iteritems():
 			monitor_m.monitor_stop()
 			syslog.syslog(syslog.LOG_INFO, "stopped monitor [%s]" % (monitor_name,))
 
+		if self.event_coalescer is not None:
+			self.event_coalescer.stop()
+		if self.event_dispatcher is not None:
+			self.event_dispatcher.stop()
+		if self.signature_pool is not None:
+			self._drain_signing_paths()
+			self.signature_pool.stop()
+		if self.operation_pool is not None:
+			self.operation_pool.stop()
+		if self.metadb is not None:
+			self.metadb.flush()
+
 		for operator_name, operator_m in self.operation_deliver.iteritems():
 			operator_m.operator_stop()
 			syslog.syslog(syslog.LOG_INFO, "stopped operator [%s]" % (operator_name,))
@@ -177,32 +722,101 @@ class WatcherEngine(object):
 		syslog.syslog(syslog.LOG_NOTICE, "Deactivated FileWatcher::%r." % (FW_APP_NAME,))
 	# ### def deactivate
 
-	def _perform_operation(self, filename, folderpath, orig_path, target_path, operate_list, oprexec_ref):
-		#print "oplist: %r" % (operate_list,)
-		for opr_block in operate_list:
-			current_filepath = target_path
-			block_log_queue = []
-			for opr_ent in opr_block:
-				if (current_filepath is not None) and (os.path.exists(current_filepath)):
-					entry_log_queue = []
-					altered_filepath = opr_ent.opmodule.perform_operation(current_filepath, filename, opr_ent.argv, oprexec_ref, entry_log_queue)
-					#print "operation: [%s/%r] (f=%r, t=%r)" % (opr_ent.opname, opr_ent.argv, current_filepath, altered_filepath,)
-					current_filepath = altered_filepath
-
-					if len(entry_log_queue) > 0:
-						for logline in entry_log_queue:
-							block_log_queue.append("%s: %s" % (opr_ent.opname, logline,))
-					else:
-						block_log_queue.append("%s: (Log=N/A)" % (opr_ent.opname,))
+	def replace_watch_entries(self, watch_entries):
+		""" 替換監看項目設定 (重新載入設定時使用)，並清除舊設定的路徑候選規則快取
+
+		參數:
+			watch_entries - 監看項目設定
+		"""
+		previous_watch_entries = self.watch_entries
+		self.watch_entries = _to_watch_entry_list(watch_entries)
+		previous_watch_entries.clear_folder_cache()
+		syslog.syslog(syslog.LOG_INFO, "replaced watch entries (count=%d)" % (len(self.watch_entries),))
+	# ### def replace_watch_entries
+
+	def _perform_operation_block(self, filename, orig_path, target_path, opr_block, oprexec_ref, entry_label='*'):
+		""" 執行一個作業塊內的各項作業並記錄執行結果與耗時
+
+		參數:
+			filename - 檔案名稱
+			orig_path - 原始檔案路徑
+			target_path - 作業目標檔案路徑 (可能是更改過的唯一檔名)
+			opr_block - 含有 OperationEntry 物件的串列
+			oprexec_ref - 作業參考物件
+			entry_label='*' - 監看項目標籤 (統計用)
+		"""
+		block_start_tstamp = time.time()
+		current_filepath = target_path
+		block_log_queue = []
+		for opr_ent in opr_block:
+			if (current_filepath is not None) and (os.path.exists(current_filepath)):
+				entry_log_queue = []
+				operation_start_tstamp = time.time()
+				altered_filepath = opr_ent.opmodule.perform_operation(current_filepath, filename, opr_ent.argv, oprexec_ref, entry_log_queue)
+				self.stage_stats.record('operation', time.time() - operation_start_tstamp, entry_label, opr_ent.opname)
+				#print "operation: [%s/%r] (f=%r, t=%r)" % (opr_ent.opname, opr_ent.argv, current_filepath, altered_filepath,)
+				current_filepath = altered_filepath
+
+				if len(entry_log_queue) > 0:
+					for logline in entry_log_queue:
+						block_log_queue.append("%s: %s" % (opr_ent.opname, logline,))
 				else:
-					print "leaving operation loop (current-path=%r)" % (current_filepath,)
-					break
-			if len(block_log_queue) > 0:
-				logmsg = '; '.join(block_log_queue)
+					block_log_queue.append("%s: (Log=N/A)" % (opr_ent.opname,))
 			else:
-				logmsg = 'no operations proceed'
-			syslog.syslog(syslog.LOG_INFO, "operation on [%s]: %s." % (orig_path, logmsg,))
-			#print "operation on [%s]: %s." % (orig_path, logmsg,)
+				print "leaving operation loop (current-path=%r)" % (current_filepath,)
+				break
+		if len(block_log_queue) > 0:
+			logmsg = '; '.join(block_log_queue)
+		else:
+			logmsg = 'no operations proceed'
+		syslog.syslog(syslog.LOG_INFO, "operation on [%s]: %s (%.3fs)." % (orig_path, logmsg, time.time() - block_start_tstamp,))
+		#print "operation on [%s]: %s." % (orig_path, logmsg,)
+	# ### def _perform_operation_block
+
+	def _perform_operation(self, filename, folderpath, orig_path, target_path, operate_list, oprexec_ref, entry_label='*'):
+		#print "oplist: %r" % (operate_list,)
+		if (self.operation_pool is None) or (len(operate_list) < 2):
+			for opr_block in operate_list:
+				self._perform_operation_block(filename, orig_path, target_path, opr_block, oprexec_ref, entry_label)
+			return
+
+		# {{{ run blocks before the first file consuming block concurrently
+		concurrent_block = []
+		for opr_block in operate_list:
+			if _is_file_consuming_block(opr_block):
+				break
+			concurrent_block.append(opr_block)
+		if len(concurrent_block) > 1:
+			forked_ref = [_fork_oprexec_ref(oprexec_ref) for _opr_block in concurrent_block]
+			pending_call = []
+			for opr_block, block_ref, in zip(concurrent_block[1:], forked_ref[1:]):
+				pending_call.append(self.operation_pool.submit(self._perform_operation_block, (filename, orig_path, target_path, opr_block, block_ref, entry_label,)))
+			block_error = []
+			try:
+				self._perform_operation_block(filename, orig_path, target_path, concurrent_block[0], forked_ref[0], entry_label)
+			except Exception as e:
+				block_error.append(e)
+			for pcall in pending_call:	# 一定要等所有作業塊結束，之後的作業塊才能移動檔案
+				try:
+					pcall.wait()
+				except Exception as e:
+					block_error.append(e)
+			for block_ref in forked_ref:	# 依作業塊順序合併，與依序執行時後面的作業塊覆寫前面的值相同
+				oprexec_ref.carry_variable.update(block_ref.carry_variable)
+			if len(block_error) > 0:
+				for e in block_error:
+					syslog.syslog(syslog.LOG_INFO, "Having Exception on Operation Block: [%s] (%s)." % (orig_path, e,))
+				raise block_error[0]	# 與依序執行相同，作業塊出錯時不再執行之後的作業塊
+		elif len(concurrent_block) == 1:
+			self._perform_operation_block(filename, orig_path, target_path, concurrent_block[0], oprexec_ref, entry_label)
+		# }}} run blocks before the first file consuming block concurrently
+
+		# 從第一個消耗檔案的作業塊開始依序執行，檔案被消耗後與依序執行時一樣不再執行之後的作業塊
+		for opr_block in operate_list[len(concurrent_block):]:
+			if not os.path.exists(target_path):
+				syslog.syslog(syslog.LOG_INFO, "skipped operation block after file consumed: [%s] (%s)." % (orig_path, ', '.join([opr_ent.opname for opr_ent in opr_block]),))
+				continue
+			self._perform_operation_block(filename, orig_path, target_path, opr_block, oprexec_ref, entry_label)
 	# ### def _perform_operation
 
 	def _discover_file_change(self, filename, folderpath, event_type=0):
@@ -212,6 +826,9 @@ class WatcherEngine(object):
 			filename - 檔案名稱
 			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
 			event_type - 事件型別 (FEVENT_NEW, FEVENT_MODIFIED, FEVENT_DELETED)
+		回傳值:
+			True - 事件已送入簽章工作池，由 _resume_file_change() 接續處理
+			None - 事件已處理完畢
 		"""
 		if (False == self.global_config.recursive_watch) and ('' != folderpath):
 			print "ignored - recursive watch disabled. (folderpath = %r)" % (folderpath,)
@@ -220,103 +837,355 @@ class WatcherEngine(object):
 		self.last_file_event_tstamp = time.time()	# 更新事件時戳
 		print "discoveried - filename=%r, folder=%r, event-type=%r" % (filename, folderpath, event_type,)
 
+		stage_stats = self.stage_stats
+		stage_stats.increase('event')
+
 		orig_path = os.path.join(self.global_config.target_directory, folderpath, filename)
-		if not os.path.isfile(orig_path):
+		stage_tstamp = time.time()
+		is_file = os.path.isfile(orig_path)
+		stage_tstamp = _record_stage_elapsed(stage_stats, 'isfile', stage_tstamp)
+		if not is_file:
+			stage_stats.increase('missing_file')
 			return
 
-		# {{{ scan watch entries
-		for w_case in self.watch_entries:
-			mobj_file = w_case.file_regex.match(filename)
-			if mobj_file is None:
-				continue
+		# {{{ lookup watch entry
+		w_match = self.watch_entries.find_entry(filename, folderpath)
+		stage_tstamp = _record_stage_elapsed(stage_stats, 'match', stage_tstamp)
+		if w_match is None:
+			stage_stats.increase('no_entry')
+			syslog.syslog(syslog.LOG_INFO, "NoWatchEntryFound: [%s]."%(orig_path,))
+			return
+		w_case, mobj_file, mobj_path, = w_match
+		entry_label = w_case.file_regex.pattern
+		# }}} lookup watch entry
+
+		# {{{ do ignorance check
+		if w_case.ignorance_checker is not None:
+			is_ignored = w_case.ignorance_checker(folderpath, filename)
+			stage_tstamp = _record_stage_elapsed(stage_stats, 'ignorance', stage_tstamp, entry_label)
+			if is_ignored:
+				stage_stats.increase('ignored', entry_label)
+				syslog.syslog(syslog.LOG_INFO, "Ignored: [%s]" % (orig_path,))
+				return
+		# }}} do ignorance check
 
-			mobj_path = None
-			if w_case.path_regex is not None:
-				mobj_path = w_case.path_regex.match(folderpath)
-				if mobj_path is None:
-					continue
+		cancel_operation = None
+		with self._serialcounter_lock:
+			self.serialcounter = (self.serialcounter + 1) % 1024
+			serialcounter = self.serialcounter
+
+		f_sig = None
+
+		# {{{ pre-operation for file new or update
+		if FEVENT_DELETED != event_type:
+			# {{{ build unique name if required
+			if w_case.process_as_uniqname:
+				uniq_name = "%s-FiWr%04d" % (filename, serialcounter,)
+				target_path = os.path.join(self.global_config.target_directory, folderpath, uniq_name)
+				stage_tstamp = time.time()
+				try:
+					shutil.move(orig_path, target_path)
+				except shutil.Error as e:
+					print "Failed on file renaming for meta operation: %s" % (e,)
+					target_path = orig_path
+					# we will do meta operations anyway.
+				_record_stage_elapsed(stage_stats, 'uniqname', stage_tstamp, entry_label)
+			else:
+				target_path = orig_path
+			# }}} build unique name if required
+
+			# {{{ checking if proceed
+			if (self.metadb is not None) and (True == w_case.do_dupcheck):
+				check_label = filename
+				life_retain = False
+				if w_case.content_check_label is not None:
+					check_label = w_case.content_check_label
+					life_retain = True
+
+				change_context = (filename, folderpath, event_type, orig_path, target_path, w_case, mobj_file, mobj_path, entry_label,)
+				if self.signature_pool is not None:
+					self._submit_duplication_check(change_context, check_label, life_retain)
+					return True	# 由簽章 worker 完成後接續處理
+				is_duplicated, f_sig, = self._check_file_duplication(check_label, target_path, life_retain, entry_label)
+				if True == is_duplicated:
+					cancel_operation = 'duplicate file (meta sig-check)'
+			# }}} checking if proceed
+		# }}} pre-operation for file new or update
+
+		self._complete_file_change(filename, folderpath, event_type, orig_path, target_path, w_case, mobj_file, mobj_path, entry_label, f_sig, cancel_operation)
+	# ### def _discover_file_change
 
-			# {{{ do ignorance check
-			if w_case.ignorance_checker is not None:
-				if w_case.ignorance_checker(folderpath, filename):
-					syslog.syslog(syslog.LOG_INFO, "Ignored: [%s]" % (orig_path,))
-					return
-			# }}} do ignorance check
+	def _check_file_duplication(self, check_label, target_path, life_retain, entry_label):
+		""" 計算檔案簽章並檢查檔案內容是否重複
 
-			cancel_operation = None
-			self.serialcounter = (self.serialcounter + 1) % 1024
+		參數:
+			check_label - 比對用的標籤 (檔名或 content_check_label)
+			target_path - 檔案路徑
+			life_retain - 檔案紀錄是否長期留存
+			entry_label - 監看項目標籤 (統計用)
+		回傳值:
+			(is_duplicated, file_sig) 形式的 tuple
+		"""
+		stage_stats = self.stage_stats
+		stage_tstamp = time.time()
+		if self.metadb.dupcheck_prefilter:
+			is_duplicated, f_sig, = self.metadb.test_file_duplication_staged(check_label, target_path, life_retain)
+		else:
+			f_sigs = self.metadb.compute_file_signatures(target_path)
+			f_sig = f_sigs.pop(self.metadb.signature_engine.algorithm)
+			stage_tstamp = _record_stage_elapsed(stage_stats, 'signature', stage_tstamp, entry_label)
+			is_duplicated = self.metadb.test_file_duplication_and_checkin(check_label, f_sig, life_retain, f_sigs)
+		_record_stage_elapsed(stage_stats, 'dupcheck', stage_tstamp, entry_label)
+		return (is_duplicated, f_sig,)
+	# ### def _check_file_duplication
+
+	def _submit_duplication_check(self, change_context, check_label, life_retain):
+		""" 將重複檢查送入簽章工作池，完成後由 _resume_file_change() 接續處理
+		同一路徑在檢查完成前收到的事件會暫存，檢查完成後依序處理
 
-			f_sig = None
-
-			# {{{ pre-operation for file new or update
-			if FEVENT_DELETED != event_type:
-				# {{{ build unique name if required
-				if w_case.process_as_uniqname:
-					uniq_name = "%s-FiWr%04d" % (filename, self.serialcounter,)
-					target_path = os.path.join(self.global_config.target_directory, folderpath, uniq_name)
-					try:
-						shutil.move(orig_path, target_path)
-					except shutil.Error as e:
-						print "Failed on file renaming for meta operation: %s" % (e,)
-						target_path = orig_path
-						# we will do meta operations anyway.
-				else:
-					target_path = orig_path
-				# }}} build unique name if required
-
-				# {{{ checking if proceed
-				if (self.metadb is not None) and (True == w_case.do_dupcheck):
-					check_label = filename
-					life_retain = False
-					if w_case.content_check_label is not None:
-						check_label = w_case.content_check_label
-						life_retain = True
-
-					f_sig = metadatum.compute_file_signature(target_path)
-					if True == self.metadb.test_file_duplication_and_checkin(check_label, f_sig, life_retain):
-						cancel_operation = 'duplicate file (meta sig-check)'
-				# }}} checking if proceed
-			# }}} pre-operation for file new or update
-
-			# {{{ cancel operation
-			if cancel_operation is not None:
-				if True == self.global_config.remove_unoperate_file:
-					os.unlink(target_path)
-				syslog.syslog(syslog.LOG_INFO, "cancel: [%s] reason=%s." % (orig_path, cancel_operation,))
-				#print "Cancel: [%s] reason=%s."%(orig_path, cancel_operation,)
-				return
-			# }}} cancel operation
+		參數:
+			change_context - 傳給 _complete_file_change() 的事件資訊 tuple (不含簽章與取消原因)
+			check_label - 比對用的標籤
+			life_retain - 檔案紀錄是否長期留存
+		"""
+		filename, folderpath, _event_type, _orig_path, target_path, _w_case, _mobj_file, _mobj_path, entry_label, = change_context
+		try:
+			file_size = os.path.getsize(target_path)
+		except OSError:
+			file_size = 0
+		with self._signing_paths_lock:
+			self._signing_paths.setdefault((folderpath, filename,), [])	# 接續處理暫存事件時保留其餘尚未處理的事件
+		self.signature_pool.submit(self._check_file_duplication, (check_label, target_path, life_retain, entry_label,), functools.partial(self._resume_file_change, change_context), file_size)
+	# ### def _submit_duplication_check
 
-			oprexec_ref = OperationExecRef(mobj_file, mobj_path, f_sig, event_type)
-			if (FEVENT_NEW == event_type) or (FEVENT_MODIFIED == event_type):
-				#print "running update route"
-				self._perform_operation(filename, folderpath, orig_path, target_path, w_case.operation_update, oprexec_ref)
-			elif FEVENT_DELETED == event_type:
-				#print "running remove route"
-				self._perform_operation(filename, folderpath, orig_path, target_path, w_case.operation_remove, oprexec_ref)
+	def _resume_file_change(self, change_context, pending_call):
+		""" (在簽章 worker 中執行) 依重複檢查結果接續處理事件，再依序處理檢查期間暫存的同一路徑事件
+
+		參數:
+			change_context - 事件資訊 tuple
+			pending_call - 重複檢查的 workerpool.PendingCall 物件
+		"""
+		filename, folderpath, = change_context[0:2]
+		try:
+			if pending_call.exc_info is not None:
+				syslog.syslog(syslog.LOG_INFO, "Having Exception on Duplicate Check: [%s] (%s)." % (change_context[3], pending_call.exc_info[1],))
 			else:
-				#print "running NoOP route"
-				syslog.syslog(syslog.LOG_INFO, "NoOP: [%s] unknown event type (%r)."%(orig_path, event_type,))
+				is_duplicated, f_sig, = pending_call.result
+				cancel_operation = None
+				if True == is_duplicated:
+					cancel_operation = 'duplicate file (meta sig-check)'
+				self._complete_file_change(*(change_context + (f_sig, cancel_operation,)))
+		except Exception as e:
+			syslog.syslog(syslog.LOG_INFO, "Having Exception on Discover File Change: [%s]." % (e,))
+		self._replay_deferred_events(filename, folderpath)
+	# ### def _resume_file_change
 
-			return
-		# }}} scan watch entries
+	def _replay_deferred_events(self, filename, folderpath):
+		""" (在簽章 worker 中執行) 依序處理暫存的同一路徑事件，全部處理完才解除路徑的暫存狀態，
+		期間同一路徑的新事件繼續暫存；事件再次送入簽章工作池時，其餘事件由該次檢查完成後接續處理
 
-		syslog.syslog(syslog.LOG_INFO, "NoWatchEntryFound: [%s]."%(orig_path,))
-	# ### def _discover_file_change
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+		"""
+		k = (folderpath, filename,)
+		while True:
+			with self._signing_paths_lock:
+				deferred_event_types = self._signing_paths[k]
+				if len(deferred_event_types) < 1:
+					del self._signing_paths[k]
+					self._signing_paths_lock.notify_all()
+					return
+				event_type = deferred_event_types.pop(0)
+			try:
+				if self._discover_file_change(filename, folderpath, event_type):
+					return
+			except Exception as e:
+				syslog.syslog(syslog.LOG_INFO, "Having Exception on Discover File Change: [%s]." % (e,))
+	# ### def _replay_deferred_events
 
-	def discover_file_change(self, filename, folderpath, event_type=0):
-		""" 通知監視引擎找到新的檔案
+	def _drain_signing_paths(self):
+		""" 等待簽章工作池處理完所有暫存的事件 (停止派送之後、停止簽章工作池之前呼叫)
+		接續處理暫存事件時可能再次送入簽章工作池，這些呼叫必須排在工作池的停止標記之前才會被執行
+		"""
+		with self._signing_paths_lock:
+			while len(self._signing_paths) > 0:
+				self._signing_paths_lock.wait(1)
+	# ### def _drain_signing_paths
+
+	def _complete_file_change(self, filename, folderpath, event_type, orig_path, target_path, w_case, mobj_file, mobj_path, entry_label, f_sig, cancel_operation):
+		""" 依前置檢查結果取消作業或是執行作業
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+			event_type - 事件型別
+			orig_path - 原始檔案路徑
+			target_path - 作業目標檔案路徑
+			w_case - 監看項目 (MonitorEntry 物件)
+			mobj_file - 檔名 regex 比對結果物件
+			mobj_path - 路徑 regex 比對結果物件
+			entry_label - 監看項目標籤 (統計用)
+			f_sig - 數位簽章 (沒有時為 None)
+			cancel_operation - 取消作業的原因，None 表示執行作業
+		"""
+		stage_stats = self.stage_stats
+
+		# {{{ cancel operation
+		if cancel_operation is not None:
+			stage_stats.increase('cancelled', entry_label)
+			if True == self.global_config.remove_unoperate_file:
+				os.unlink(target_path)
+			syslog.syslog(syslog.LOG_INFO, "cancel: [%s] reason=%s." % (orig_path, cancel_operation,))
+			#print "Cancel: [%s] reason=%s."%(orig_path, cancel_operation,)
+			return
+		# }}} cancel operation
+
+		oprexec_ref = OperationExecRef(mobj_file, mobj_path, f_sig, event_type)
+		if (FEVENT_NEW == event_type) or (FEVENT_MODIFIED == event_type):
+			#print "running update route"
+			self._perform_operation(filename, folderpath, orig_path, target_path, w_case.operation_update, oprexec_ref, entry_label)
+		elif FEVENT_DELETED == event_type:
+			#print "running remove route"
+			self._perform_operation(filename, folderpath, orig_path, target_path, w_case.operation_remove, oprexec_ref, entry_label)
+		else:
+			#print "running NoOP route"
+			syslog.syslog(syslog.LOG_INFO, "NoOP: [%s] unknown event type (%r)."%(orig_path, event_type,))
+	# ### def _complete_file_change
+
+	def _process_file_change(self, filename, folderpath, event_type=0):
+		""" 處理檔案變動事件 (由派送 worker 或 discover_file_change 呼叫)
 
 		參數:
 			filename - 檔案名稱
 			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
 			event_type - 事件型別 (FEVENT_NEW, FEVENT_MODIFIED, FEVENT_DELETED)
 		"""
+		if self.signature_pool is not None:
+			with self._signing_paths_lock:
+				deferred_event_types = self._signing_paths.get((folderpath, filename,))
+				if deferred_event_types is not None:	# 同一路徑的前一個事件還在計算簽章，保持事件順序
+					deferred_event_types.append(event_type)
+					return
 		try:
 			self._discover_file_change(filename, folderpath, event_type)
 		except Exception as e:
 			syslog.syslog(syslog.LOG_INFO, "Having Exception on Discover File Change: [%s]." % (e,))
+	# ### def _process_file_change
+
+	def _deliver_file_change(self, filename, folderpath, event_type=0):
+		""" 將事件交給派送佇列，或是在沒有設定派送 worker 時直接處理
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+			event_type - 事件型別 (FEVENT_NEW, FEVENT_MODIFIED, FEVENT_DELETED)
+		"""
+		if self.event_dispatcher is None:
+			self._process_file_change(filename, folderpath, event_type)
+		else:
+			self.event_dispatcher.dispatch(filename, folderpath, event_type)
+	# ### def _deliver_file_change
+
+	def discover_file_change(self, filename, folderpath, event_type=0):
+		""" 通知監視引擎找到新的檔案
+		有設定事件合併時會先等待靜默時間，有設定派送 worker 時事件會放入派送佇列後立即返回
+
+		參數:
+			filename - 檔案名稱
+			folderpath - 檔案夾路徑 (相對於 target_directory 路徑)
+			event_type - 事件型別 (FEVENT_NEW, FEVENT_MODIFIED, FEVENT_DELETED)
+		"""
+		if self.event_coalescer is None:
+			self._deliver_file_change(filename, folderpath, event_type)
+		else:
+			self.event_coalescer.push(filename, folderpath, event_type)
 	# ### def discover_file_change
+
+	def get_dispatch_stats(self):
+		""" 取得事件派送佇列深度與丟棄/溢出計數
+
+		參數:
+			(無)
+		回傳值:
+			含有各項計數的字典，未啟用派送佇列時傳回 None
+		"""
+		if self.event_dispatcher is None:
+			return None
+		return self.event_dispatcher.get_stats()
+	# ### def get_dispatch_stats
+
+	def get_stage_stats(self, reset=False):
+		""" 取得各處理階段的計數與延遲統計
+
+		參數:
+			reset=False - 取得後是否清除統計資料
+		回傳值:
+			stagestats.StageStatistics.snapshot() 傳回的字典
+		"""
+		return self.stage_stats.snapshot(reset)
+	# ### def get_stage_stats
+
+	def get_gauges(self):
+		""" 取得監看引擎、中介資訊資料庫與各模組 (有實作 get_module_gauges() 者) 的即時量測值
+		由主迴圈呼叫，不可等待任何鎖或 I/O
+
+		參數:
+			(無)
+		回傳值:
+			(名稱, 標籤字典, 數值) 形式的 tuple 串列
+		"""
+		gauges = [('last_file_event_tstamp', None, self.last_file_event_tstamp,)]
+
+		dispatch_stats = self.get_dispatch_stats()
+		if dispatch_stats is not None:
+			for k in ('queue_depth', 'queue_size', 'enqueued', 'processed', 'overflow', 'dropped',):
+				gauges.append(('dispatch_' + k, None, dispatch_stats[k],))
+			for idx, depth, in enumerate(dispatch_stats['queue_depth_per_worker']):
+				gauges.append(('dispatch_worker_queue_depth', {'worker': idx}, depth,))
+
+		coalesce_stats = self.get_coalesce_stats()
+		if coalesce_stats is not None:
+			for k in ('pending', 'received', 'released', 'coalesced', 'cancelled',):
+				gauges.append(('coalesce_' + k, None, coalesce_stats[k],))
+
+		if self.operation_pool is not None:
+			gauges.append(('operation_pool_queue_depth', None, self.operation_pool.get_queue_depth(),))
+		if self.signature_pool is not None:
+			gauges.append(('signature_pool_queue_depth', None, self.signature_pool.get_queue_depth(),))
+			gauges.append(('signature_pool_inflight_bytes', None, self.signature_pool.get_inflight_cost(),))
+
+		for timer_stats in self.process_driver.get_timer_stats():
+			gauges.append(('periodical_call_overrun', {'name': timer_stats['name']}, timer_stats['overrun'],))
+			gauges.append(('periodical_call_skipped', {'name': timer_stats['name']}, timer_stats['skipped'],))
+
+		if self.metadb is not None:
+			for table_name, row_count, in self.metadb.get_row_counts().iteritems():
+				gauges.append(('meta_rows', {'table': table_name}, row_count,))
+			gauges.append(('meta_commits', None, self.metadb.commit_count,))
+			if self.metadb.signature_cache is not None:
+				gauges.append(('signature_cache_hit', None, self.metadb.signature_cache.hit_count,))
+				gauges.append(('signature_cache_miss', None, self.metadb.signature_cache.miss_count,))
+
+		for module_m in itertools.chain(self.monitor_implement.itervalues(), self.operation_deliver.itervalues()):
+			if hasattr(module_m, 'get_module_gauges'):
+				gauges.extend(module_m.get_module_gauges())
+
+		return gauges
+	# ### def get_gauges
+
+	def get_coalesce_stats(self):
+		""" 取得事件合併計數
+
+		參數:
+			(無)
+		回傳值:
+			含有各項計數的字典，未啟用事件合併時傳回 None
+		"""
+		if self.event_coalescer is None:
+			return None
+		return self.event_coalescer.get_stats()
+	# ### def get_coalesce_stats
 # ### class WatcherEngine
 
 
@@ -0,0 +1,225 @@
+
+# -*- coding: utf-8 -*-
+
+""" 執行緒工作池 """
+
+import sys
+import syslog
+import threading
+import Queue
+
+
+
+class PendingCall(object):
+	""" 已送入工作池的呼叫，可用來等待執行結果 """
+
+	def __init__(self, call_object, call_args, callback=None):
+		""" 建構子
+
+		參數:
+			call_object - 要呼叫的函式
+			call_args - 呼叫參數 tuple
+			callback - 呼叫完成後 (在 worker 執行緒中) 呼叫的函式，函數原型: (pending_call)
+		"""
+		super(PendingCall, self).__init__()
+
+		self.call_object = call_object
+		self.call_args = call_args
+		self.callback = callback
+
+		self.result = None
+		self.exc_info = None
+		self._done = threading.Event()
+	# ### def __init__
+
+	def run(self):
+		""" 執行呼叫並記錄結果或例外 (由 worker 呼叫) """
+		try:
+			self.result = self.call_object(*self.call_args)
+		except Exception:
+			self.exc_info = sys.exc_info()
+		self._done.set()
+		if self.callback is not None:
+			try:
+				self.callback(self)
+			except Exception as e:
+				syslog.syslog(syslog.LOG_WARNING, "Having Exception on pending call callback: [%s]." % (e,))
+	# ### def run
+
+	def is_done(self):
+		return self._done.is_set()
+	# ### def is_done
+
+	def wait(self, timeout=None):
+		""" 等待呼叫完成
+
+		參數:
+			timeout=None - 最長等待時間 (秒)，None 表示一直等待
+		回傳值:
+			呼叫的回傳值
+		"""
+		if timeout is None:
+			while not self._done.is_set():
+				self._done.wait(3600)	# 不指定 timeout 的 Event.wait() 無法被訊號中斷
+		else:
+			self._done.wait(timeout)
+		if self.exc_info is not None:
+			raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+		return self.result
+	# ### def wait
+# ### class PendingCall
+
+
+def _pool_worker(pool_name, worker_id, q):
+	running = True
+	while running:
+		pcall = q.get(True)
+		try:
+			if pcall is not None:
+				pcall.run()
+			else:
+				running = False
+		finally:
+			q.task_done()
+# ### def _pool_worker
+
+
+class WorkerPool(object):
+	""" 固定數量執行緒的工作池 """
+
+	def __init__(self, pool_name, worker_count, queue_size=0):
+		""" 建構子
+
+		參數:
+			pool_name - 工作池名稱 (記錄用)
+			worker_count - worker 執行緒數量
+			queue_size=0 - 等待中呼叫的數量上限，0 表示不限制
+		"""
+		super(WorkerPool, self).__init__()
+
+		self.pool_name = pool_name
+		self.worker_count = max(int(worker_count), 1)
+
+		self.call_queue = Queue.Queue(queue_size)
+		self.workers = None
+	# ### def __init__
+
+	def start(self):
+		""" 啟動 worker 執行緒
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		workers_q = []
+		for idx in range(self.worker_count):
+			wk = threading.Thread(target=_pool_worker, args=(self.pool_name, idx, self.call_queue,))
+			wk.daemon = True
+			wk.start()
+			workers_q.append(wk)
+		self.workers = workers_q
+		syslog.syslog(syslog.LOG_INFO, "started worker pool %r (size=%d)" % (self.pool_name, self.worker_count,))
+	# ### def start
+
+	def submit(self, call_object, call_args=(), callback=None):
+		""" 送入要在 worker 執行緒中執行的呼叫
+
+		參數:
+			call_object - 要呼叫的函式
+			call_args=() - 呼叫參數 tuple
+			callback=None - 呼叫完成後 (在 worker 執行緒中) 呼叫的函式，函數原型: (pending_call)
+		回傳值:
+			PendingCall 物件
+		"""
+		pcall = PendingCall(call_object, call_args, callback)
+		self.call_queue.put(pcall, True)
+		return pcall
+	# ### def submit
+
+	def get_queue_depth(self):
+		""" 取得等待執行的呼叫數量 """
+		return self.call_queue.qsize()
+	# ### def get_queue_depth
+
+	def in_worker_thread(self):
+		""" 目前執行緒是否為本工作池的 worker 執行緒 """
+		workers = self.workers
+		return (workers is not None) and (threading.current_thread() in workers)
+	# ### def in_worker_thread
+
+	def stop(self):
+		""" 執行完已送入的呼叫後停下 worker 執行緒
+
+		參數: (無)
+		回傳值: (無)
+		"""
+		if self.workers is None:
+			return
+		for _wk in self.workers:
+			self.call_queue.put(None, True)
+		for wk in self.workers:
+			wk.join()
+		self.workers = None
+		syslog.syslog(syslog.LOG_INFO, "stopped worker pool %r" % (self.pool_name,))
+	# ### def stop
+# ### class WorkerPool
+
+
+class BudgetedWorkerPool(WorkerPool):
+	""" 限制已送入 (等待中與執行中) 呼叫總成本的工作池，成本通常是要讀取的資料量 (bytes)
+	總成本超過上限時 submit() 會等待，直到有呼叫執行完畢；沒有其他呼叫時則一律接受。
+	由本工作池 worker (例如完成回呼) 送入的呼叫不等待，否則 worker 會等待排在自己之後的呼叫而無法結束
+	"""
+
+	def __init__(self, pool_name, worker_count, cost_budget):
+		""" 建構子
+
+		參數:
+			pool_name - 工作池名稱 (記錄用)
+			worker_count - worker 執行緒數量
+			cost_budget - 已送入呼叫的總成本上限
+		"""
+		super(BudgetedWorkerPool, self).__init__(pool_name, worker_count)
+
+		self.cost_budget = max(int(cost_budget), 1)
+		self.inflight_cost = 0
+		self._budget_cond = threading.Condition()
+	# ### def __init__
+
+	def _run_with_cost(self, cost, call_object, call_args):
+		try:
+			return call_object(*call_args)
+		finally:
+			with self._budget_cond:	# 在完成回呼之前歸還成本
+				self.inflight_cost = self.inflight_cost - cost
+				self._budget_cond.notify_all()
+	# ### def _run_with_cost
+
+	def submit(self, call_object, call_args=(), callback=None, cost=0):
+		""" 送入要在 worker 執行緒中執行的呼叫，總成本超過上限時等待 (在本工作池 worker 中呼叫時不等待)
+
+		參數:
+			call_object - 要呼叫的函式
+			call_args=() - 呼叫參數 tuple
+			callback=None - 呼叫完成後 (在 worker 執行緒中) 呼叫的函式，函數原型: (pending_call)
+			cost=0 - 呼叫的成本
+		回傳值:
+			PendingCall 物件
+		"""
+		cost = max(int(cost), 0)
+		wait_budget = not self.in_worker_thread()
+		with self._budget_cond:
+			while wait_budget and (self.inflight_cost > 0) and ((self.inflight_cost + cost) > self.cost_budget):
+				self._budget_cond.wait(3600)
+			self.inflight_cost = self.inflight_cost + cost
+		return super(BudgetedWorkerPool, self).submit(self._run_with_cost, (cost, call_object, call_args,), callback)
+	# ### def submit
+
+	def get_inflight_cost(self):
+		""" 取得已送入呼叫的總成本 """
+		return self.inflight_cost
+	# ### def get_inflight_cost
+# ### class BudgetedWorkerPool
+
+
+
+# vim: ts=4 sw=4 ai nowrap
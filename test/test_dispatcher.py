@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+""" 事件合併 (dispatcher.EventCoalescer) 測試 """
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from filewatcher import dispatcher
+from filewatcher import watcher
+
+
+
+class _EventCollector(object):
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.events = []
+	# ### def __init__
+
+	def __call__(self, filename, folderpath, event_type):
+		with self.lock:
+			self.events.append((filename, folderpath, event_type,))
+	# ### def __call__
+# ### class _EventCollector
+
+
+class TestEventCoalescer(unittest.TestCase):
+	def setUp(self):
+		self.collector = _EventCollector()
+		self.coalescer = dispatcher.EventCoalescer(self.collector, 0.2)
+		self.coalescer.start()
+	# ### def setUp
+
+	def tearDown(self):
+		self.coalescer.stop()
+	# ### def tearDown
+
+	def test_new_then_deleted_in_window(self):
+		self.coalescer.push('a.txt', 'd', watcher.FEVENT_NEW)
+		self.coalescer.push('a.txt', 'd', watcher.FEVENT_MODIFIED)
+		self.coalescer.push('a.txt', 'd', watcher.FEVENT_DELETED)
+		time.sleep(0.5)
+		self.assertEqual(self.collector.events, [])
+		st = self.coalescer.get_stats()
+		self.assertEqual(st['pending'], 0)
+		self.assertEqual(st['received'], 3)
+		self.assertEqual(st['released'], 0)
+		self.assertEqual(st['coalesced'], 3)
+		self.assertEqual(st['cancelled'], 1)
+	# ### def test_new_then_deleted_in_window
+
+	def test_modified_then_deleted_in_window(self):
+		self.coalescer.push('b.txt', 'd', watcher.FEVENT_MODIFIED)
+		self.coalescer.push('b.txt', 'd', watcher.FEVENT_DELETED)
+		time.sleep(0.5)
+		self.assertEqual(self.collector.events, [])
+		self.assertEqual(self.coalescer.get_stats()['cancelled'], 1)
+	# ### def test_modified_then_deleted_in_window
+
+	def test_recreated_after_cancel(self):
+		self.coalescer.push('c.txt', 'd', watcher.FEVENT_NEW)
+		self.coalescer.push('c.txt', 'd', watcher.FEVENT_DELETED)
+		self.coalescer.push('c.txt', 'd', watcher.FEVENT_MODIFIED)
+		time.sleep(0.5)
+		self.assertEqual(self.collector.events, [('c.txt', 'd', watcher.FEVENT_MODIFIED,)])
+	# ### def test_recreated_after_cancel
+
+	def test_deleted_alone_is_released(self):
+		self.coalescer.push('e.txt', 'd', watcher.FEVENT_DELETED)
+		self.coalescer.push('e.txt', 'd', watcher.FEVENT_DELETED)
+		time.sleep(0.5)
+		self.assertEqual(self.collector.events, [('e.txt', 'd', watcher.FEVENT_DELETED,)])
+		st = self.coalescer.get_stats()
+		self.assertEqual(st['received'], st['released'] + st['coalesced'])
+	# ### def test_deleted_alone_is_released
+# ### class TestEventCoalescer
+
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+
+
+# vim: ts=4 sw=4 ai nowrap
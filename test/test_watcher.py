@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+""" 監看引擎 (watcher.WatcherEngine) 測試 """
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+from filewatcher import watcher
+from filewatcher.operator import copier
+
+
+
+_CONFIG_TEMPLATE = """target_directory: %(target)s
+recursive_watch: yes
+meta:
+  db_path: %(folder)s/meta.sqlite
+engine:
+  signature_workers: 1
+watching_entries:
+  - file_regex: '^abc.*\\.txt$'
+    duplicate_check: Yes
+    process_as_uniqname: False
+    operation:
+      - copy_to: %(output)s
+"""
+
+
+class TestSignatureReplayOnDeactivate(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.target = os.path.join(self.folder, 'in')
+		self.output = os.path.join(self.folder, 'out')
+		os.mkdir(self.target)
+		os.mkdir(self.output)
+		config_path = os.path.join(self.folder, 'config.yaml')
+		with open(config_path, 'w') as fp:
+			fp.write(_CONFIG_TEMPLATE % {'target': self.target, 'folder': self.folder, 'output': self.output, })
+		self.engine = watcher.get_watcherengine(config_path, [copier, ])
+	# ### def setUp
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+	# ### def tearDown
+
+	def test_deactivate_with_held_event(self):
+		engine = self.engine
+		self.assertTrue(engine.signature_pool is not None)
+
+		check_started = threading.Event()
+		release_check = threading.Event()
+		checked_paths = []
+		check_file_duplication = engine._check_file_duplication
+		def _slow_check_file_duplication(check_label, target_path, life_retain, entry_label):
+			checked_paths.append(target_path)
+			check_started.set()
+			release_check.wait(10)
+			return check_file_duplication(check_label, target_path, life_retain, entry_label)
+		engine._check_file_duplication = _slow_check_file_duplication
+
+		engine.activate()
+		with open(os.path.join(self.target, 'abc1.txt'), 'w') as fp:
+			fp.write('first')
+		engine.discover_file_change('abc1.txt', '', watcher.FEVENT_NEW)
+		self.assertTrue(check_started.wait(10))
+		with open(os.path.join(self.target, 'abc1.txt'), 'w') as fp:
+			fp.write('second')
+		engine.discover_file_change('abc1.txt', '', watcher.FEVENT_MODIFIED)	# 暫存，等前一個檢查完成
+		self.assertEqual(engine._signing_paths[('', 'abc1.txt',)], [watcher.FEVENT_MODIFIED, ])
+
+		threading.Timer(0.2, release_check.set).start()
+		engine.deactivate()
+
+		self.assertEqual(len(checked_paths), 2)	# 暫存的事件在停止前被處理
+		self.assertEqual(engine._signing_paths, {})
+		with open(os.path.join(self.output, 'abc1.txt'), 'r') as fp:
+			self.assertEqual(fp.read(), 'second')
+	# ### def test_deactivate_with_held_event
+# ### class TestSignatureReplayOnDeactivate
+
+
+
+if __name__ == '__main__':
+	unittest.main()
+
+
+
+# vim: ts=4 sw=4 ai nowrap